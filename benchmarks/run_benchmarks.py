@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# Offline benchmark suite: per-stage micro-benchmarks plus end-to-end run_slam,
+# on the deterministic synthetic sequence (or a KITTI drive if given).
+#
+#   PYTHONPATH=. python benchmarks/run_benchmarks.py --frames 150 --json bench.json
+#
+# Results are keyed by the current git commit so runs can be compared.
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from data_module.synthetic_data  import SyntheticFrameData
+from data_module.config          import Config
+from include.feature_extractor   import FeatureExtractor
+from include.matcher             import FlannMatcher, Matcher, HammingMatcher
+from include.frame_features      import matched_points
+from include.essential_matrix    import EssentialMatrixEstimator
+from include.pose_estimator      import PoseEstimator
+from include.bundle_adjuster     import BundleAdjuster, se3_exp
+from include.pose_graph_optimizer import PoseGraphOptimizer, se3_exp_batch
+from include.vocabulary          import Vocabulary
+from include.loop_closer         import LoopCloser
+from utils.video_visualizer      import VideoVisualizer
+from utils.evaluate_accuracy     import ate
+
+
+def _stats(samples):
+    ms = np.asarray(samples) * 1e3
+    return {
+        'ms_mean': float(ms.mean()),
+        'ms_p50': float(np.percentile(ms, 50)),
+        'ms_p95': float(np.percentile(ms, 95)),
+        'fps': float(1e3 / ms.mean()) if ms.mean() > 0 else float('inf'),
+        'n': int(len(ms)),
+    }
+
+
+def _time(fn, args_list):
+    out, samples = [], []
+    for args in args_list:
+        t0 = time.perf_counter()
+        out.append(fn(*args))
+        samples.append(time.perf_counter() - t0)
+    return out, _stats(samples)
+
+
+def micro_benchmarks(data):
+    config = Config(data.K)
+    frames = [data.get_frame(i) for i in range(len(data))]
+    extractor = FeatureExtractor(nfeatures=1500)
+    res = {}
+
+    raw, res['extract'] = _time(extractor.extract, [(f,) for f in frames])
+    feats, res['extract_features'] = _time(extractor.extract_features, [(f,) for f in frames])
+    tiled = FeatureExtractor(nfeatures=1500, tiles=(2, 4))
+    _, res['extract_tiled_2x4'] = _time(tiled.extract_features, [(f,) for f in frames])
+    pairs = [(feats[i], feats[i + 1]) for i in range(len(feats) - 1)]
+    des_pairs = [(a.des, b.des) for a, b in pairs]
+
+    _, res['match_flann'] = _time(FlannMatcher().match, des_pairs)
+    _, res['match_bf'] = _time(Matcher().match, des_pairs)
+    matches, res['match_hamming'] = _time(HammingMatcher().match, des_pairs)
+
+    pts = [matched_points(a, b, m) for (a, b), m in zip(pairs, matches) if len(m) >= 8]
+    ess = EssentialMatrixEstimator(config.focal, config.pp)
+    Es, res['essential_ransac'] = _time(ess.compute, pts)
+    prosac = EssentialMatrixEstimator(config.focal, config.pp, method='prosac')
+    _, res['essential_prosac'] = _time(prosac.compute, pts)
+
+    pose = PoseEstimator(config.focal, config.pp)
+    ok = [(E, p1, p2) for (E, _), (p1, p2) in zip(Es, pts) if E is not None and E.shape == (3, 3)]
+    _, res['pose_recover'] = _time(pose.recover, ok)
+
+    vis = VideoVisualizer(headless=True)
+    traj = [np.zeros(3)]
+    samples = []
+    for i, f in enumerate(frames):
+        traj.append(np.array([np.sin(i / 20.0), 0.0, float(i)]))
+        t0 = time.perf_counter()
+        vis.update(f, traj)
+        samples.append(time.perf_counter() - t0)
+    vis.close()
+    res['vis_update'] = _stats(samples)
+    return res
+
+
+def ba_problem(window, n_points=150, seed=0):
+    # keyframes 1 m apart looking down +z, each landmark seen by up to 4 consecutive keyframes
+    rng = np.random.default_rng(seed)
+    K = np.array([[700.0, 0, 620], [0, 700.0, 188], [0, 0, 1]])
+    T_gt = np.array([np.linalg.inv(se3_exp(np.r_[0, 0.01 * c, 0, 0, 0, float(c)]))
+                     for c in range(window)])
+    pts = rng.uniform([-15, -3, 8], [15, 3, 40], size=(n_points * window, 3))
+    pts[:, 2] += np.repeat(np.arange(window), n_points)
+    cam, pt = [], []
+    for c in range(window):
+        for k in range(max(0, c - 3), c + 1):
+            ids = np.arange(k * n_points, (k + 1) * n_points)
+            cam.append(np.full(n_points, c)); pt.append(ids)
+    cam, pt = np.concatenate(cam), np.concatenate(pt)
+    ba = BundleAdjuster()
+    uv, _, _, _ = ba._project(K, T_gt, pts, cam, pt)
+    uv += rng.normal(0, 0.5, uv.shape)
+    T0 = np.array([se3_exp(np.r_[rng.normal(0, 0.003, 3), rng.normal(0, 0.05, 3)]) @ T
+                   if c else T for c, T in enumerate(T_gt)])
+    return K, T0, pts + rng.normal(0, 0.1, pts.shape), cam, pt, uv
+
+
+def ba_scaling(windows=(3, 5, 10, 20)):
+    res = {}
+    for w in windows:
+        K, T0, X0, cam, pt, uv = ba_problem(w)
+        ba = BundleAdjuster(max_iters=5)
+        t0 = time.perf_counter()
+        ba.solve(K, T0, X0, cam, pt, uv)
+        wall = time.perf_counter() - t0
+        iters = [h['ms'] for h in ba.history]
+        res[f'window_{w}'] = {'observations': int(len(uv)), 'iterations': len(iters),
+                              'ms_total': 1e3 * wall, 'ms_per_iter': float(np.mean(iters)),
+                              'cost0': float(ba._cost(K, T0, X0, cam, pt, uv)),
+                              'cost': float(ba.history[-1]['cost'])}
+    return res
+
+
+def pose_graph_scaling(sizes=(1000, 5000, 20000), seed=0):
+    # one closed circle of noisy odometry; every node is added incrementally, then
+    # the loop edge triggers a full relinearization
+    res = {}
+    for n in sizes:
+        rng = np.random.default_rng(seed)
+        steps = np.zeros((n, 6))
+        steps[:, 1], steps[:, 5] = 2 * np.pi / n, 1.0
+        odom = se3_exp_batch(steps + rng.normal(0, [0.001] * 3 + [0.02] * 3, (n, 6)))
+        pg = PoseGraphOptimizer()
+        pg.add_node(0, np.eye(4))
+        t0 = time.perf_counter()
+        for k in range(1, n):
+            pg.add_odometry(k - 1, k, odom[k - 1])
+            pg.optimize(incremental=True)
+        t_odom = time.perf_counter() - t0
+        pg.add_odometry(n - 1, 0, odom[n - 1])
+        cost0 = float(pg._cost(pg.errors(), pg._info.view))
+        t0 = time.perf_counter()
+        cost = pg.optimize(max_iter=10, incremental=True)
+        res[f'nodes_{n}'] = {'ms_per_odometry_update': 1e3 * t_odom / (n - 1),
+                             'ms_loop_closure': 1e3 * (time.perf_counter() - t0),
+                             'iterations': len(pg.history),
+                             'ms_per_iter': float(np.mean([h['ms'] for h in pg.history])),
+                             'cost0': cost0, 'cost': float(cost)}
+    return res
+
+
+def loop_closure_scaling(data, db_sizes=(500, 1000, 3000), seed=0):
+    # vocabulary from every 4th frame; the database holds random 60% subsets of
+    # the frames' descriptors, so keyframes are distinct but share many words
+    rng = np.random.default_rng(seed)
+    extractor = FeatureExtractor(nfeatures=1000)
+    des = [extractor.extract_features(data.get_frame(i)).des for i in range(len(data))]
+    t0 = time.perf_counter()
+    vocab = Vocabulary(k=10, levels=4).train(des[::4], seed=seed)
+    train_s = time.perf_counter() - t0
+    res = {}
+    bows, res['transform'] = _time(vocab.transform, [(d,) for d in des])
+    res['transform']['train_s'] = train_s
+    for n in db_sizes:
+        lc = LoopCloser(vocab)
+        for k in range(n):
+            d = des[k % len(des)]
+            lc.insert_keyframe(k, d[rng.random(len(d)) < 0.6])
+        _, res[f'query_db_{n}'] = _time(lambda b: lc.query(None, bow=b), [(b,) for b in bows])
+    return res
+
+
+E2E_CONFIGS = {
+    'default':   {},
+    'hamming':   {'matcher_type': 'hamming'},
+    'prosac':    {'matcher_type': 'hamming', 'ransac': 'prosac'},
+    'pipelined': {'matcher_type': 'hamming', 'ransac': 'prosac', 'pipelined': True},
+    'klt':       {'frontend': 'klt', 'ransac': 'prosac'},
+    'imu':       {'matcher_type': 'hamming', 'ransac': 'prosac', 'imu': True},
+    'keyframes': {'matcher_type': 'hamming', 'ransac': 'prosac', 'keyframes': True},
+    'tiled':     {'matcher_type': 'hamming', 'ransac': 'prosac', 'tiles': (2, 4)},
+    'guided':    {'matcher_type': 'hamming', 'ransac': 'prosac', 'guided': True},
+    'realtime':  {'matcher_type': 'hamming', 'ransac': 'prosac', 'realtime': True,
+                  'frame_budget_ms': 40.0},
+}
+
+
+def end_to_end(make_data, configs, gt=True):
+    from src.main import run_slam
+    res = {}
+    for name, kw in configs.items():
+        kw = dict({'kf_dist': 0.5}, **kw, headless=True, vis_out='')
+        with tempfile.TemporaryDirectory() as tmp:
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                data = make_data()
+                n = len(data)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    t0 = time.perf_counter()
+                    poses, frames = run_slam(None, 'synthetic', 'synthetic', data=data, **kw)
+                    wall = time.perf_counter() - t0
+
+                # separate pass for memory so tracing does not skew the timing
+                data2 = make_data()
+                tracemalloc.start()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    run_slam(None, 'synthetic', 'synthetic', data=data2, **kw)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            finally:
+                os.chdir(cwd)
+        r = {
+            'ms_per_frame': 1e3 * wall / n,
+            'fps': n / wall,
+            'peak_traced_mb': peak / 2**20,
+            'poses': int(len(poses)),
+        }
+        if gt and hasattr(data, 'poses') and len(frames) > 2:
+            r['ate'] = float(ate(data.poses[frames], poses, with_scale=True))
+        res[name] = r
+    return res
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_table(title, rows, cols):
+    print(f"\n{title}")
+    print(f"{'':<20}" + "".join(f"{c:>16}" for c in cols))
+    for name, r in rows.items():
+        print(f"{name:<20}" + "".join(
+            f"{r[c]:>16.3f}" if isinstance(r.get(c), float) else f"{str(r.get(c, '-')):>16}"
+            for c in cols))
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument('--frames', type=int, default=150, help='synthetic sequence length')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--base_path', default=None, help='use a KITTI drive instead of synthetic data')
+    p.add_argument('--date', default='2011_09_26')
+    p.add_argument('--drive', default='2011_09_26_drive_0002_sync')
+    p.add_argument('--configs', nargs='+', default=list(E2E_CONFIGS), choices=list(E2E_CONFIGS))
+    p.add_argument('--skip_micro', action='store_true')
+    p.add_argument('--skip_e2e', action='store_true')
+    p.add_argument('--skip_ba', action='store_true')
+    p.add_argument('--skip_pgo', action='store_true')
+    p.add_argument('--skip_loop', action='store_true')
+    p.add_argument('--json', default=None, help='write results to this file')
+    a = p.parse_args()
+
+    if a.base_path:
+        from data_module.frame_data import FrameData
+        make_data = lambda: FrameData(a.base_path, a.date, a.drive)
+    else:
+        make_data = lambda: SyntheticFrameData(n_frames=a.frames, seed=a.seed)
+
+    results = {'commit': _git_rev(), 'frames': a.frames, 'seed': a.seed,
+               'source': a.drive if a.base_path else 'synthetic'}
+    if not a.skip_micro:
+        results['micro'] = micro_benchmarks(make_data())
+        print_table('Per-stage micro-benchmarks', results['micro'],
+                    ('ms_mean', 'ms_p50', 'ms_p95', 'fps'))
+    if not a.skip_ba:
+        results['ba'] = ba_scaling()
+        print_table('Windowed bundle adjustment', results['ba'],
+                    ('observations', 'ms_per_iter', 'ms_total', 'cost0', 'cost'))
+    if not a.skip_pgo:
+        results['pose_graph'] = pose_graph_scaling()
+        print_table('Pose-graph optimization', results['pose_graph'],
+                    ('ms_per_odometry_update', 'ms_loop_closure', 'ms_per_iter', 'cost0', 'cost'))
+    if not a.skip_loop:
+        results['loop_closure'] = loop_closure_scaling(make_data(), seed=a.seed)
+        print_table('Loop closure (BoW)', results['loop_closure'],
+                    ('ms_mean', 'ms_p50', 'ms_p95', 'n'))
+    if not a.skip_e2e:
+        results['e2e'] = end_to_end(make_data, {k: E2E_CONFIGS[k] for k in a.configs},
+                                    gt=not a.base_path)
+        print_table('End-to-end run_slam', results['e2e'],
+                    ('ms_per_frame', 'fps', 'peak_traced_mb', 'ate'))
+    results['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print(f"\ncommit {results['commit']}, max RSS {results['max_rss_mb']:.1f} MB")
+
+    if a.json:
+        with open(a.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
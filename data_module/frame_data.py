@@ -1,22 +1,114 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
-from pykitti import raw
+
+from data_module.kitti_index import DriveIndex
 
 class FrameData:
 
-    def __init__(self, base_path: str, date: str, drive: str, frames=None):
-        
-        
-        self.dataset = raw(base_path, date, drive, frames=frames)
-        self.cam0_files = self.dataset.cam0_files  
-        P = self.dataset.calib.P_rect_00  
-        self.K = P[:3, :3]  
+    def __init__(self, base_path: str, date: str, drive: str, frames=None,
+                 prefetch=0, lru_size=0, cache_dir=None, index_cache='.kitti_index'):
+        # drives may be given as pykitti's number ('0001') or as the directory
+        # name ('2011_09_26_drive_0001_sync', as evaluate_accuracy / OXTS use it)
+        self.index = DriveIndex(base_path, date, drive, cache_dir=index_cache)
+        self.base_path, self.date, self.frames = base_path, date, frames
+        self.drive = self.index.drive
+        self._imu = None
+        self.cam0_files = self.index.cam0_files(frames)
+        P = self.index.P_rect_00
+        self.K = P[:3, :3]
+
+        # decoded-frame caches: in-memory LRU and/or per-frame .npy files on disk
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self.cache_dir = os.path.join(cache_dir, date, self.drive, 'cam0') if cache_dir else None
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        # prefetching: decode the next `prefetch` frames on a small thread pool
+        self.prefetch = prefetch
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=min(4, prefetch)) if prefetch > 0 else None
 
     def __len__(self) -> int:
         return len(self.cam0_files)
 
     def get_frame(self, idx: int) -> np.ndarray:
+        img = self._lru_get(idx)
+        if img is None:
+            with self._lock:
+                fut = self._pending.pop(idx, None)
+            img = fut.result() if fut is not None else self._load(idx)
+            self._lru_put(idx, img)
+        if self._pool is not None:
+            self._schedule(idx)
+        return img
+
+    @property
+    def imu(self):
+        # OXTS packets are only parsed when inertial fusion asks for them
+        if self._imu is None:
+            from data_module.oxts import OxtsIMU
+            self._imu = OxtsIMU(self.base_path, self.date, self.drive, self.frames)
+        return self._imu
+
+    def close(self):
+        if self._pool is not None:
+            with self._lock:
+                for fut in self._pending.values():
+                    fut.cancel()
+                self._pending.clear()
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _schedule(self, idx):
+        # keep at most `prefetch` frames in flight, all strictly ahead of idx
+        with self._lock:
+            for i in [i for i in self._pending if i <= idx]:
+                self._pending.pop(i).cancel()
+            for i in range(idx + 1, min(idx + 1 + self.prefetch, len(self))):
+                if i not in self._pending and i not in self._lru:
+                    self._pending[i] = self._pool.submit(self._load, i)
+
+    def _load(self, idx):
+        path = self._cache_path(idx)
+        if path is not None and os.path.exists(path):
+            return np.load(path, mmap_mode='r')
         img = cv2.imread(self.cam0_files[idx], cv2.IMREAD_GRAYSCALE)
         if img is None:
             raise IOError(f"Could not read frame at {self.cam0_files[idx]}")
+        if path is not None:
+            # write-then-rename so a concurrent reader never sees a partial file
+            tmp = f"{path}.{threading.get_ident()}.tmp.npy"
+            np.save(tmp, img)
+            os.replace(tmp, path)
         return img
+
+    def _cache_path(self, idx):
+        if self.cache_dir is None:
+            return None
+        stem = os.path.splitext(os.path.basename(self.cam0_files[idx]))[0]
+        return os.path.join(self.cache_dir, stem + '.npy')
+
+    def _lru_get(self, idx):
+        if self.lru_size <= 0:
+            return None
+        with self._lock:
+            img = self._lru.get(idx)
+            if img is not None:
+                self._lru.move_to_end(idx)
+            return img
+
+    def _lru_put(self, idx, img):
+        if self.lru_size <= 0:
+            return
+        with self._lock:
+            self._lru[idx] = img
+            self._lru.move_to_end(idx)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
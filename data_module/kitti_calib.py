@@ -0,0 +1,37 @@
+import os
+import numpy as np
+
+# Minimal KITTI raw calibration parsing (no pykitti needed).
+
+def read_calib_file(path):
+    data = {}
+    with open(path) as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            try:
+                data[key.strip()] = np.array([float(x) for x in value.split()])
+            except ValueError:
+                pass  # non-numeric entries such as calib_time
+    return data
+
+
+def _rigid(R, T):
+    M = np.eye(4)
+    M[:3, :3] = R.reshape(3, 3)
+    M[:3, 3] = T
+    return M
+
+
+def load_P_rect_00(base_path, date):
+    c = read_calib_file(os.path.join(base_path, date, 'calib_cam_to_cam.txt'))
+    return c['P_rect_00'].reshape(3, 4)
+
+
+def load_T_cam0_imu(base_path, date):
+    # rectified cam0 <- velodyne <- imu, as composed by pykitti
+    c2c = read_calib_file(os.path.join(base_path, date, 'calib_cam_to_cam.txt'))
+    v2c = read_calib_file(os.path.join(base_path, date, 'calib_velo_to_cam.txt'))
+    i2v = read_calib_file(os.path.join(base_path, date, 'calib_imu_to_velo.txt'))
+    R_rect = np.eye(4)
+    R_rect[:3, :3] = c2c['R_rect_00'].reshape(3, 3)
+    return R_rect @ _rigid(v2c['R'], v2c['T']) @ _rigid(i2v['R'], i2v['T'])
@@ -0,0 +1,67 @@
+import json
+import os
+
+import numpy as np
+
+from data_module.kitti_calib import load_P_rect_00
+
+# Lightweight stand-in for pykitti.raw as far as FrameData needs it: the sorted
+# cam0 image list and P_rect_00. The result is cached as a small JSON manifest
+# per drive, keyed by the mtimes of the image directory and the calibration
+# file, so a repeated start costs two stat() calls instead of a directory
+# listing, a calibration parse and the pykitti/pandas import.
+
+
+def drive_name(date, drive):
+    # pykitti's number ('0001') or the directory name -> directory name
+    prefix = date + '_drive_'
+    return drive if drive.startswith(prefix) else f"{prefix}{drive}_sync"
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(path, manifest):
+    # the cache is optional: a read-only location just means no caching
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+class DriveIndex:
+    def __init__(self, base_path, date, drive, cache_dir='.kitti_index'):
+        self.date = date
+        self.drive = drive_name(date, drive)
+        self.image_dir = os.path.join(base_path, date, self.drive, 'image_00', 'data')
+        calib = os.path.join(base_path, date, 'calib_cam_to_cam.txt')
+        key = [os.stat(self.image_dir).st_mtime_ns, os.stat(calib).st_mtime_ns]
+        path = os.path.join(cache_dir, date, self.drive + '.json') if cache_dir else None
+
+        m = _read_manifest(path) if path else None
+        self.cached = m is not None and m.get('key') == key
+        if not self.cached:
+            m = {'key': key,
+                 'files': sorted(f for f in os.listdir(self.image_dir) if f.endswith('.png')),
+                 'P_rect_00': load_P_rect_00(base_path, date).tolist()}
+            if path:
+                _write_manifest(path, m)
+        self.files = m['files']
+        self.P_rect_00 = np.array(m['P_rect_00'])
+
+    def __len__(self):
+        return len(self.files)
+
+    def cam0_files(self, frames=None):
+        # frames: optional subset of frame indices, as pykitti.raw(frames=...)
+        names = self.files if frames is None else [self.files[i] for i in frames]
+        return [os.path.join(self.image_dir, f) for f in names]
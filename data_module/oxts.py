@@ -0,0 +1,90 @@
+import glob
+import os
+
+import numpy as np
+
+from data_module.kitti_calib import load_T_cam0_imu
+
+# OXTS inertial data of a KITTI raw drive, expressed in the rectified cam0 frame
+# so it can be fused directly with the visual odometry. Packets are parsed once;
+# imu_between() returns the samples of one camera interval as array slices.
+
+ACCEL, GYRO, VEL = slice(11, 14), slice(17, 20), slice(8, 11)   # ax..az, wx..wz, vf vl vu
+GRAVITY = 9.81
+
+
+def packet_files(root):
+    return sorted(glob.glob(os.path.join(root, 'oxts', 'data', '*.txt')))
+
+
+def read_packets(files):
+    # (N, 30) packets; every file is one line, so the drive is parsed in one go
+    chunks = []
+    for fn in files:
+        with open(fn) as f:
+            chunks.append(f.read())
+    return np.array(' '.join(chunks).split(), dtype=np.float64).reshape(len(files), -1)
+
+
+def read_timestamps(path):
+    with open(path) as f:
+        stamps = np.array([line.strip().replace(' ', 'T') for line in f if line.strip()],
+                          dtype='datetime64[ns]')
+    return (stamps - stamps[0]).astype(np.int64) * 1e-9, stamps[0]
+
+
+class OxtsIMU:
+
+    def __init__(self, base_path, date, drive, frames=None):
+        root = os.path.join(base_path, date, drive)
+        files = packet_files(root)
+        if not files:
+            raise IOError(f"no OXTS data in {root}")
+        self.packets = read_packets(files)
+        t, t0 = read_timestamps(os.path.join(root, 'oxts', 'timestamps.txt'))
+        ft, f0 = read_timestamps(os.path.join(root, 'image_00', 'timestamps.txt'))
+        self.t = t
+        self.frame_t = ft + (f0 - t0).astype(np.int64) * 1e-9
+        if frames is not None:
+            self.frame_t = self.frame_t[np.asarray(frames)]
+
+        # IMU body (x forward, y left, z up) -> rectified cam0
+        R_ci = load_T_cam0_imu(base_path, date)[:3, :3]
+        self.accel = self.packets[:, ACCEL] @ R_ci.T
+        self.gyro = self.packets[:, GYRO] @ R_ci.T
+
+        # gravity and velocity at the first frame, in the first camera frame (the VO world)
+        k0 = self._sample(self.frame_t[0])
+        roll, pitch, yaw = self.packets[k0, 3:6]
+        R_level_imu = _rot_z(yaw) @ _rot_y(pitch) @ _rot_x(roll)
+        self.gravity = R_ci @ R_level_imu.T @ np.array([0, 0, -GRAVITY])
+        self.initial_velocity = R_ci @ self.packets[k0, VEL]
+
+    def _sample(self, t):
+        return int(np.clip(np.searchsorted(self.t, t, side='right') - 1, 0, len(self.t) - 1))
+
+    def imu_between(self, i, j):
+        # samples covering [frame i, frame j): (dt, accel, gyro), each sample held
+        # constant until the next one
+        t0, t1 = self.frame_t[i], self.frame_t[j]
+        k0, k1 = self._sample(t0), self._sample(t1)
+        k = np.arange(k0, max(k1, k0 + 1))
+        start = np.maximum(self.t[k], t0)
+        stop = np.minimum(np.append(self.t[k[1:]], t1), t1)
+        dt = np.maximum(stop - start, 0.0)
+        return dt, self.accel[k], self.gyro[k]
+
+
+def _rot_x(a):
+    c, s = np.cos(a), np.sin(a)
+    return np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+
+
+def _rot_y(a):
+    c, s = np.cos(a), np.sin(a)
+    return np.array([[c, 0, s], [0, 1, 0], [-s, 0, c]])
+
+
+def _rot_z(a):
+    c, s = np.cos(a), np.sin(a)
+    return np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
@@ -0,0 +1,155 @@
+import cv2
+import numpy as np
+
+# Deterministic synthetic sequence with the same interface as FrameData
+# (len / get_frame / K / close). A camera drives down a textured corridor
+# (ground plane + two walls + far wall) along a known, gently curving path;
+# ground-truth camera-to-world poses are in `poses`. Every frame is rendered
+# from the pose alone, so the sequence is identical across runs and machines.
+
+class SyntheticFrameData:
+
+    def __init__(self, n_frames=200, width=620, height=188, focal=300.0, speed=0.8,
+                 seed=0, texel=0.02, near=2.0, far=60.0, frame_dt=0.1):
+        self.n_frames = n_frames
+        self.speed = speed
+        self.frame_dt = frame_dt
+        self._imu = None
+        self.width, self.height = width, height
+        self.K = np.array([[focal, 0, width / 2.0],
+                           [0, focal, height / 2.0],
+                           [0, 0, 1]])
+        self.texel = texel
+        self.near, self.far = near, far
+        self.cam0_files = [f"synthetic/{i:010d}" for i in range(n_frames)]
+
+        rng = np.random.default_rng(seed)
+        s = np.arange(n_frames, dtype=np.float64)
+        yaw = np.radians(4.0) * np.sin(s / 40.0)
+        self.poses = np.tile(np.eye(4), (n_frames, 1, 1))
+        self.poses[:, 0, 0] = np.cos(yaw)
+        self.poses[:, 0, 2] = np.sin(yaw)
+        self.poses[:, 2, 0] = -np.sin(yaw)
+        self.poses[:, 2, 2] = np.cos(yaw)
+        self.poses[:, 0, 3] = 0.8 * np.sin(s / 40.0)
+        self.poses[:, 2, 3] = speed * s
+
+        length = speed * n_frames + far + near
+        # (origin, column axis along z, row axis, extent of rows in meters)
+        self.planes = [
+            ('ground', np.array([-6.0, 1.6, 0.0]), np.array([1.0, 0, 0]), 12.0),
+            ('left',   np.array([-4.0, -3.0, 0.0]), np.array([0, 1.0, 0]), 4.6),
+            ('right',  np.array([4.0, -3.0, 0.0]), np.array([0, 1.0, 0]), 4.6),
+        ]
+        self.textures = {name: _texture(rng, int(ext / texel), int(length / texel))
+                         for name, _, _, ext in self.planes}
+        self.far_wall = _texture(rng, int(8.0 / texel), int(12.0 / texel))
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def get_frame(self, idx: int) -> np.ndarray:
+        T_wc = self.poses[idx]
+        R_cw = T_wc[:3, :3].T
+        t_cw = -R_cw @ T_wc[:3, 3]
+        img = np.full((self.height, self.width), 90, dtype=np.uint8)
+        cz = T_wc[2, 3]
+
+        # painter's order: far wall, then the planes running along the path
+        far_o = np.array([-6.0, -4.0, cz + self.far])
+        self._paint(img, self.far_wall, far_o, np.array([1.0, 0, 0]),
+                    np.array([0, 1.0, 0]), R_cw, t_cw)
+        z = np.array([0, 0, 1.0])
+        for name, origin, row_axis, _ in self.planes:
+            tex = self.textures[name]
+            u0 = max(0, int((cz + self.near) / self.texel))
+            u1 = min(tex.shape[1], int((cz + self.far) / self.texel))
+            if u1 <= u0:
+                continue
+            # texture columns run along the path, rows across it
+            o = origin + z * (u0 * self.texel)
+            self._paint(img, tex[:, u0:u1], o, z, row_axis, R_cw, t_cw)
+        return img
+
+    @property
+    def imu(self):
+        if self._imu is None:
+            self._imu = SyntheticIMU(self)
+        return self._imu
+
+    def close(self):
+        pass
+
+    def _paint(self, img, tex, origin, col_axis, row_axis, R_cw, t_cw):
+        # plane point = origin + u*texel*col_axis + v*texel*row_axis -> homography
+        s = self.texel
+        A = np.column_stack((R_cw @ (col_axis * s), R_cw @ (row_axis * s), R_cw @ origin + t_cw))
+        H = self.K @ A
+        size = (self.width, self.height)
+        warped = cv2.warpPerspective(tex, H, size, flags=cv2.INTER_LINEAR)
+        mask = cv2.warpPerspective(np.full(tex.shape, 255, np.uint8), H, size,
+                                   flags=cv2.INTER_NEAREST)
+        np.copyto(img, warped, where=mask > 0)
+
+
+class SyntheticIMU:
+    # Accelerometer / gyro samples of the same path, differentiated analytically
+    # (same interface as data_module.oxts.OxtsIMU). World = first camera frame,
+    # y pointing down, so gravity is +y.
+
+    def __init__(self, data, rate=100.0, accel_noise=0.0, gyro_noise=0.0, seed=0):
+        self.data = data
+        self.rate = rate
+        self.accel_noise, self.gyro_noise = accel_noise, gyro_noise
+        self.rng = np.random.default_rng(seed)
+        self.gravity = np.array([0.0, 9.81, 0.0])
+        self.frame_t = np.arange(data.n_frames) * data.frame_dt
+        _, v, _, _ = self._motion(np.zeros(1))
+        self.initial_velocity = v[0]
+
+    def _motion(self, t):
+        # yaw = A sin(s/40), x = 0.8 sin(s/40), z = speed * s with s = t / frame_dt
+        f = 1.0 / self.data.frame_dt
+        s = t * f
+        A = np.radians(4.0)
+        yaw = A * np.sin(s / 40.0)
+        yaw_rate = A * np.cos(s / 40.0) / 40.0 * f
+        vel = np.stack((0.8 * np.cos(s / 40.0) / 40.0 * f, np.zeros_like(s),
+                        np.full_like(s, self.data.speed * f)), axis=1)
+        acc = np.stack((-0.8 * np.sin(s / 40.0) / 1600.0 * f * f, np.zeros_like(s),
+                        np.zeros_like(s)), axis=1)
+        return yaw, vel, acc, yaw_rate
+
+    def imu_between(self, i, j):
+        t0, t1 = self.frame_t[i], self.frame_t[j]
+        n = max(1, int(round((t1 - t0) * self.rate)))
+        t = t0 + np.arange(n) / self.rate
+        dt = np.full(n, (t1 - t0) / n)
+        yaw, _, acc, yaw_rate = self._motion(t + 0.5 * dt)      # midpoint samples
+        c, s = np.cos(yaw), np.sin(yaw)
+        # specific force in the body frame: R_wc^T (a - g), R_wc = Ry(yaw)
+        f = acc - self.gravity
+        accel = np.stack((c * f[:, 0] - s * f[:, 2], f[:, 1], s * f[:, 0] + c * f[:, 2]), axis=1)
+        gyro = np.stack((np.zeros(n), yaw_rate, np.zeros(n)), axis=1)
+        if self.accel_noise:
+            accel = accel + self.rng.normal(0, self.accel_noise, accel.shape)
+        if self.gyro_noise:
+            gyro = gyro + self.rng.normal(0, self.gyro_noise, gyro.shape)
+        return dt, accel, gyro
+
+
+def _texture(rng, rows, cols):
+    # multi-scale noise plus random blobs: plenty of corners at every pyramid level
+    rows, cols = max(rows, 8), max(cols, 8)
+    tex = np.zeros((rows, cols), np.float32)
+    for cell, w in ((64, 0.5), (16, 0.3), (4, 0.2)):
+        small = rng.random((rows // cell + 2, cols // cell + 2)).astype(np.float32)
+        tex += w * cv2.resize(small, (cols, rows), interpolation=cv2.INTER_CUBIC)
+    tex = (np.clip(tex, 0, 1) * 200 + 30).astype(np.uint8)
+    n = rows * cols // 4000
+    centers = rng.integers(0, [cols, rows], size=(n, 2))
+    radii = rng.integers(3, 12, size=n)
+    shades = rng.integers(0, 256, size=n)
+    for (x, y), r, c in zip(centers, radii, shades):
+        cv2.circle(tex, (int(x), int(y)), int(r), int(c), -1)
+    return tex
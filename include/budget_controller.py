@@ -0,0 +1,137 @@
+import time
+
+import numpy as np
+
+# Real-time budget control for run_slam. Frames are taken to arrive on a fixed
+# camera clock (one per period_ms). admit(idx) is asked once per frame before
+# it is decoded: it closes the timing of the previous frame, drops idx if a
+# newer frame has already arrived (so lag never queues up), and otherwise starts
+# timing it. An EMA of the per-frame cost drives a quality ladder with
+# hysteresis: a few frames above `high` * budget step one level down, a longer
+# run below `low` * budget steps back up. When running faster than the
+# camera, the clock is re-based on the current frame, so no sleeps are needed
+# offline.
+
+# (nfeatures, processing scale, max matches, RANSAC iteration cap), best first
+LEVELS = (
+    (1500, 1.00, None, 1000),
+    (1200, 1.00, 800, 500),
+    (1000, 0.85, 600, 300),
+    (800,  0.75, 500, 200),
+    (600,  0.65, 400, 100),
+    (400,  0.50, 300, 50),
+)
+
+KNOBS = ('nfeatures', 'scale', 'max_matches', 'ransac_iters')
+
+
+class BudgetController:
+    def __init__(self, budget_ms, extractor=None, matcher=None, ess_est=None, period_ms=None,
+                 levels=LEVELS, high=0.9, low=0.6, down_after=2, up_after=15, alpha=0.3):
+        self.budget = budget_ms * 1e-3
+        self.period = (budget_ms if period_ms is None else period_ms) * 1e-3
+        self.extractor, self.matcher, self.ess_est = extractor, matcher, ess_est
+        self.levels = levels
+        self.high, self.low = high, low
+        self.down_after, self.up_after = down_after, up_after
+        self.alpha = alpha
+        self.level = 0
+        self.ema = None
+        self._over = self._under = 0
+        self._t0 = self._idx0 = None
+        self._current = None                 # (idx, start time) of the frame in flight
+        self.n_processed = self.n_met = self.n_dropped = 0
+        self.level_frames = np.zeros(len(levels), np.int64)
+        self.level_met = np.zeros(len(levels), np.int64)
+        self.changes = []                    # (frame idx, new level)
+        self._apply()
+
+    @property
+    def knobs(self):
+        return dict(zip(KNOBS, self.levels[self.level]))
+
+    def _arrival(self, idx):
+        return self._t0 + (idx - self._idx0) * self.period
+
+    def admit(self, idx):
+        now = time.perf_counter()
+        self._finish(now)
+        if self._t0 is None or now < self._arrival(idx):
+            # first frame, or ahead of the camera: this frame arrives now
+            self._t0, self._idx0 = now, idx
+        elif now >= self._arrival(idx + 1):
+            # a newer frame is already waiting: skip this one instead of lagging
+            self.n_dropped += 1
+            self._over += 1
+            self._adapt(idx)
+            return False
+        self._current = (idx, now)
+        return True
+
+    def close(self):
+        self._finish(time.perf_counter())
+
+    def _finish(self, now):
+        if self._current is None:
+            return
+        idx, start = self._current
+        self._current = None
+        cost = now - start
+        met = now <= self._arrival(idx) + self.budget
+        self.n_processed += 1
+        self.n_met += met
+        self.level_frames[self.level] += 1
+        self.level_met[self.level] += met
+        self.ema = cost if self.ema is None else self.alpha * cost + (1 - self.alpha) * self.ema
+        if self.ema > self.high * self.budget:
+            self._over, self._under = self._over + 1, 0
+        elif self.ema < self.low * self.budget:
+            self._over, self._under = 0, self._under + 1
+        else:
+            self._over = self._under = 0
+        self._adapt(idx)
+
+    def _adapt(self, idx):
+        if self._over >= self.down_after and self.level < len(self.levels) - 1:
+            self._set_level(idx, self.level + 1)
+        elif self._under >= self.up_after and self.level > 0:
+            self._set_level(idx, self.level - 1)
+
+    def _set_level(self, idx, level):
+        self.level = level
+        self._over = self._under = 0
+        self.ema = None                      # re-measure under the new settings
+        self.changes.append((idx, level))
+        self._apply()
+
+    def _apply(self):
+        nfeatures, scale, max_matches, ransac_iters = self.levels[self.level]
+        if self.extractor is not None:
+            self.extractor.configure(nfeatures=nfeatures, scale=scale)
+        if self.matcher is not None and hasattr(self.matcher, 'max_matches'):
+            self.matcher.max_matches = max_matches
+        if self.ess_est is not None:
+            self.ess_est.max_iters = ransac_iters
+
+    def summary(self):
+        seen = self.n_processed + self.n_dropped
+        levels = [dict(zip(KNOBS, lv), level=i,
+                       frames=int(self.level_frames[i]), met=int(self.level_met[i]))
+                  for i, lv in enumerate(self.levels) if self.level_frames[i]]
+        return {'budget_ms': self.budget * 1e3, 'frames': seen, 'processed': self.n_processed,
+                'dropped': self.n_dropped, 'met': self.n_met,
+                'met_ratio': self.n_met / seen if seen else 0.0,
+                'level_changes': len(self.changes), 'final_level': self.level,
+                'levels': levels}
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"budget {s['budget_ms']:.1f} ms: met {s['met']}/{s['frames']} frames "
+              f"({100 * s['met_ratio']:.1f}%), dropped {s['dropped']}, "
+              f"{s['level_changes']} level changes, final level {s['final_level']}")
+        print(f"{'level':<7}{'nfeatures':>10}{'scale':>7}{'matches':>9}{'ransac':>8}"
+              f"{'frames':>8}{'met':>7}")
+        for r in s['levels']:
+            print(f"{r['level']:<7}{r['nfeatures']:>10}{r['scale']:>7.2f}"
+                  f"{str(r['max_matches'] or '-'):>9}{r['ransac_iters']:>8}"
+                  f"{r['frames']:>8}{r['met']:>7}")
@@ -1,7 +1,164 @@
+import time
+
+import numpy as np
+from scipy import sparse
+
+# Windowed bundle adjustment (Levenberg-Marquardt) over world-to-camera poses
+# (the 4x4 / 3x4 matrices MapManager.triangulate takes) and 3-D landmarks.
+# Each observation only touches one camera block (6) and one point block (3), so
+# the normal equations are built per observation and the point blocks are
+# eliminated with the Schur complement; only the small reduced camera system
+# (6 x window size) is solved densely. Robust Huber weighting on pixel residuals.
+
+def _skew(v):
+    # (..., 3) -> (..., 3, 3)
+    S = np.zeros(v.shape[:-1] + (3, 3))
+    S[..., 0, 1], S[..., 0, 2] = -v[..., 2], v[..., 1]
+    S[..., 1, 0], S[..., 1, 2] = v[..., 2], -v[..., 0]
+    S[..., 2, 0], S[..., 2, 1] = -v[..., 1], v[..., 0]
+    return S
+
+
+def se3_exp(xi):
+    # xi = [omega, v] -> 4x4, closed form
+    w, v = xi[:3], xi[3:]
+    th = np.linalg.norm(w)
+    W = _skew(w)
+    if th < 1e-10:
+        R = np.eye(3) + W
+        V = np.eye(3) + 0.5 * W
+    else:
+        a, b = np.sin(th) / th, (1 - np.cos(th)) / th**2
+        R = np.eye(3) + a * W + b * W @ W
+        V = np.eye(3) + b * W + (th - np.sin(th)) / th**3 * W @ W
+    T = np.eye(4)
+    T[:3, :3], T[:3, 3] = R, V @ v
+    return T
+
+
+def _aggregator(idx, n):
+    # sparse (n x len(idx)) indicator: A @ vals sums rows of vals into bins
+    return sparse.csr_matrix((np.ones(len(idx)), (idx, np.arange(len(idx)))), shape=(n, len(idx)))
+
+
+def _bin_sum(A, vals):
+    return (A @ vals.reshape(len(vals), -1)).reshape((A.shape[0],) + vals.shape[1:])
+
+
 class BundleAdjuster:
-    
-    def __init__(self, max_iters=5):
+
+    def __init__(self, max_iters=5, huber=2.0, lambda_init=1e-3, n_fixed=1):
         self.max_iters = max_iters
+        self.huber = huber
+        self.lambda_init = lambda_init
+        self.n_fixed = n_fixed
+        self.history = []
 
     def optimize(self, local_map):
-        local_map.optimize()
\ No newline at end of file
+        local_map.optimize()
+
+    def solve(self, K, poses, points, cam_idx, pt_idx, uv):
+        # poses (C,4,4) world->camera, points (P,3), observations (cam_idx, pt_idx, uv)
+        poses = np.array(poses, dtype=np.float64)
+        points = np.array(points, dtype=np.float64)
+        cam_idx = np.asarray(cam_idx, dtype=np.int64)
+        pt_idx = np.asarray(pt_idx, dtype=np.int64)
+        uv = np.asarray(uv, dtype=np.float64)
+        C, P = len(poses), len(points)
+        free = np.arange(self.n_fixed, C)
+        self.history = []
+        if not len(free) or not len(uv):
+            return poses, points
+
+        # pair table for the Schur complement: every two observations of the same point
+        order = np.argsort(pt_idx, kind='stable')
+        cnt = np.bincount(pt_idx, minlength=P)
+        ptr = np.concatenate(([0], np.cumsum(cnt)))
+        k = cnt[pt_idx[order]]
+        pa = np.repeat(order, k)
+        first = np.repeat(ptr[pt_idx[order]], k)
+        pb = order[first + (np.arange(k.sum()) - np.repeat(np.cumsum(k) - k, k))]
+        A_cam, A_pt = _aggregator(cam_idx, C), _aggregator(pt_idx, P)
+        A_pair = _aggregator(cam_idx[pa] * C + cam_idx[pb], C * C)
+
+        lam = self.lambda_init
+        cost = self._cost(K, poses, points, cam_idx, pt_idx, uv)
+        for it in range(self.max_iters):
+            t0 = time.perf_counter()
+            r, Jc, Jp, w = self._linearize(K, poses, points, cam_idx, pt_idx, uv)
+            Jc_w, Jp_w = Jc * w[:, None, None], Jp * w[:, None, None]
+            U = _bin_sum(A_cam, np.swapaxes(Jc_w, 1, 2) @ Jc)
+            V = _bin_sum(A_pt, np.swapaxes(Jp_w, 1, 2) @ Jp)
+            gc = -_bin_sum(A_cam, np.einsum('nki,nk->ni', Jc_w, r))
+            gp = -_bin_sum(A_pt, np.einsum('nki,nk->ni', Jp_w, r))
+            Wo = np.swapaxes(Jc_w, 1, 2) @ Jp                        # (n,6,3)
+
+            accepted = False
+            while not accepted and lam < 1e8:
+                Ud = U + lam * U * np.eye(6) + 1e-9 * np.eye(6)
+                Vd = V + lam * V * np.eye(3) + 1e-9 * np.eye(3)
+                Vinv = np.linalg.inv(Vd)
+                Y = Wo @ Vinv[pt_idx]                                # (n,6,3)
+                S = -_bin_sum(A_pair, Y[pa] @ np.swapaxes(Wo[pb], 1, 2)).reshape(C, C, 6, 6)
+                S[np.arange(C), np.arange(C)] += Ud
+                rhs = gc - _bin_sum(A_cam, np.einsum('nij,nj->ni', Y, gp[pt_idx]))
+                Sf = S[np.ix_(free, free)].transpose(0, 2, 1, 3).reshape(6 * len(free), 6 * len(free))
+                try:
+                    L = np.linalg.cholesky(Sf)
+                    dc_f = np.linalg.solve(L.T, np.linalg.solve(L, rhs[free].ravel()))
+                except np.linalg.LinAlgError:
+                    lam *= 10
+                    continue
+                dc = np.zeros((C, 6))
+                dc[free] = dc_f.reshape(-1, 6)
+                bp = gp - _bin_sum(A_pt, np.einsum('nij,ni->nj', Wo, dc[cam_idx]))
+                dp = np.einsum('pij,pj->pi', Vinv, bp)
+
+                new_poses = np.array([se3_exp(d) @ T for d, T in zip(dc, poses)])
+                new_points = points + dp
+                new_cost = self._cost(K, new_poses, new_points, cam_idx, pt_idx, uv)
+                if new_cost < cost:
+                    poses, points, cost = new_poses, new_points, new_cost
+                    lam = max(lam / 10, 1e-9)
+                    accepted = True
+                else:
+                    lam *= 10
+            self.history.append({'iter': it, 'cost': float(cost), 'lambda': lam,
+                                 'accepted': accepted,
+                                 'ms': (time.perf_counter() - t0) * 1e3})
+            if not accepted:
+                break
+        return poses, points
+
+    def _project(self, K, poses, points, cam_idx, pt_idx):
+        R = poses[cam_idx, :3, :3]
+        Xc = np.einsum('nij,nj->ni', R, points[pt_idx]) + poses[cam_idx, :3, 3]
+        z = np.where(np.abs(Xc[:, 2]) < 1e-9, 1e-9, Xc[:, 2])
+        u = K[0, 0] * Xc[:, 0] / z + K[0, 2]
+        v = K[1, 1] * Xc[:, 1] / z + K[1, 2]
+        return np.stack((u, v), axis=1), Xc, z, R
+
+    def _weights(self, r):
+        e = np.linalg.norm(r, axis=1)
+        return np.where(e <= self.huber, 1.0, self.huber / np.maximum(e, 1e-12))
+
+    def _cost(self, K, poses, points, cam_idx, pt_idx, uv):
+        proj, _, _, _ = self._project(K, poses, points, cam_idx, pt_idx)
+        e = np.linalg.norm(proj - uv, axis=1)
+        d = self.huber
+        return float(np.where(e <= d, 0.5 * e**2, d * (e - 0.5 * d)).sum())
+
+    def _linearize(self, K, poses, points, cam_idx, pt_idx, uv):
+        proj, Xc, z, R = self._project(K, poses, points, cam_idx, pt_idx)
+        r = proj - uv
+        fx, fy = K[0, 0], K[1, 1]
+        n = len(r)
+        Jpi = np.zeros((n, 2, 3))
+        Jpi[:, 0, 0] = fx / z
+        Jpi[:, 0, 2] = -fx * Xc[:, 0] / z**2
+        Jpi[:, 1, 1] = fy / z
+        Jpi[:, 1, 2] = -fy * Xc[:, 1] / z**2
+        dX = np.concatenate((-_skew(Xc), np.broadcast_to(np.eye(3), (n, 3, 3))), axis=2)
+        Jc = Jpi @ dX                     # left perturbation exp(xi) * T
+        Jp = Jpi @ R
+        return r, Jc, Jp, self._weights(r)
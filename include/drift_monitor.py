@@ -0,0 +1,151 @@
+from collections import deque
+
+import numpy as np
+
+# Online accuracy monitor: ATE / RPE as utils/evaluate_accuracy.py defines them
+# (ate, rpe with Umeyama/Horn alignment), kept up to date per frame without
+# storing the trajectory. Positions are folded into running centered moments
+# (Welford-style, so long runs in large coordinates do not cancel):
+#   means of A (estimate) and B (reference), C = sum (a-a_mean)(b-b_mean)^T,
+#   sum |a-a_mean|^2, sum |b-b_mean|^2
+# which is all the alignment needs; with the optimal t the aligned residual is
+#   sum |b - (s R a + t)|^2 = var_b + s^2 var_a - 2 s tr(R C)
+# so the ATE over every frame so far is exact under the current alignment. RPE
+# uses the same trick on step lengths (sum da^2, da*db, db^2) with a ring buffer
+# of the last `delta` positions. Each update is O(1) (one 3x3 SVD).
+#
+# Reference poses (ground truth, GNSS) are a side stream: add_reference and
+# add_estimate may arrive in any order and are paired by frame index; at most
+# max_pending unpaired entries per side are kept. Alerts fire when a metric
+# crosses its threshold and re-arm once it falls back below it.
+
+class DriftMonitor:
+    def __init__(self, with_scale=True, delta=1, ate_thresh=None, err_thresh=None,
+                 rpe_thresh=None, min_pairs=10, max_pending=1000, on_alert=None):
+        self.with_scale = with_scale
+        self.delta = delta
+        self.thresholds = {'ate': ate_thresh, 'error': err_thresh, 'rpe': rpe_thresh}
+        self.min_pairs = min_pairs
+        self.max_pending = max_pending
+        self.on_alert = on_alert
+        self.alerts = []                     # (frame idx, metric, value, threshold)
+        self._active = set()
+        self._est, self._ref = {}, {}
+        self.n = 0
+        self.mean_a, self.mean_b = np.zeros(3), np.zeros(3)
+        self.C = np.zeros((3, 3))
+        self.var_a = self.var_b = 0.0
+        self._ring = deque(maxlen=delta)     # (a, b) of the last `delta` pairs
+        self.m = 0
+        self.step = np.zeros(3)              # sums of da^2, da*db, db^2
+        self.last = {}
+
+    # --- side streams ---
+
+    def add_estimate(self, idx, pose):
+        return self._pair(idx, np.asarray(pose)[:3, 3], self._est, self._ref, True)
+
+    def add_reference(self, idx, pose):
+        return self._pair(idx, np.asarray(pose)[:3, 3], self._ref, self._est, False)
+
+    def _pair(self, idx, p, mine, other, is_est):
+        q = other.pop(idx, None)
+        if q is None:
+            mine[idx] = p.astype(np.float64)
+            if len(mine) > self.max_pending:
+                del mine[min(mine)]
+            return None
+        return self.update(idx, p, q) if is_est else self.update(idx, q, p)
+
+    # --- statistics ---
+
+    def update(self, idx, a, b):
+        # a: estimated position, b: reference position of the same frame
+        a, b = np.asarray(a, np.float64), np.asarray(b, np.float64)
+        self.n += 1
+        da, db = a - self.mean_a, b - self.mean_b
+        self.mean_a += da / self.n
+        self.mean_b += db / self.n
+        self.C += np.outer(da, b - self.mean_b)
+        self.var_a += da @ (a - self.mean_a)
+        self.var_b += db @ (b - self.mean_b)
+        if len(self._ring) == self.delta:
+            a0, b0 = self._ring[0]
+            la, lb = np.linalg.norm(a - a0), np.linalg.norm(b - b0)
+            self.m += 1
+            self.step += (la * la, la * lb, lb * lb)
+        self._ring.append((a, b))
+        if self.n < max(self.min_pairs, 3):
+            return None
+        R, t, s = self.alignment()
+        self.last = {'frame': idx, 'n': self.n, 'scale': s, 'ate': self._ate(R, s),
+                     'error': float(np.linalg.norm(s * R @ a + t - b)), 'rpe': self._rpe(s)}
+        self._check(idx)
+        return self.last
+
+    def alignment(self):
+        # same as evaluate_accuracy.align, from the running moments
+        U, S, Vt = np.linalg.svd(self.C)
+        D = np.eye(3)
+        if np.linalg.det(Vt.T @ U.T) < 0:
+            D[2, 2] = -1
+        R = Vt.T @ D @ U.T
+        s = (S * np.diag(D)).sum() / self.var_a if self.with_scale and self.var_a > 0 else 1.0
+        return R, self.mean_b - s * R @ self.mean_a, s
+
+    def _ate(self, R, s):
+        sse = self.var_b + s * s * self.var_a - 2 * s * np.trace(R @ self.C)
+        return float(np.sqrt(max(sse, 0.0) / self.n))
+
+    def _rpe(self, s):
+        if not self.m:
+            return None
+        aa, ab, bb = self.step
+        return float(np.sqrt(max(s * s * aa - 2 * s * ab + bb, 0.0) / self.m))
+
+    def _check(self, idx):
+        for metric, thresh in self.thresholds.items():
+            value = self.last.get(metric)
+            if thresh is None or value is None:
+                continue
+            if value > thresh and metric not in self._active:
+                self._active.add(metric)
+                alert = (idx, metric, value, thresh)
+                self.alerts.append(alert)
+                if self.on_alert is not None:
+                    self.on_alert(*alert)
+            elif value <= thresh:
+                self._active.discard(metric)
+
+    # --- persistence (include/snapshot.py state) ---
+
+    def snapshot(self):
+        ring = np.array([np.concatenate(p) for p in self._ring]).reshape(-1, 6)
+        return {'mon_moments': np.concatenate((self.mean_a, self.mean_b, self.C.ravel(),
+                                               [self.var_a, self.var_b], self.step,
+                                               [self.n, self.m])),
+                'mon_ring': ring}
+
+    def restore(self, d):
+        if 'mon_moments' not in d:
+            return
+        v = d['mon_moments']
+        self.mean_a, self.mean_b, self.C = v[0:3].copy(), v[3:6].copy(), v[6:15].reshape(3, 3).copy()
+        self.var_a, self.var_b = float(v[15]), float(v[16])
+        self.step = v[17:20].copy()
+        self.n, self.m = int(v[20]), int(v[21])
+        self._ring.clear()
+        for r in d['mon_ring']:
+            self._ring.append((r[:3].copy(), r[3:].copy()))
+
+    def summary(self):
+        return dict(self.last, alerts=len(self.alerts))
+
+    def print_summary(self):
+        if not self.last:
+            print(f"drift monitor: {self.n} pose pairs, too few to align")
+            return
+        s = self.last
+        rpe = '-' if s['rpe'] is None else f"{s['rpe']:.4f}"
+        print(f"drift monitor: {s['n']} pose pairs, ATE {s['ate']:.3f}, RPE({self.delta}) {rpe}, "
+              f"last error {s['error']:.3f}, scale {s['scale']:.3f}, {len(self.alerts)} alerts")
@@ -1,17 +1,93 @@
+import math
+
 import cv2
+import numpy as np
 
 class EssentialMatrixEstimator:
-    def __init__(self, focal: float, pp: tuple):
+    # method='ransac' is the original fixed-parameter cv2 RANSAC.
+    # method='prosac' samples in match-quality order (every matcher returns
+    # matches sorted by distance) with adaptive termination on the observed
+    # inlier ratio, and can be seeded with the previous frame's motion: the
+    # prior's inlier ratio caps the iteration budget and the prior is kept if no
+    # sampled hypothesis beats it (and it has at least min_prior_inliers).
+
+    def __init__(self, focal: float, pp: tuple, method='ransac',
+                 prob=0.999, threshold=1.0, max_iters=1000, min_prior_inliers=8):
         self.focal = focal
         self.pp = pp
+        self.method = method
+        self.prob = prob
+        self.threshold = threshold
+        self.max_iters = max_iters
+        self.min_prior_inliers = min_prior_inliers
+        self.K = np.array([[focal, 0, pp[0]], [0, focal, pp[1]], [0, 0, 1]], dtype=np.float64)
 
-    def compute(self, pts1, pts2):
+    def compute(self, pts1, pts2, prior=None):
+        if self.method == 'prosac':
+            return self._prosac(pts1, pts2, prior)
         E, mask = cv2.findEssentialMat(
             pts1, pts2,
             focal=self.focal,
             pp=self.pp,
             method=cv2.RANSAC,
-            prob=0.999,
-            threshold=1.0
+            prob=self.prob,
+            threshold=self.threshold,
+            maxIters=self.max_iters
+        )
+        return E, mask
+
+    def _prosac(self, pts1, pts2, prior=None):
+        if len(pts1) < 5:
+            return None, None
+        max_iters = self.max_iters
+        prior_E = prior_inl = None
+        if prior is not None:
+            prior_E = _essential_from_motion(*prior)
+        if prior_E is not None:
+            prior_inl = self.inliers(prior_E, pts1, pts2)
+            max_iters = min(max_iters, adaptive_iterations(prior_inl.mean(), self.prob))
+
+        E, mask = cv2.findEssentialMat(
+            pts1, pts2, self.K,
+            method=getattr(cv2, 'USAC_PROSAC', cv2.RANSAC),
+            prob=self.prob,
+            threshold=self.threshold,
+            maxIters=max(1, max_iters)
         )
+        if E is not None and E.shape[0] > 3:
+            E = E[:3]
+        if prior_inl is not None and prior_inl.sum() >= self.min_prior_inliers \
+                and (E is None or prior_inl.sum() > mask.sum()):
+            return prior_E, prior_inl.astype(np.uint8).reshape(-1, 1)
         return E, mask
+
+    def inliers(self, E, pts1, pts2):
+        # Sampson-distance inlier test in pixel units
+        Ki = np.linalg.inv(self.K)
+        F = Ki.T @ E @ Ki
+        h1 = np.hstack((np.asarray(pts1, np.float64).reshape(-1, 2), np.ones((len(pts1), 1))))
+        h2 = np.hstack((np.asarray(pts2, np.float64).reshape(-1, 2), np.ones((len(pts2), 1))))
+        Fx1 = h1 @ F.T
+        Ftx2 = h2 @ F
+        err = (h2 * Fx1).sum(axis=1)
+        denom = Fx1[:, 0]**2 + Fx1[:, 1]**2 + Ftx2[:, 0]**2 + Ftx2[:, 1]**2
+        return err * err < self.threshold**2 * np.maximum(denom, 1e-18)
+
+
+def adaptive_iterations(inlier_ratio, prob, sample_size=5):
+    if inlier_ratio >= 1.0:
+        return 1
+    if inlier_ratio <= 0.0:
+        return np.iinfo(np.int32).max
+    denom = math.log(max(1e-12, 1.0 - inlier_ratio ** sample_size))
+    return int(math.ceil(math.log(1.0 - prob) / min(-1e-12, denom)))
+
+
+def _essential_from_motion(R, t):
+    t = np.asarray(t, dtype=np.float64).ravel()
+    n = np.linalg.norm(t)
+    if n == 0:
+        return None
+    t = t / n
+    tx = np.array([[0, -t[2], t[1]], [t[2], 0, -t[0]], [-t[1], t[0], 0]])
+    return tx @ np.asarray(R, dtype=np.float64)
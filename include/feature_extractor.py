@@ -1,16 +1,177 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
+import numpy as np
+from include.frame_features import FrameFeatures
 # used ORB or superpoint(deep learning based feature extractor got to know from paper) for feature extraction
 
+# Tiled mode (tiles=(rows, cols), ORB only): the frame is split into a grid whose
+# cells are extracted concurrently on a thread pool (OpenCV releases the GIL),
+# each on a crop padded by `tile_border` pixels so keypoints near a seam still
+# get full descriptor patches. A keypoint belongs to the cell its location falls
+# in, so the padding never yields duplicates. Every cell keeps at most its quota
+# (nfeatures / cells) by response; quota left unused by texture-poor cells goes
+# to the strongest remaining keypoints anywhere in the frame, and the result is
+# trimmed to nfeatures. close() stops the pool.
+
 class FeatureExtractor:
-    def __init__(self, method='ORB', **kwargs):
+    def __init__(self, method='ORB', scale=1.0, tiles=None, tile_border=32, oversample=2.0,
+                 workers=None, **kwargs):
+        self.method = method
+        self.params = dict(kwargs)
+        self._pending = None
         if method == 'ORB':
             self.det = cv2.ORB_create(**kwargs)
         else:
             from superpoint import SuperPoint
             self.det = SuperPoint(**kwargs)
+        # processing resolution; keypoints always come back in full-res pixels
+        self._set_scale(scale)
+        self.tiles = None
+        if tiles is not None:
+            if method != 'ORB':
+                raise ValueError("tiled extraction is only implemented for ORB")
+            self._init_tiles(tuple(tiles), tile_border, oversample, workers, kwargs)
+
+    def _init_tiles(self, tiles, border, oversample, workers, kwargs):
+        self.tiles, self.tile_border, self.oversample = tiles, border, oversample
+        n_cells = tiles[0] * tiles[1]
+        # one detector per cell: cv2 detectors must not be shared between threads
+        self._cell_dets = [cv2.ORB_create(**kwargs) for _ in range(n_cells)]
+        self._set_nfeatures(kwargs.get('nfeatures', self.det.getMaxFeatures()))
+        self._cells = None
+        self._pool = ThreadPoolExecutor(max_workers=workers or min(n_cells, os.cpu_count() or 1),
+                                        thread_name_prefix='orb-tile')
+        self.params['tiles'] = {'grid': list(tiles), 'border': border, 'oversample': oversample}
+
+    def _set_nfeatures(self, nfeatures):
+        self.nfeatures = int(nfeatures)
+        self.quota = math.ceil(self.nfeatures / len(self._cell_dets))
+        for det in self._cell_dets:
+            det.setMaxFeatures(math.ceil(self.quota * self.oversample))
 
     def extract(self, img_gray):
+        # -> (keypoints, descriptors) in every mode; extract_features skips the
+        # cv2.KeyPoint round trip for tiled extraction
+        if self.tiles is not None:
+            feat = self._extract_tiled(img_gray)
+            return feat.keypoints(), feat.des
         if hasattr(self.det, 'detectAndCompute'):
             return self.det.detectAndCompute(img_gray, None)
         else:
             return self.det.run(img_gray)
+
+    def close(self):
+        if self.tiles is not None:
+            self._pool.shutdown()
+
+    def configure(self, nfeatures=None, scale=None):
+        # takes effect on the next frame, on whichever thread extracts it
+        self._pending = (nfeatures, scale)
+
+    def _apply_pending(self):
+        nfeatures, scale = self._pending
+        self._pending = None
+        if nfeatures is not None and hasattr(self.det, 'setMaxFeatures'):
+            self.det.setMaxFeatures(int(nfeatures))
+            self.params['nfeatures'] = int(nfeatures)
+            if self.tiles is not None:
+                self._set_nfeatures(nfeatures)
+        if scale is not None:
+            self._set_scale(scale)
+
+    def _set_scale(self, scale):
+        # part of params (the feature-store key) whenever it differs from full res
+        self.scale = scale
+        if scale != 1.0:
+            self.params['scale'] = scale
+        else:
+            self.params.pop('scale', None)
+
+    def extract_features(self, img_gray):
+        if self._pending is not None:
+            self._apply_pending()
+        scale = self.scale
+        if scale != 1.0:
+            img_gray = cv2.resize(img_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        if self.tiles is not None:
+            feat = self._extract_tiled(img_gray)
+        else:
+            feat = FrameFeatures.from_keypoints(*self.extract(img_gray))
+        if scale != 1.0 and len(feat):
+            feat.pts = feat.pts / scale
+            if feat.size is not None:
+                feat.size = feat.size / scale
+        return feat
+
+    def detect_points(self, img_gray):
+        # keypoint locations only (KLT re-detection): plain ORB skips the
+        # descriptors; tiled / SuperPoint extraction computes them anyway
+        if self.tiles is not None or self.method != 'ORB':
+            return self.extract_features(img_gray).pts
+        if self._pending is not None:
+            self._apply_pending()
+        scale = self.scale
+        if scale != 1.0:
+            img_gray = cv2.resize(img_gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        kp = self.det.detect(img_gray, None)
+        if not kp:
+            return np.empty((0, 2), np.float32)
+        pts = cv2.KeyPoint_convert(kp)
+        return pts / np.float32(scale) if scale != 1.0 else pts
+
+    # --- tiled extraction ---
+
+    def _cell_bounds(self, h, w):
+        # exact partition of the frame; cached per (processing) resolution
+        if self._cells is None or self._cells[0] != (h, w):
+            ys = np.linspace(0, h, self.tiles[0] + 1).astype(int)
+            xs = np.linspace(0, w, self.tiles[1] + 1).astype(int)
+            self._cells = ((h, w), [(xs[c], ys[r], xs[c + 1], ys[r + 1])
+                                    for r in range(self.tiles[0]) for c in range(self.tiles[1])])
+        return self._cells[1]
+
+    def _extract_cell(self, det, img, cell):
+        # -> (n, 6) keypoint array (see FrameFeatures.to_array) and descriptors,
+        # strongest first, restricted to the cell itself
+        x0, y0, x1, y1 = cell
+        h, w = img.shape[:2]
+        b = self.tile_border
+        X0, Y0 = max(x0 - b, 0), max(y0 - b, 0)
+        kp, des = det.detectAndCompute(img[Y0:min(y1 + b, h), X0:min(x1 + b, w)], None)
+        feat = FrameFeatures.from_keypoints(kp, des)
+        if not len(feat):
+            return np.empty((0, 6), np.float32), None
+        arr = feat.to_array()
+        arr[:, 0] += X0
+        arr[:, 1] += Y0
+        own = np.flatnonzero((arr[:, 0] >= x0) & (arr[:, 0] < x1) &
+                             (arr[:, 1] >= y0) & (arr[:, 1] < y1))
+        own = own[np.argsort(-arr[own, 4], kind='stable')]
+        return arr[own], des[own]
+
+    def _extract_tiled(self, img_gray):
+        cells = self._cell_bounds(*img_gray.shape[:2])
+        parts = list(self._pool.map(self._extract_cell, self._cell_dets,
+                                    [img_gray] * len(cells), cells))
+        take = np.array([min(len(a), self.quota) for a, _ in parts])
+        spare = self.nfeatures - int(take.sum())
+        if spare > 0:
+            # each cell's leftovers are sorted, so the global top-`spare` is a
+            # prefix of every cell's remainder
+            resp = np.concatenate([a[t:, 4] for (a, _), t in zip(parts, take)])
+            owner = np.repeat(np.arange(len(parts)), [len(a) - t for (a, _), t in zip(parts, take)])
+            if len(resp) > spare:
+                owner = owner[np.argpartition(-resp, spare - 1)[:spare]]
+            take += np.bincount(owner, minlength=len(parts))
+        keep = [(a[:t], d[:t]) for (a, d), t in zip(parts, take) if t]
+        if not keep:
+            return FrameFeatures.empty()
+        arr, des = np.concatenate([a for a, _ in keep]), np.concatenate([d for _, d in keep])
+        if len(arr) > self.nfeatures:
+            # the rounded-up quotas can overshoot nfeatures: drop the weakest
+            top = np.sort(np.argpartition(-arr[:, 4], self.nfeatures - 1)[:self.nfeatures])
+            arr, des = arr[top], des[top]
+        return FrameFeatures.from_array(arr, des)
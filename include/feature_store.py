@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from include.frame_features import FrameFeatures
+
+# On-disk feature store, one directory per (drive, extractor configuration).
+# Layout:
+#   kp.bin       float32 (M, 6)  x, y, size, angle, response, octave
+#   des.bin      (M, D) descriptors, dtype recorded in meta.json
+#   offsets.npy  int64 (N+1,)    frame i owns rows offsets[i]:offsets[i+1]
+#   meta.json    extractor method/kwargs, shapes, dtype
+# A store is written while run_slam extracts features and only becomes visible
+# (renamed into place) once every frame of the drive has been recorded.
+
+KP_COLS = 6
+
+
+def config_key(method, params):
+    blob = json.dumps({'method': method, 'params': params}, sort_keys=True, default=str)
+    return f"{method}_{hashlib.sha1(blob.encode()).hexdigest()[:12]}"
+
+
+class FeatureStore:
+
+    def __init__(self, root, date, drive, extractor, n_frames):
+        self.extractor = extractor
+        self.n_frames = n_frames
+        self.path = os.path.join(root, date, drive, config_key(extractor.method, extractor.params))
+        self._tmp = self.path + '.partial'
+        self._writer = None
+        self.kp = self.des = self.offsets = None
+        if self.is_complete():
+            self._open()
+
+    @property
+    def recording(self):
+        return self.offsets is None
+
+    def is_complete(self):
+        meta = os.path.join(self.path, 'meta.json')
+        if not os.path.exists(meta):
+            return False
+        with open(meta) as f:
+            return json.load(f).get('n_frames') == self.n_frames
+
+    def extract_frame(self, idx, img_gray):
+        # called by the frame sources in pipeline.py in place of extract_features
+        if self.offsets is not None:
+            return self.get(idx)
+        feats = self.extractor.extract_features(img_gray)
+        self._append(idx, feats)
+        return feats
+
+    def get(self, idx):
+        a, b = self.offsets[idx], self.offsets[idx + 1]
+        return FrameFeatures.from_array(self.kp[a:b], self.des[a:b])
+
+    def get_arrays(self, idx):
+        a, b = self.offsets[idx], self.offsets[idx + 1]
+        return self.kp[a:b], self.des[a:b]
+
+    def close(self):
+        # finalize if every frame was recorded, otherwise throw the partial store away
+        if self._writer is None:
+            return
+        w = self._writer
+        self._writer = None
+        w['kp'].close()
+        w['des'].close()
+        if not w['ok'] or len(w['offsets']) - 1 != self.n_frames:
+            why = f"{len(w['offsets']) - 1} of {self.n_frames} frames recorded" if w['ok'] \
+                else "frames arrived out of order"
+            print(f"Feature store {self.path} not saved: {why}")
+            shutil.rmtree(self._tmp, ignore_errors=True)
+            return
+        np.save(os.path.join(self._tmp, 'offsets.npy'), np.asarray(w['offsets'], dtype=np.int64))
+        meta = {
+            'method': self.extractor.method,
+            'params': self.extractor.params,
+            'n_frames': self.n_frames,
+            'n_rows': int(w['offsets'][-1]),
+            'des_cols': w['des_cols'],
+            'des_dtype': w['des_dtype'],
+        }
+        with open(os.path.join(self._tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f, default=str)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self._tmp, self.path)
+        self._open()
+
+    def _open(self):
+        with open(os.path.join(self.path, 'meta.json')) as f:
+            meta = json.load(f)
+        n = meta['n_rows']
+        self.offsets = np.load(os.path.join(self.path, 'offsets.npy'))
+        if n == 0:
+            self.kp = np.empty((0, KP_COLS), dtype=np.float32)
+            self.des = np.empty((0, meta['des_cols'] or 0), dtype=meta['des_dtype'] or np.uint8)
+            return
+        self.kp = np.memmap(os.path.join(self.path, 'kp.bin'), dtype=np.float32,
+                            mode='r', shape=(n, KP_COLS))
+        self.des = np.memmap(os.path.join(self.path, 'des.bin'), dtype=meta['des_dtype'],
+                             mode='r', shape=(n, meta['des_cols']))
+
+    def _append(self, idx, feats):
+        if self._writer is None:
+            if idx != 0:
+                return
+            shutil.rmtree(self._tmp, ignore_errors=True)
+            os.makedirs(self._tmp)
+            self._writer = {
+                'kp': open(os.path.join(self._tmp, 'kp.bin'), 'wb'),
+                'des': open(os.path.join(self._tmp, 'des.bin'), 'wb'),
+                'offsets': [0],
+                'ok': True,
+                'des_cols': None,
+                'des_dtype': None,
+            }
+        w = self._writer
+        if not w['ok'] or idx != len(w['offsets']) - 1:
+            # frames must arrive in order; anything else cannot be stored
+            w['ok'] = False
+            return
+        n = 0 if feats.des is None else len(feats.des)
+        if n:
+            des = np.ascontiguousarray(feats.des)
+            if w['des_cols'] is None:
+                w['des_cols'], w['des_dtype'] = des.shape[1], des.dtype.str
+            w['kp'].write(feats.to_array()[:n].tobytes())
+            w['des'].write(des.tobytes())
+        w['offsets'].append(w['offsets'][-1] + n)
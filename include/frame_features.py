@@ -0,0 +1,72 @@
+import cv2
+import numpy as np
+
+# Array-native per-frame features. Keypoint locations live in one (N, 2) float32
+# array next to the descriptor matrix, so gathering matched points is a single
+# fancy-indexing operation instead of a Python loop over cv2.KeyPoint objects.
+
+class FrameFeatures:
+    __slots__ = ('pts', 'des', 'size', 'angle', 'response', 'octave')
+
+    def __init__(self, pts, des, size=None, angle=None, response=None, octave=None):
+        self.pts = pts
+        self.des = des
+        self.size = size
+        self.angle = angle
+        self.response = response
+        self.octave = octave
+
+    def __len__(self):
+        return len(self.pts)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 2), dtype=np.float32), None)
+
+    @classmethod
+    def from_keypoints(cls, kp, des):
+        if not kp or des is None or len(des) == 0:
+            return cls.empty()
+        attrs = np.array([(k.size, k.angle, k.response, k.octave) for k in kp], dtype=np.float32)
+        return cls(cv2.KeyPoint_convert(kp), des,
+                   attrs[:, 0], attrs[:, 1], attrs[:, 2], attrs[:, 3].astype(np.int32))
+
+    @classmethod
+    def from_array(cls, arr, des):
+        # arr columns: x, y, size, angle, response, octave (see feature_store.py)
+        if len(arr) == 0:
+            return cls.empty()
+        arr = np.asarray(arr)
+        return cls(np.ascontiguousarray(arr[:, :2]), np.asarray(des),
+                   arr[:, 2], arr[:, 3], arr[:, 4], arr[:, 5].astype(np.int32))
+
+    def to_array(self):
+        n = len(self)
+        cols = [self.size, self.angle, self.response, self.octave]
+        cols = [np.zeros(n, np.float32) if c is None else c for c in cols]
+        return np.column_stack([self.pts] + cols).astype(np.float32)
+
+    def keypoints(self):
+        # only for drawing / OpenCV APIs that insist on cv2.KeyPoint
+        arr = self.to_array()
+        return tuple(cv2.KeyPoint(float(x), float(y), float(s), float(a), float(r), int(o))
+                     for x, y, s, a, r, o in arr)
+
+    def subset(self, idx):
+        pick = lambda a: None if a is None else a[idx]
+        return FrameFeatures(self.pts[idx], pick(self.des), pick(self.size),
+                             pick(self.angle), pick(self.response), pick(self.octave))
+
+
+def match_indices(matches):
+    # MatchArrays already carry index arrays; DMatch lists are converted once
+    if hasattr(matches, 'query_idx'):
+        return matches.query_idx, matches.train_idx
+    q = np.fromiter((m.queryIdx for m in matches), dtype=np.int32, count=len(matches))
+    t = np.fromiter((m.trainIdx for m in matches), dtype=np.int32, count=len(matches))
+    return q, t
+
+
+def matched_points(prev, curr, matches):
+    q, t = match_indices(matches)
+    return prev.pts[q], curr.pts[t]
@@ -0,0 +1,207 @@
+import numpy as np
+
+from include.matcher import MatchArrays, _pack_words, _popcount
+
+# Motion-guided matching for frame-to-frame VO. The current frame's keypoints
+# are bucketed into a grid (KeypointGrid, CSR over cells). Each previous
+# keypoint gets a predicted location from the constant-velocity model:
+#   - keypoints matched in the last pair repeat their image flow
+#     (radius `radius`)
+#   - the others are warped by the last rotation only, K R K^-1 x, with a
+#     wider window (`wide_radius`), since their depth (and so their parallax)
+#     is unknown; the warped point lies on their epipolar line, so only the
+#     grid cells along that line are visited (KeypointGrid.query_line)
+# and only current keypoints inside the window and within `band` pixels of
+# the epipolar line of the last motion are compared. Best / second-best per
+# previous keypoint, a ratio test, an absolute distance cap and a mutual
+# check then select the matches, sorted by distance as every other matcher
+# returns them. Without a motion model for exactly this pair (first frame,
+# tracking lost, skipped or rejected frames), or when too few guided matches
+# survive, the wrapped global matcher is used instead.
+
+
+class KeypointGrid:
+    def __init__(self, pts, cell=16.0):
+        self.cell = float(cell)
+        c = np.floor(np.asarray(pts, np.float64) / self.cell).astype(np.int64)
+        if len(c):
+            c = np.maximum(c, 0)
+        self.cols = int(c[:, 0].max()) + 1 if len(c) else 1
+        self.rows = int(c[:, 1].max()) + 1 if len(c) else 1
+        cid = c[:, 1] * self.cols + c[:, 0]
+        self.order = np.argsort(cid, kind='stable')
+        self.ptr = np.zeros(self.rows * self.cols + 1, np.int64)
+        np.cumsum(np.bincount(cid, minlength=self.rows * self.cols), out=self.ptr[1:])
+
+    def query(self, centers, radius):
+        # -> (center index, point index) for every point in the cells that
+        # overlap the square window of half-size `radius` around each center
+        k = int(np.ceil(radius / self.cell))
+        cc = np.floor(np.asarray(centers, np.float64) / self.cell).astype(np.int64)
+        off = np.arange(-k, k + 1)
+        gx = cc[:, 0, None, None] + off[None, None, :]
+        gy = cc[:, 1, None, None] + off[None, :, None]
+        gx, gy = np.broadcast_arrays(gx, gy)
+        qi = np.broadcast_to(np.arange(len(cc))[:, None, None], gx.shape)
+        valid = (gx >= 0) & (gx < self.cols) & (gy >= 0) & (gy < self.rows)
+        return self._gather(qi[valid], (gy * self.cols + gx)[valid])
+
+    def query_line(self, centers, dirs, half_len, half_width):
+        # like query, but only the cells crossed by the band of half-width
+        # `half_width` along the segment center +- half_len * dir (unit dir):
+        # the band is sampled every half cell, and each center's cells sorted
+        # and deduplicated (a repeated cell would pair a point with itself twice)
+        step = self.cell / 2
+        s = np.arange(-half_len, half_len + step, step)
+        w = np.array([-half_width, 0.0, half_width])
+        centers, dirs = np.asarray(centers, np.float64), np.asarray(dirs, np.float64)
+        along = s[None, :, None] * dirs[:, None, :]                     # (n, S, 2)
+        across = w[None, :, None] * np.stack((-dirs[:, 1], dirs[:, 0]), axis=1)[:, None, :]
+        p = (centers[:, None, None, :] + along[:, :, None, :] + across[:, None, :, :]) / self.cell
+        gx = np.floor(p[..., 0]).astype(np.int64).reshape(len(centers), -1)
+        gy = np.floor(p[..., 1]).astype(np.int64).reshape(len(centers), -1)
+        valid = (gx >= 0) & (gx < self.cols) & (gy >= 0) & (gy < self.rows)
+        cid = np.sort(np.where(valid, gy * self.cols + gx, -1), axis=1)
+        keep = cid >= 0
+        keep[:, 1:] &= cid[:, 1:] != cid[:, :-1]
+        qi = np.broadcast_to(np.arange(len(centers))[:, None], cid.shape)
+        return self._gather(qi[keep], cid[keep])
+
+    def _gather(self, qi, cid):
+        start, count = self.ptr[cid], self.ptr[cid + 1] - self.ptr[cid]
+        total = int(count.sum())
+        # flat positions into self.order: each cell's run, back to back
+        pos = np.repeat(start - (np.cumsum(count) - count), count) + np.arange(total)
+        return np.repeat(qi, count), self.order[pos]
+
+
+class GuidedMatcher:
+    def __init__(self, K, fallback, cell=16.0, radius=20.0, wide_radius=60.0, band=4.0,
+                 ratio=0.8, max_dist=64, min_matches=50, max_matches=None):
+        self.K = np.asarray(K, np.float64)
+        self.K_inv = np.linalg.inv(self.K)
+        self.fallback = fallback
+        self.cell = cell
+        self.radius, self.wide_radius = radius, wide_radius
+        self.band = band
+        self.ratio = ratio
+        self.max_dist = max_dist
+        self.min_matches = min_matches
+        self._max_matches = max_matches
+        self.last_guided = False
+        self.n_guided = self.n_global = 0
+        self.n_candidates = 0
+        self._last = None                # frame the motion model ends at
+        self._R = self._t = None
+        self._flow = None                # per keypoint of self._last, NaN if untracked
+
+    @property
+    def max_matches(self):
+        return self._max_matches
+
+    @max_matches.setter
+    def max_matches(self, n):
+        # the budget controller caps both paths
+        self._max_matches = n
+        if hasattr(self.fallback, 'max_matches'):
+            self.fallback.max_matches = n
+
+    def set_motion(self, R, t, prev, curr, q, tq):
+        # after an accepted pose: (R, t) maps prev to curr, q/tq are the inlier
+        # matches; curr becomes the frame the next prediction starts from
+        self._last = curr
+        self._R, self._t = np.asarray(R, np.float64), np.asarray(t, np.float64).ravel()
+        self._flow = np.full((len(curr), 2), np.nan, np.float32)
+        self._flow[tq] = curr.pts[tq] - prev.pts[q]
+
+    def reset(self):
+        self._last = None
+
+    def match(self, prev, curr):
+        self.last_guided = False
+        if prev is self._last and prev.des is not None and curr.des is not None \
+                and len(prev) and len(curr):
+            m = self._guided(prev, curr)
+            if len(m) >= self.min_matches:
+                self.last_guided = True
+                self.n_guided += 1
+                return m
+        self.n_global += 1
+        return self.fallback.match(prev, curr)
+
+    def _guided(self, prev, curr):
+        x1 = prev.pts.astype(np.float64)
+        h1 = np.hstack((x1, np.ones((len(x1), 1))))
+        # rotation-only prediction for every point, constant flow where tracked;
+        # the rotation-only prediction lies on the point's epipolar line
+        p = h1 @ (self.K @ self._R @ self.K_inv).T
+        center = p[:, :2] / p[:, 2:3]
+        tracked = np.isfinite(self._flow[:, 0])
+        center[tracked] = x1[tracked] + self._flow[tracked]
+        rad = np.where(tracked, self.radius, self.wide_radius)
+        tx = np.array([[0, -self._t[2], self._t[1]],
+                       [self._t[2], 0, -self._t[0]],
+                       [-self._t[1], self._t[0], 0]])
+        lines = h1 @ (self.K_inv.T @ tx @ self._R @ self.K_inv).T
+        lines /= np.maximum(np.hypot(lines[:, 0], lines[:, 1]), 1e-12)[:, None]
+
+        grid = KeypointGrid(curr.pts, self.cell)
+        ok = np.isfinite(center).all(axis=1)
+        qs, ts = [], []
+        idx = np.flatnonzero(tracked & ok)
+        if len(idx):
+            qi, tj = grid.query(center[idx], self.radius)
+            qs.append(idx[qi])
+            ts.append(tj)
+        idx = np.flatnonzero(~tracked & ok)
+        if len(idx):
+            dirs = np.stack((-lines[idx, 1], lines[idx, 0]), axis=1)
+            qi, tj = grid.query_line(center[idx], dirs, self.wide_radius, self.band)
+            qs.append(idx[qi])
+            ts.append(tj)
+        if not qs:
+            return MatchArrays.empty()
+        qi, tj = np.concatenate(qs), np.concatenate(ts)
+
+        # inside the window and near the epipolar line of the predicted motion
+        # (per coordinate: 1-D gathers are much cheaper than (n, 2) ones)
+        x2, y2 = curr.pts[:, 0].astype(np.float64), curr.pts[:, 1].astype(np.float64)
+        xj, yj = x2[tj], y2[tj]
+        r = rad[qi]
+        cx, cy = np.ascontiguousarray(center.T)
+        keep = (np.abs(xj - cx[qi]) <= r) & (np.abs(yj - cy[qi]) <= r)
+        a, b, c = np.ascontiguousarray(lines.T)
+        a, b, c = a[qi], b[qi], c[qi]
+        keep &= np.abs(a * xj + b * yj + c) <= self.band
+        qi, tj = qi[keep], tj[keep]
+        self.n_candidates += len(qi)
+        if not len(qi):
+            return MatchArrays.empty()
+
+        w1, w2 = _pack_words(prev.des).T.copy(), _pack_words(curr.des).T.copy()
+        dist = np.zeros(len(qi), np.int32)
+        for k in range(len(w1)):
+            dist += _popcount(w1[k][qi] ^ w2[k][tj])
+
+        # best and second best candidate per previous keypoint
+        # (one int64 sort key instead of lexsort: distances are below 512)
+        order = np.argsort(qi.astype(np.int64) << 9 | dist, kind='stable')
+        qi, tj, dist = qi[order], tj[order], dist[order]
+        first = np.r_[True, qi[1:] != qi[:-1]]
+        second = np.full(len(qi), np.iinfo(np.int32).max, np.int64)
+        has2 = np.r_[~first[1:], False] & first
+        second[has2] = dist[np.flatnonzero(has2) + 1]
+        ok = first & (dist <= self.max_dist) & (dist < self.ratio * second)
+        qi, tj, dist = qi[ok], tj[ok], dist[ok]
+
+        # mutual: each current keypoint keeps only its closest previous one
+        order = np.argsort(tj.astype(np.int64) << 9 | dist, kind='stable')
+        qi, tj, dist = qi[order], tj[order], dist[order]
+        uniq = np.r_[True, tj[1:] != tj[:-1]]
+        qi, tj, dist = qi[uniq], tj[uniq], dist[uniq]
+
+        order = np.argsort(dist, kind='stable')
+        if self.max_matches:
+            order = order[:self.max_matches]
+        return MatchArrays(qi[order].astype(np.int32), tj[order].astype(np.int32),
+                           dist[order].astype(np.float32))
@@ -1,109 +1,196 @@
 import numpy as np
+from scipy.linalg import cho_factor, cho_solve
+
+# Loosely coupled IMU / VO filter. The nominal state x = [pos(3), vel(3),
+# ori(4, quaternion w,x,y,z)] lives in the VO world frame; the covariance P is
+# over the 9-dim error state [dp, dv, dtheta] (dtheta in the body frame).
+# All IMU samples of one camera interval are preintegrated in a single
+# vectorized pass (rotation increments chained with a log-depth product scan),
+# so propagation runs once per camera frame whatever the IMU rate. The VO update
+# solves with a Cholesky factorization of the innovation covariance.
+
+def _skew(v):
+    S = np.zeros(v.shape[:-1] + (3, 3))
+    S[..., 0, 1], S[..., 0, 2] = -v[..., 2], v[..., 1]
+    S[..., 1, 0], S[..., 1, 2] = v[..., 2], -v[..., 0]
+    S[..., 2, 0], S[..., 2, 1] = -v[..., 1], v[..., 0]
+    return S
+
+
+def so3_exp(w):
+    # (..., 3) -> (..., 3, 3), Rodrigues
+    th = np.linalg.norm(w, axis=-1)[..., None, None]
+    W = _skew(w)
+    small = th < 1e-8
+    ts = np.where(small, 1.0, th)
+    a = np.where(small, 1.0, np.sin(ts) / ts)
+    b = np.where(small, 0.5, (1 - np.cos(ts)) / ts**2)
+    return np.eye(3) + a * W + b * (W @ W)
+
+
+def so3_log(R):
+    cos = np.clip((np.trace(R) - 1) / 2, -1.0, 1.0)
+    th = np.arccos(cos)
+    vee = np.array([R[2, 1] - R[1, 2], R[0, 2] - R[2, 0], R[1, 0] - R[0, 1]])
+    return 0.5 * vee if th < 1e-8 else th / (2 * np.sin(th)) * vee
+
+
+def quat_to_rot(q):
+    qw, qx, qy, qz = q
+    return np.array([
+        [1-2*(qy*qy+qz*qz),   2*(qx*qy-qz*qw),   2*(qx*qz+qy*qw)],
+        [2*(qx*qy+qz*qw),   1-2*(qx*qx+qz*qz),   2*(qy*qz-qx*qw)],
+        [2*(qx*qz-qy*qw),     2*(qy*qz+qx*qw), 1-2*(qx*qx+qy*qy)]
+    ])
+
+
+def rot_to_quat(R):
+    w = np.sqrt(max(0.0, 1 + R[0, 0] + R[1, 1] + R[2, 2])) / 2
+    x = np.copysign(np.sqrt(max(0.0, 1 + R[0, 0] - R[1, 1] - R[2, 2])) / 2, R[2, 1] - R[1, 2])
+    y = np.copysign(np.sqrt(max(0.0, 1 - R[0, 0] + R[1, 1] - R[2, 2])) / 2, R[0, 2] - R[2, 0])
+    z = np.copysign(np.sqrt(max(0.0, 1 - R[0, 0] - R[1, 1] + R[2, 2])) / 2, R[1, 0] - R[0, 1])
+    q = np.array([w, x, y, z])
+    return q / np.linalg.norm(q)
+
+
+def _scan_products(M):
+    # inclusive prefix products M0, M0 M1, ..., M0..Mn-1 in ceil(log2 n) batched matmuls
+    X = M.copy()
+    s = 1
+    while s < len(X):
+        X[s:] = X[:-s] @ X[s:]
+        s *= 2
+    return X
+
+
+def preintegrate(accel, gyro, dt, accel_noise=0.1, gyro_noise=0.01):
+    # IMU samples (n,3), (n,3), dt (n,) -> relative motion (dR, dv, dp) in the body
+    # frame of the first sample, the total time, and the 9x9 covariance of the
+    # preintegration error [dphi, dv, dp] (per-sample white noise of the given std)
+    accel, gyro = np.asarray(accel, np.float64), np.asarray(gyro, np.float64)
+    dt = np.broadcast_to(np.asarray(dt, np.float64), (len(accel),))
+    n = len(accel)
+    if n == 0:
+        return np.eye(3), np.zeros(3), np.zeros(3), 0.0, np.zeros((9, 9))
+
+    E = so3_exp(gyro * dt[:, None])                              # per-sample increments
+    Rk = np.concatenate((np.eye(3)[None], _scan_products(E)[:-1]))  # dR before sample k
+    Ra = np.einsum('nij,nj->ni', Rk, accel)
+    dv_k = np.concatenate((np.zeros((1, 3)), np.cumsum(Ra * dt[:, None], axis=0)))
+    dR = Rk[-1] @ E[-1]
+    dv = dv_k[-1]
+    dp = (dv_k[:-1] * dt[:, None] + 0.5 * Ra * dt[:, None]**2).sum(axis=0)
+
+    # error propagation x_{k+1} = A_k x_k + B_k [eta_g, eta_a], summed in closed form:
+    # Sigma = sum_k Phi_k B_k Q B_k^T Phi_k^T with Phi_k = A_{n-1} ... A_{k+1}
+    I3 = np.eye(3)
+    dt1, dt2 = dt[:, None, None], dt[:, None, None]**2
+    aX = Rk @ _skew(accel)
+    A = np.zeros((n, 9, 9))
+    A[:, 0:3, 0:3] = np.swapaxes(E, 1, 2)
+    A[:, 3:6, 0:3] = -aX * dt1
+    A[:, 3:6, 3:6] = I3
+    A[:, 6:9, 0:3] = -0.5 * aX * dt2
+    A[:, 6:9, 3:6] = I3 * dt1
+    A[:, 6:9, 6:9] = I3
+    B = np.zeros((n, 9, 6))
+    B[:, 0:3, 0:3] = I3 * dt1
+    B[:, 3:6, 3:6] = Rk * dt1
+    B[:, 6:9, 3:6] = 0.5 * Rk * dt2
+    # suffix products A_{n-1}..A_{k+1}: scan over the reversed sequence
+    suffix = _scan_products(A[::-1])[::-1]                       # suffix[k] = A_{n-1}..A_k
+    Phi = np.concatenate((suffix[1:], np.eye(9)[None]))
+    G = Phi @ B
+    q = np.array([gyro_noise**2] * 3 + [accel_noise**2] * 3)
+    cov = np.einsum('nik,k,njk->ij', G, q, G)
+    return dR, dv, dp, float(dt.sum()), cov
+
 
 class IMUKalmanFilter:
-    def __init__(self, dt, accel_noise=0.1, gyro_noise=0.01, vo_noise=0.05):
+    def __init__(self, dt, accel_noise=0.1, gyro_noise=0.01, vo_noise=0.05,
+                 gravity=(0.0, 0.0, -9.81), rot_noise=None):
         # State vector x = [pos(3), vel(3), ori(4 as quaternion)]
         self.dt = dt
         # Initialize state
         self.x = np.zeros((10,))
         self.x[6] = 1.0  # quaternion w = 1
-        # State covariance
-        self.P = np.eye(10) * 0.1
-        # Process noise
-        self.Q = np.diag([0.01]*3 + [accel_noise]*3 + [gyro_noise]*4)
-        # Measurement noise (VO position + orientation)
-        self.R = np.diag([vo_noise]*3 + [vo_noise]*3)
+        # Error-state covariance [dp, dv, dtheta]
+        self.P = np.eye(9) * 0.1
+        self.accel_noise, self.gyro_noise = accel_noise, gyro_noise
+        self.gravity = np.asarray(gravity, dtype=np.float64)
+        # Measurement noise variances (VO position + orientation)
+        rot_noise = vo_noise if rot_noise is None else rot_noise
+        self.R = np.diag([vo_noise]*3 + [rot_noise]*3)
+        self.H = np.zeros((6, 9))
+        self.H[0:3, 0:3] = np.eye(3)
+        self.H[3:6, 6:9] = np.eye(3)
+
+    def set_state(self, pos=None, vel=None, rot=None, P=None):
+        if pos is not None:
+            self.x[0:3] = pos
+        if vel is not None:
+            self.x[3:6] = vel
+        if rot is not None:
+            self.x[6:10] = rot_to_quat(np.asarray(rot))
+        if P is not None:
+            self.P = np.array(P, dtype=np.float64)
 
     def predict(self, accel, gyro):
-        # Unpack
-        p = self.x[0:3]
-        v = self.x[3:6]
-        q = self.x[6:10]  # quaternion [w, x, y, z]
-
-        # Convert quaternion to rotation matrix
-        qw, qx, qy, qz = q
-        R = np.array([
-            [1-2*(qy*qy+qz*qz),   2*(qx*qy-qz*qw),   2*(qx*qz+qy*qw)],
-            [2*(qx*qy+qz*qw),   1-2*(qx*qx+qz*qz),   2*(qy*qz-qx*qw)],
-            [2*(qx*qz-qy*qw),     2*(qy*qz+qx*qw), 1-2*(qx*qx+qy*qy)]
-        ])
-
-        # State propagation
-        p_pred = p + v * self.dt + 0.5 * (R @ accel) * self.dt**2
-        v_pred = v + (R @ accel) * self.dt
-        # Quaternion update: q_dot = 0.5 * Omega(gyro) * q
-        omega = np.array([0, *gyro])
-        q_dot = 0.5 * self._quat_mul(omega, q)
-        q_pred = q + q_dot * self.dt
-        q_pred /= np.linalg.norm(q_pred)
-
-        # Update state
-        self.x[0:3] = p_pred
-        self.x[3:6] = v_pred
-        self.x[6:10] = q_pred
-
-        # Jacobian F approx identity (small-angle) – for full accuracy derive analytically
-        F = np.eye(10)
-        # Covariance propagation
-        self.P = F @ self.P @ F.T + self.Q
+        # single sample of length self.dt
+        self.propagate(np.atleast_2d(accel), np.atleast_2d(gyro), self.dt)
+
+    def propagate(self, accel, gyro, dt=None):
+        # whole block of IMU samples between two camera frames
+        if len(accel) == 0:
+            return
+        dR, dv, dp, T, cov = preintegrate(accel, gyro, self.dt if dt is None else dt,
+                                          self.accel_noise, self.gyro_noise)
+        p, v = self.x[0:3], self.x[3:6]
+        Ri = quat_to_rot(self.x[6:10])
+        g = self.gravity
+
+        self.x[0:3] = p + v * T + 0.5 * g * T * T + Ri @ dp
+        self.x[3:6] = v + g * T + Ri @ dv
+        self.x[6:10] = rot_to_quat(Ri @ dR)
+
+        F = np.eye(9)
+        F[0:3, 3:6] = np.eye(3) * T
+        F[0:3, 6:9] = -Ri @ _skew(dp)
+        F[3:6, 6:9] = -Ri @ _skew(dv)
+        F[6:9, 6:9] = dR.T
+        G = np.zeros((9, 9))               # preintegration error [dphi, dv, dp] -> state
+        G[0:3, 6:9] = Ri
+        G[3:6, 3:6] = Ri
+        G[6:9, 0:3] = np.eye(3)
+        self.P = F @ self.P @ F.T + G @ cov @ G.T
 
     def update_vo(self, pos_meas, ori_meas):
-        # Measurement vector z = [p_x, p_y, p_z, yaw, pitch, roll]
-        # Here we only fuse position and yaw/pitch/roll from quaternion
-        # Convert ori_meas quaternion to euler
-        yaw, pitch, roll = self._quat_to_euler(ori_meas)
-        z = np.hstack((pos_meas, [yaw, pitch, roll]))
-
-        # Prediction measurement
-        p = self.x[0:3]
-        q = self.x[6:10]
-        ypr = self._quat_to_euler(q)
-        h = np.hstack((p, ypr))
-
-        # Jacobian H
-        H = np.zeros((6, 10))
-        H[0:3, 0:3] = np.eye(3)
-        # Orientation to euler Jacobian approximate: use identity on quaternion part
-        H[3:6, 6:9] = np.eye(3)
-
-        # Innovation
-        y = z - h
-        # Covariance
+        # ori_meas: quaternion [w, x, y, z] or 3x3 rotation
+        ori_meas = np.asarray(ori_meas, dtype=np.float64)
+        R_meas = ori_meas if ori_meas.shape == (3, 3) else quat_to_rot(ori_meas)
+        R_est = quat_to_rot(self.x[6:10])
+
+        # Innovation: position difference and body-frame rotation error
+        y = np.hstack((np.asarray(pos_meas, dtype=np.float64) - self.x[0:3],
+                       so3_log(R_est.T @ R_meas)))
+        H = self.H
         S = H @ self.P @ H.T + self.R
-        K = self.P @ H.T @ np.linalg.inv(S)
+        # K = P H^T S^-1, from the Cholesky factor of S (S is symmetric)
+        K = cho_solve(cho_factor(S), H @ self.P).T
 
-        # State update
-        self.x += K @ y
-        # Covariance update
-        self.P = (np.eye(10) - K @ H) @ self.P
+        dx = K @ y
+        self.x[0:3] += dx[0:3]
+        self.x[3:6] += dx[3:6]
+        self.x[6:10] = rot_to_quat(R_est @ so3_exp(dx[6:9]))
+        # Joseph form keeps P symmetric positive definite
+        IKH = np.eye(9) - K @ H
+        self.P = IKH @ self.P @ IKH.T + K @ self.R @ K.T
 
     def get_state(self):
         return self.x[0:3].copy(), self.x[3:6].copy(), self.x[6:10].copy()
 
-    def _quat_mul(self, a, b):
-        # Hamilton product a ⊗ b
-        aw, ax, ay, az = a
-        bw, bx, by, bz = b
-        return np.array([
-            aw*bw - ax*bx - ay*by - az*bz,
-            aw*bx + ax*bw + ay*bz - az*by,
-            aw*by - ax*bz + ay*bw + az*bx,
-            aw*bz + ax*by - ay*bx + az*bw
-        ])
-
-    def _quat_to_euler(self, q):
-        # Convert quaternion to yaw, pitch, roll
-        w, x, y, z = q
-        # yaw (z-axis rotation)
-        t0 = +2.0 * (w*z + x*y)
-        t1 = +1.0 - 2.0 * (y*y + z*z)
-        yaw = np.arctan2(t0, t1)
-        # pitch (y-axis)
-        t2 = +2.0 * (w*y - z*x)
-        t2 = np.clip(t2, -1.0, 1.0)
-        pitch = np.arcsin(t2)
-        # roll (x-axis)
-        t3 = +2.0 * (w*x + y*z)
-        t4 = +1.0 - 2.0 * (x*x + y*y)
-        roll = np.arctan2(t3, t4)
-        return yaw, pitch, roll
+    def pose(self):
+        T = np.eye(4)
+        T[:3, :3] = quat_to_rot(self.x[6:10])
+        T[:3, 3] = self.x[0:3]
+        return T
@@ -0,0 +1,166 @@
+import cv2
+import numpy as np
+
+from include.frame_features import FrameFeatures
+from include.keyframe_selector import KeyframeSelector
+
+# Keyframe-driven tracking state for run_slam. Frames are matched against the
+# reference keyframe rather than the previous frame, so frames can be skipped
+# without losing anything but temporal resolution. The image parallax to the
+# keyframe is predicted from the last measured flow rate; while it stays below
+# min_parallax (stationary or crawling vehicle) frames are skipped before
+# matching, up to max_skip in a row. Triangulation, local BA and loop detection
+# only run when a new keyframe is inserted. Poses are world-to-camera.
+
+class KeyframeTracker:
+    def __init__(self, K, map_manager, local_mapper, kf_dist=0.5, loop_closer=None,
+                 min_parallax=1.0, max_skip=5):
+        self.K = K
+        self.map_mgr = map_manager
+        self.local_mapper = local_mapper
+        self.selector = KeyframeSelector(map_manager, local_mapper, self.init_done,
+                                         trans_thresh=kf_dist)
+        self.loop_closer = loop_closer
+        self.min_parallax = min_parallax
+        self.max_skip = max_skip
+        self.kf_id = None
+        self.kf_feat = None
+        self.kf_lm = None                # landmark id per keyframe feature, -1 = none
+        self.kf_tracked = 0
+        self.flow_rate = None            # median pixel flow per frame
+        self.last_checked = None
+        self.n_keyframes = 0
+        self.loops = []                  # (kf_id, candidate kf_ids)
+        self._kf_pose = None
+
+    @property
+    def kf_pose(self):
+        # local BA may have refined the reference keyframe in the meantime
+        return self.local_mapper.window_poses().get(self.kf_id, self._kf_pose)
+
+    def init_done(self):
+        return self.kf_id is not None
+
+    def reset(self, idx, feat, pose, insert=True):
+        # new reference keyframe; insert=False only re-anchors tracking
+        self.kf_id, self.kf_feat, self._kf_pose = idx, feat, pose
+        self.kf_lm = np.full(len(feat), -1, np.int64)
+        self.last_checked = idx
+        if insert:
+            # background BA writes the map under this lock (LocalMapper.add_keyframe
+            # takes it itself)
+            with self.local_mapper.lock:
+                self.map_mgr.add_keyframe(idx, pose)
+            self.local_mapper.add_keyframe(idx, pose, np.empty(0, np.int64),
+                                           pts=np.empty((0, 2), np.float32))
+            self.n_keyframes += 1
+            self._detect_loop(idx, feat)
+
+    def should_skip(self, idx):
+        if self.flow_rate is None:
+            return False
+        predicted = self.flow_rate * (idx - self.kf_id)
+        return predicted < self.min_parallax and idx - self.last_checked <= self.max_skip
+
+    def parallax(self, idx, pts1, pts2):
+        p = float(np.median(np.linalg.norm(pts2 - pts1, axis=1))) if len(pts1) else 0.0
+        self.flow_rate = p / max(idx - self.kf_id, 1)
+        self.last_checked = idx
+        return p
+
+    def scale(self, q, pts1, pts2, R, tvec, min_points=5):
+        # length of the unit VO translation in map units: depths of the landmarks
+        # the keyframe already observes vs. the same points triangulated with a
+        # unit baseline. None until the keyframe has enough landmarks.
+        lm = self.kf_lm[q]
+        have = lm >= 0
+        if have.sum() < min_points:
+            return None
+        kf_pose = self.kf_pose
+        X = self.map_mgr.landmarks[lm[have]]
+        z_map = X @ kf_pose[2, :3] + kf_pose[2, 3]
+        P1 = self.K @ np.hstack((np.eye(3), np.zeros((3, 1))))
+        P2 = self.K @ np.hstack((R, tvec.reshape(3, 1)))
+        Xh = cv2.triangulatePoints(P1, P2, pts1[have].T.astype(np.float64),
+                                   pts2[have].T.astype(np.float64))
+        z_unit = Xh[2] / Xh[3]
+        ok = (z_map > 0) & (z_unit > 0) & np.isfinite(z_unit)
+        if ok.sum() < min_points:
+            return None
+        return float(np.median(z_map[ok] / z_unit[ok]))
+
+    def need_keyframe(self, pose, n_inliers):
+        # selector compares camera centers, so hand it camera-to-world poses
+        return self.selector.need_new_keyframe(np.linalg.inv(self.kf_pose), np.linalg.inv(pose),
+                                               n_inliers, self.kf_tracked)
+
+    def add_keyframe(self, idx, feat, pose, q, t):
+        # q, t: inlier matches (keyframe feature, current feature). Matches whose
+        # keyframe feature already has a landmark extend its track, the others are
+        # triangulated.
+        kf_id, kf_pose = self.kf_id, self.kf_pose
+        lm = self.kf_lm[q]
+        new = lm < 0
+        with self.local_mapper.lock:
+            if kf_id not in self.map_mgr.kf_index:
+                # reference re-anchored after a tracking loss (reset(insert=False)):
+                # it enters the map now that landmarks are observed from it
+                self.map_mgr.add_keyframe(kf_id, kf_pose)
+            self.map_mgr.add_keyframe(idx, pose)
+            if new.any():
+                P1, P2 = self.K @ kf_pose[:3], self.K @ pose[:3]
+                ids = self.map_mgr.triangulate(P1, P2, self.kf_feat.pts[q[new]].astype(np.float64),
+                                               feat.pts[t[new]].astype(np.float64),
+                                               des=feat.des[t[new]])
+                X = self.map_mgr.landmarks[ids]
+                z1 = X @ kf_pose[2, :3] + kf_pose[2, 3]
+                z2 = X @ pose[2, :3] + pose[2, 3]
+                ok = np.isfinite(X).all(axis=1) & (z1 > 0) & (z2 > 0)
+                # rejected points stay in the map unobserved (ids are dense)
+                lm[np.flatnonzero(new)[ok]] = ids[ok]
+                new_ids, new_q = ids[ok], q[new][ok]
+                self.kf_lm[new_q] = new_ids
+                self.map_mgr.add_observations(new_ids, kf_id)
+            else:
+                new_ids, new_q = np.empty(0, np.int64), np.empty(0, np.int64)
+            seen = lm >= 0
+            self.map_mgr.add_observations(lm[seen], idx)
+        self.local_mapper.add_observations(kf_id, new_ids, self.kf_feat.pts[new_q])
+
+        self.reset(idx, feat, pose, insert=False)
+        self.kf_lm[t[seen]] = lm[seen]
+        self.kf_tracked = int(seen.sum())
+        self.local_mapper.add_keyframe(idx, pose, lm[seen], pts=feat.pts[t[seen]])
+        self.n_keyframes += 1
+        self.local_mapper.request_optimize()
+        self._detect_loop(idx, feat)
+        return self.kf_tracked
+
+    def snapshot(self):
+        if self.kf_id is None:
+            return {}
+        flow = np.nan if self.flow_rate is None else self.flow_rate
+        return {'kf_id': np.int64(self.kf_id), 'kf_pose': np.asarray(self._kf_pose),
+                'kf_lm': self.kf_lm, 'kf_kp': self.kf_feat.to_array(),
+                'kf_des': self.kf_feat.des if self.kf_feat.des is not None else np.empty((0, 32), np.uint8),
+                'kf_scalars': np.array([self.kf_tracked, flow, self.last_checked, self.n_keyframes])}
+
+    def restore(self, d):
+        # an inserted keyframe is already in the map and the BA window
+        if 'kf_id' not in d:
+            return
+        self.kf_id = int(d['kf_id'])
+        self._kf_pose = np.array(d['kf_pose'])
+        self.kf_feat = FrameFeatures.from_array(d['kf_kp'], d['kf_des'])
+        self.kf_lm = np.array(d['kf_lm'])
+        tracked, flow, last, n = d['kf_scalars']
+        self.kf_tracked, self.last_checked, self.n_keyframes = int(tracked), int(last), int(n)
+        self.flow_rate = None if np.isnan(flow) else float(flow)
+
+    def _detect_loop(self, idx, feat):
+        if self.loop_closer is None or feat.des is None:
+            return
+        cands = self.loop_closer.detect_loop(feat.des)
+        if cands:
+            self.loops.append((idx, cands))
+        self.loop_closer.insert_keyframe(idx, feat.des)
@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+
+# Optical-flow front end: previous points are propagated with pyramidal
+# Lucas-Kanade flow, and keypoint detection (no descriptors) only runs when
+# too few points survive. track() returns matched (pts1, pts2) arrays for the
+# essential-matrix stage, best tracks first (LK error, or the forward-backward
+# error with fb_thresh set), the match-quality order PROSAC samples in. The
+# forward-backward check costs a second LK pass per frame, so it is opt-in.
+
+class KLTTracker:
+    def __init__(self, extractor, min_tracked=400, win_size=(15, 15), max_level=3,
+                 fb_thresh=None):
+        self.extractor = extractor
+        self.min_tracked = min_tracked
+        self.fb_thresh = fb_thresh
+        self.lk_params = dict(
+            winSize=win_size,
+            maxLevel=max_level,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01)
+        )
+        self.prev_gray = None
+        self.prev_pts = np.empty((0, 2), dtype=np.float32)
+        self.since_detect = 0
+        self.n_detections = 0
+
+    def reset(self, gray):
+        self.prev_gray = gray
+        self._detect(gray)
+
+    def snapshot(self):
+        return {'klt_pts': self.prev_pts,
+                'klt_counts': np.array([self.since_detect, self.n_detections])}
+
+    def restore(self, d, gray):
+        # gray: the frame prev_pts were tracked into (re-decoded by the caller)
+        self.prev_gray = gray
+        self.prev_pts = np.array(d['klt_pts'], dtype=np.float32).reshape(-1, 2)
+        self.since_detect, self.n_detections = (int(v) for v in d['klt_counts'][:2])
+
+    def track(self, gray):
+        if self.prev_gray is None:
+            self.reset(gray)
+            return self.prev_pts[:0], self.prev_pts[:0]
+
+        pts1 = self.prev_pts
+        pts2 = pts1[:0]
+        if len(pts1):
+            p0 = pts1.reshape(-1, 1, 2)
+            p1, st, err = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, p0, None, **self.lk_params)
+            good = st.ravel() == 1
+            quality = err.ravel()
+            if self.fb_thresh is not None:
+                # forward-backward consistency rejects drifting tracks
+                p0r, st_b, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, p1, None, **self.lk_params)
+                fb = np.linalg.norm((p0 - p0r).reshape(-1, 2), axis=1)
+                good &= (st_b.ravel() == 1) & (fb < self.fb_thresh)
+                quality = fb
+            h, w = gray.shape[:2]
+            p1 = p1.reshape(-1, 2)
+            good &= (p1[:, 0] >= 0) & (p1[:, 0] < w) & (p1[:, 1] >= 0) & (p1[:, 1] < h)
+            good = np.flatnonzero(good)
+            good = good[np.argsort(quality[good], kind='stable')]
+            pts1, pts2 = pts1[good], p1[good]
+
+        self.prev_gray = gray
+        self.since_detect += 1
+        if len(pts2) < self.min_tracked:
+            self._detect(gray)
+        else:
+            self.prev_pts = np.ascontiguousarray(pts2, dtype=np.float32)
+        return pts1, pts2
+
+    def _detect(self, gray):
+        self.prev_pts = self.extractor.detect_points(gray)
+        self.since_detect = 0
+        self.n_detections += 1
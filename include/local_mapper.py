@@ -1,11 +1,170 @@
+import threading
+import time
+
+import numpy as np
+
+from include.bundle_adjuster import BundleAdjuster
+
+# Sliding window of keyframes for local bundle adjustment. Each window entry is
+# (kf_id, pose, lm_ids, pts): a world-to-camera pose plus the landmark ids it
+# observes and their pixel positions. optimize() runs the windowed BA
+# synchronously; start() moves it onto a background thread that tracking only
+# ever signals (request_optimize), so the frame loop is never blocked by BA.
+# Refined poses/landmarks are written back to the window and the MapManager.
+
 class LocalMapper:
-    def __init__(self, K, window_size=5):
+    def __init__(self, K, window_size=5, map_manager=None, max_iters=5, n_fixed=1):
         self.K = K
         self.window = []
         self.window_size = window_size
-    def add_keyframe(self, kf_id, pose, lm_ids, desc=None):
-        self.window.append((kf_id, pose, lm_ids))
-        if len(self.window) > self.window_size:
-            self.window.pop(0)
+        self.map_mgr = map_manager
+        self.ba = BundleAdjuster(max_iters=max_iters, n_fixed=n_fixed)
+        self.lock = threading.Lock()
+        self.last_stats = None
+        self.stats = []
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._stopped = threading.Event()
+        self.busy = False
+
+    def add_keyframe(self, kf_id, pose, lm_ids, desc=None, pts=None):
+        with self.lock:
+            self.window.append((kf_id, pose, lm_ids, pts))
+            if len(self.window) > self.window_size:
+                self.window.pop(0)
+
+    def add_observations(self, kf_id, lm_ids, pts):
+        # landmarks triangulated after kf_id entered the window (e.g. against the
+        # next keyframe) are appended to its entry
+        with self.lock:
+            for i, (kf, pose, ids, old) in enumerate(self.window):
+                if kf == kf_id:
+                    ids = lm_ids if ids is None else np.concatenate((ids, lm_ids))
+                    pts = pts if old is None else np.concatenate((old, pts))
+                    self.window[i] = (kf, pose, ids, pts)
+                    return
+
+    def window_poses(self):
+        with self.lock:
+            return {kf_id: pose for kf_id, pose, _, _ in self.window}
+
+    def snapshot(self):
+        # flat arrays for include/snapshot.py; caller holds self.lock
+        ids = [np.empty(0, np.int64) if w[2] is None else np.asarray(w[2], np.int64)
+               for w in self.window]
+        pts = [np.empty((0, 2), np.float32) if w[3] is None
+               else np.asarray(w[3], np.float32).reshape(-1, 2) for w in self.window]
+        return {'win_kf': np.array([w[0] for w in self.window], np.int64),
+                'win_pose': np.array([np.asarray(w[1])[:3] for w in self.window]).reshape(-1, 3, 4),
+                'win_counts': np.array([len(i) for i in ids], np.int64),
+                'win_lm': np.concatenate(ids) if ids else np.empty(0, np.int64),
+                'win_pts': np.concatenate(pts) if pts else np.empty((0, 2), np.float32)}
+
+    def restore(self, d):
+        if 'win_kf' not in d:
+            return
+        split = np.cumsum(d['win_counts'])[:-1]
+        poses = [np.vstack((P, [0, 0, 0, 1])) for P in d['win_pose']]
+        with self.lock:
+            self.window = list(zip(d['win_kf'].tolist(), poses, np.split(d['win_lm'], split),
+                                   np.split(d['win_pts'], split)))
+
     def optimize(self):
-        pass
\ No newline at end of file
+        with self.lock:
+            window = list(self.window)
+        if len(window) < 2 or self.map_mgr is None:
+            return None
+        problem = self._build_problem(window)
+        if problem is None:
+            return None
+        poses, lm_ids, cam_idx, pt_idx, uv = problem
+
+        t0 = time.perf_counter()
+        new_poses, new_points = self.ba.solve(self.K, poses, self.map_mgr.landmarks[lm_ids],
+                                              cam_idx, pt_idx, uv)
+        stats = {'window': len(window), 'landmarks': len(lm_ids), 'observations': len(uv),
+                 'ms': (time.perf_counter() - t0) * 1e3, 'iterations': self.ba.history}
+        if self.ba.history:
+            stats['cost'] = self.ba.history[-1]['cost']
+
+        with self.lock:
+            # keyframes added while BA ran are kept; refined ones are replaced in place
+            refined = {w[0]: T for w, T in zip(window, new_poses)}
+            self.window = [(kf, refined.get(kf, pose), ids, pts)
+                           for kf, pose, ids, pts in self.window]
+            for kf_id, T in refined.items():
+                self.map_mgr.add_keyframe(kf_id, T)
+            self.map_mgr.update_landmarks(lm_ids, new_points)
+        self.last_stats = stats
+        self.stats.append(stats)
+        return stats
+
+    def _build_problem(self, window):
+        poses, cams, lms, uvs = [], [], [], []
+        for c, (_, pose, ids, pts) in enumerate(window):
+            T = np.eye(4)
+            T[:3] = np.asarray(pose)[:3]
+            poses.append(T)
+            if pts is None or ids is None or not len(ids):
+                continue
+            ids = np.asarray(ids, dtype=np.int64)
+            cams.append(np.full(len(ids), c, np.int64))
+            lms.append(ids)
+            uvs.append(np.asarray(pts, dtype=np.float64).reshape(-1, 2))
+        if not lms:
+            return None
+        cam_idx, lm, uv = np.concatenate(cams), np.concatenate(lms), np.concatenate(uvs)
+
+        # only landmarks seen from at least two window keyframes constrain the poses
+        keep = np.isfinite(self.map_mgr.landmarks[lm]).all(axis=1)
+        lm_ids, pt_idx = np.unique(lm[keep], return_inverse=True)
+        seen = np.bincount(pt_idx, minlength=len(lm_ids))
+        multi = seen[pt_idx] >= 2
+        if not multi.any():
+            return None
+        lm_ids, pt_idx = np.unique(lm[keep][multi], return_inverse=True)
+        return (np.array(poses), lm_ids, cam_idx[keep][multi], pt_idx,
+                uv[keep][multi])
+
+    # --- background thread ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='local-mapper', daemon=True)
+            self._thread.start()
+        return self
+
+    def request_optimize(self):
+        # non-blocking: coalesces with any pending request
+        if self._thread is None:
+            return self.optimize()
+        self._wake.set()
+        return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.busy = True
+            try:
+                self.optimize()
+            finally:
+                self.busy = False
+        self._stopped.set()
+
+    def is_stopped(self):
+        return self._stopped.is_set()
+
+    def stop_requested(self):
+        return self._stop.is_set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._stopped.set()
@@ -1,30 +1,98 @@
 # Include/loop_closer.py
 
-# from pydbow3 import DBoW3  # Python bindings for DBoW3
-
-# class LoopCloser:
-#     """
-#     Detect loop closures using a Bag-of-Words database.
-#     """
-#     def __init__(self, vocab_path):
-#         # Load vocabulary and create a database
-#         self.vocab = DBoW3.Vocabulary(vocab_path)
-#         self.db    = DBoW3.Database(self.vocab, False, 0)
-#         self.kf_list = []  # list of (kf_idx, descriptors)
-
-#     def insert_keyframe(self, kf_idx, descriptors):
-#         """Add a new keyframe’s descriptors to the DB."""
-#         self.db.add(descriptors)
-#         self.kf_list.append((kf_idx, descriptors))
-
-#     def detect_loop(self, descriptors, score_thresh=0.1):
-#         """
-#         Query the database for similar keyframes.
-#         Returns: list of candidate kf_idx above the threshold.
-#         """
-#         results = self.db.query(descriptors, 4)
-#         loops = []
-#         for (kf_idx, _), score in zip(self.kf_list, results.score):
-#             if score > score_thresh:
-#                 loops.append(kf_idx)
-#         return loops
+import numpy as np
+
+from include.map_manager import _Growable
+from include.vocabulary import Vocabulary
+
+# Loop-closure candidates from a bag-of-words inverted file. Postings
+# (keyframe row, word, tf-idf weight) are appended to a tail and periodically
+# merged into word-sorted arrays (two sorted runs, so the stable sort is a linear
+# merge); a query gathers the posting ranges of its own words only, so the work
+# depends on how many keyframes share words with it, not on the database size.
+# Scores are the L1 similarity, accumulated per keyframe with one bincount.
+
+class LoopCloser:
+    def __init__(self, vocab, min_gap=30, top_k=4, compact_every=20000):
+        self.vocab = Vocabulary.load(vocab) if isinstance(vocab, str) else vocab
+        self.min_gap = min_gap           # most recent keyframes are never loop candidates
+        self.top_k = top_k
+        self.compact_every = compact_every
+        self._kf = _Growable((), np.int64, 1024)          # kf_idx per database row
+        # word-sorted postings + CSR pointer over words
+        self._rows = np.empty(0, np.intp)                 # bincount-ready dtypes
+        self._weights = np.empty(0, np.float64)
+        self._words = np.empty(0, np.int32)
+        self._ptr = np.zeros(self.vocab.n_words + 1, np.int64)
+        # postings not merged yet
+        self._tail_rows = _Growable((), np.int32, 4096)
+        self._tail_words = _Growable((), np.int32, 4096)
+        self._tail_weights = _Growable((), np.float32, 4096)
+
+    @property
+    def kf_list(self):
+        return self._kf.view
+
+    def __len__(self):
+        return self._kf.n
+
+    def insert_keyframe(self, kf_idx, descriptors, bow=None):
+        """Add a new keyframe's descriptors to the DB."""
+        words, weights = self.vocab.transform(descriptors) if bow is None else bow
+        self._tail_rows.extend(np.full(len(words), self._kf.n, np.int32))
+        self._tail_words.extend(words)
+        self._tail_weights.extend(weights)
+        self._kf.extend([kf_idx])
+        if self._tail_rows.n >= self.compact_every:
+            self.compact()
+        return words, weights
+
+    def compact(self):
+        if not self._tail_rows.n:
+            return
+        words = np.concatenate((self._words, self._tail_words.view))
+        order = np.argsort(words, kind='stable')
+        self._words = words[order]
+        self._rows = np.concatenate((self._rows, self._tail_rows.view.astype(np.intp)))[order]
+        self._weights = np.concatenate((self._weights, self._tail_weights.view.astype(np.float64)))[order]
+        self._ptr = np.zeros(self.vocab.n_words + 1, np.int64)
+        np.cumsum(np.bincount(self._words, minlength=self.vocab.n_words), out=self._ptr[1:])
+        self._tail_rows.n = self._tail_words.n = self._tail_weights.n = 0
+
+    def query(self, descriptors, bow=None, exclude_recent=None):
+        """Score the database against a frame. Returns (kf_idx, score) arrays, best first."""
+        words, weights = self.vocab.transform(descriptors) if bow is None else bow
+        n = self._kf.n - (self.min_gap if exclude_recent is None else exclude_recent)
+        if n <= 0 or not len(words):
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+
+        # merged postings: concatenated [ptr[w], ptr[w+1]) ranges of the query words
+        start, stop = self._ptr[words], self._ptr[words + 1]
+        lens = stop - start
+        offs = np.cumsum(lens) - lens
+        idx = np.repeat(start - offs, lens) + np.arange(lens.sum())
+        rows, w = self._rows[idx], self._weights[idx]
+        q = np.repeat(weights.astype(np.float64), lens)
+
+        # tail postings: match against the (sorted, unique) query words
+        if self._tail_rows.n:
+            tw = self._tail_words.view
+            pos = np.minimum(np.searchsorted(words, tw), len(words) - 1)
+            hit = words[pos] == tw
+            rows = np.concatenate((rows, self._tail_rows.view[hit]))
+            w = np.concatenate((w, self._tail_weights.view[hit]))
+            q = np.concatenate((q, weights[pos[hit]]))
+
+        # per-word term of the L1 score: (|q| + |w| - |q - w|) / 2 = min(q, w)
+        scores = np.bincount(rows, weights=np.minimum(q, w), minlength=self._kf.n)[:n]
+        order = np.flatnonzero(scores > 0)
+        order = order[np.argsort(-scores[order], kind='stable')]
+        return self._kf.view[order], scores[order].astype(np.float32)
+
+    def detect_loop(self, descriptors, score_thresh=0.1, bow=None):
+        """
+        Query the database for similar keyframes.
+        Returns: list of candidate kf_idx above the threshold.
+        """
+        kf_ids, scores = self.query(descriptors, bow=bow)
+        return kf_ids[scores > score_thresh][:self.top_k].tolist()
@@ -1,23 +1,284 @@
+import json
+import os
+
 import numpy as np
 import cv2
 
+# Landmarks live in preallocated, geometrically grown NumPy arrays indexed by
+# landmark id (ids are dense, 0..n-1). Observations are appended to a flat
+# (landmark, keyframe) log and indexed as they arrive, so adding a keyframe
+# costs the same however long the drive: each keyframe keeps the (start, stop)
+# blocks of the log that belong to it, and each observation links back to the
+# previous observation of the same landmark (a per-landmark list in two flat
+# arrays). A voxel-grid hash indexes landmarks spatially so the local map
+# around a pose is gathered from nearby cells only; every landmark remembers
+# its voxel key and is moved out of the old voxel when BA moves it.
+
+class _Growable:
+    def __init__(self, shape_tail=(), dtype=np.float64, capacity=1024):
+        self.data = np.empty((capacity,) + tuple(shape_tail), dtype=dtype)
+        self.n = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        k = len(values)
+        if self.n + k > len(self.data):
+            cap = max(2 * len(self.data), self.n + k)
+            grown = np.empty((cap,) + self.data.shape[1:], dtype=self.data.dtype)
+            grown[:self.n] = self.data[:self.n]
+            self.data = grown
+        self.data[self.n:self.n + k] = values
+        self.n += k
+
+    @property
+    def view(self):
+        return self.data[:self.n]
+
+    @classmethod
+    def wrap(cls, array):
+        # adopt an existing (e.g. memory-mapped) array without copying; the
+        # first extend beyond it moves the data into a regular array
+        g = cls.__new__(cls)
+        g.data, g.n = array, len(array)
+        return g
+
+
 class MapManager:
-    def __init__(self, K):
+    def __init__(self, K, voxel_size=5.0):
         self.K = K
-        self.keyframes = {}
-        self.landmarks = {}
-        self.next_lm_id = 0
+        self.voxel_size = voxel_size
+        self.kf_index = {}                                # kf_id -> row
+        self.kf_ids = _Growable((), np.int64, 256)
+        self.kf_poses = _Growable((4, 4), np.float64, 256)
+        self._pos = _Growable((3,), np.float64)
+        self._n_obs = _Growable((), np.int32)
+        self._des = None
+        self._obs_lm = _Growable((), np.int64, 4096)
+        self._obs_kf = _Growable((), np.int64, 4096)      # keyframe rows, not ids
+        self._obs_prev = _Growable((), np.int64, 4096)    # previous obs of the landmark, -1
+        self._lm_last = _Growable((), np.int64)           # last obs per landmark, -1
+        self._kf_blocks = []                              # per keyframe row: [(start, stop)]
+        self._vox_key = _Growable((), np.int64)           # voxel key per landmark, -1 = none
+        self._voxels = {}
+
+    @property
+    def next_lm_id(self):
+        return self._pos.n
+
+    @property
+    def landmarks(self):
+        # (n, 3) positions; landmark id == row
+        return self._pos.view
+
+    @property
+    def descriptors(self):
+        return None if self._des is None else self._des.view
+
+    @property
+    def observation_counts(self):
+        return self._n_obs.view
+
+    def KeyFramesInMap(self):
+        return len(self.kf_index)
+
     def add_keyframe(self, kf_id, pose):
-        self.keyframes[kf_id] = {'pose': pose, 'lm_ids': []}
-    def triangulate(self, pose1, pose2, pts1, pts2):
+        if kf_id in self.kf_index:
+            self.kf_poses.data[self.kf_index[kf_id]] = pose
+            return
+        self.kf_index[kf_id] = self.kf_ids.n
+        self.kf_ids.extend([kf_id])
+        self.kf_poses.extend([pose])
+        self._kf_blocks.append([])
+
+    def keyframe_pose(self, kf_id):
+        return self.kf_poses.data[self.kf_index[kf_id]]
+
+    def triangulate(self, pose1, pose2, pts1, pts2, des=None):
         pts4 = cv2.triangulatePoints(pose1[:3], pose2[:3], pts1.T, pts2.T)
         pts3 = (pts4[:3] / pts4[3]).T
-        ids = []
-        for P in pts3:
-            lm_id = self.next_lm_id
-            self.landmarks[lm_id] = P
-            ids.append(lm_id)
-            self.next_lm_id += 1
+        return self.add_landmarks(pts3, des)
+
+    def add_landmarks(self, positions, des=None):
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        ids = np.arange(self._pos.n, self._pos.n + len(positions))
+        self._pos.extend(positions)
+        self._n_obs.extend(np.zeros(len(positions), np.int32))
+        self._lm_last.extend(np.full(len(positions), -1, np.int64))
+        self._vox_key.extend(np.full(len(positions), -1, np.int64))
+        if des is not None:
+            des = np.asarray(des)
+            if self._des is None:
+                self._des = _Growable(des.shape[1:], des.dtype, len(self._pos.data))
+                self._des.extend(np.zeros((ids[0],) + des.shape[1:], des.dtype))
+            self._des.extend(des)
+        elif self._des is not None:
+            self._des.extend(np.zeros((len(positions),) + self._des.data.shape[1:], self._des.data.dtype))
+        self._index_voxels(ids, positions)
         return ids
+
+    def update_landmarks(self, ids, positions):
+        # e.g. after bundle adjustment; points that changed voxel are moved there
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        self._pos.data[ids] = positions
+        moved = self._keys(positions) != self._vox_key.data[ids]
+        self._unindex_voxels(ids[moved])
+        self._index_voxels(ids[moved], positions[moved])
+
     def add_observation(self, lm_id, kf_id):
-        self.keyframes[kf_id]['lm_ids'].append(lm_id)
\ No newline at end of file
+        self.add_observations(np.atleast_1d(lm_id), kf_id)
+
+    def add_observations(self, lm_ids, kf_id):
+        lm_ids = np.asarray(lm_ids, dtype=np.int64)
+        start, row = self._obs_lm.n, self.kf_index[kf_id]
+        self._obs_lm.extend(lm_ids)
+        self._obs_kf.extend(np.full(len(lm_ids), row, np.int64))
+        self._link(lm_ids, start)
+        np.add.at(self._n_obs.data, lm_ids, 1)
+        if len(lm_ids):
+            self._kf_blocks[row].append((start, start + len(lm_ids)))
+
+    def _link(self, lm_ids, start):
+        # observations start.. of lm_ids join the per-landmark lists, in log order
+        # (a landmark may appear more than once in lm_ids)
+        if not len(lm_ids):
+            return
+        obs = start + np.arange(len(lm_ids))
+        order = np.argsort(lm_ids, kind='stable')
+        lm, obs = lm_ids[order], obs[order]
+        first = np.r_[True, lm[1:] != lm[:-1]]
+        last = np.r_[lm[1:] != lm[:-1], True]
+        prev = np.r_[-1, obs[:-1]]
+        prev[first] = self._lm_last.data[lm[first]]
+        self._obs_prev.extend(np.empty(len(obs), np.int64))
+        self._obs_prev.data[obs] = prev
+        self._lm_last.data[lm[last]] = obs[last]
+
+    def keyframe_landmarks(self, kf_id):
+        lm = self._obs_lm.data
+        blocks = self._kf_blocks[self.kf_index[kf_id]]
+        if len(blocks) == 1:
+            return lm[blocks[0][0]:blocks[0][1]]
+        return np.concatenate([lm[a:b] for a, b in blocks] or [np.empty(0, np.int64)])
+
+    def landmark_keyframes(self, lm_id):
+        # walks the landmark's own observations only
+        rows, o = [], int(self._lm_last.data[lm_id])
+        while o >= 0:
+            rows.append(self._obs_kf.data[o])
+            o = int(self._obs_prev.data[o])
+        return self.kf_ids.view[np.array(rows[::-1], np.int64)]
+
+    # --- persistence (include/snapshot.py format) ---
+
+    def snapshot(self):
+        # append-only logs are returned as views, arrays that BA updates as copies
+        out = {'map_kf_ids': self.kf_ids.view, 'map_kf_poses': self.kf_poses.view.copy(),
+               'map_pos': self._pos.view.copy(), 'map_n_obs': self._n_obs.view.copy(),
+               'map_obs_lm': self._obs_lm.view, 'map_obs_kf': self._obs_kf.view}
+        if self._des is not None:
+            out['map_des'] = self._des.view
+        return out
+
+    @classmethod
+    def from_snapshot(cls, K, arrays, voxel_size=5.0):
+        # arrays may be memmaps: they are adopted as-is, only the voxel index is rebuilt
+        m = cls(K, voxel_size)
+        m.kf_ids = _Growable.wrap(arrays['map_kf_ids'])
+        m.kf_poses = _Growable.wrap(arrays['map_kf_poses'])
+        m.kf_index = {int(k): i for i, k in enumerate(m.kf_ids.view)}
+        m._pos = _Growable.wrap(arrays['map_pos'])
+        m._n_obs = _Growable.wrap(arrays['map_n_obs'])
+        m._obs_lm = _Growable.wrap(arrays['map_obs_lm'])
+        m._obs_kf = _Growable.wrap(arrays['map_obs_kf'])
+        if 'map_des' in arrays:
+            m._des = _Growable.wrap(arrays['map_des'])
+        # the observation links and the voxel index are rebuilt, not stored
+        m._lm_last.extend(np.full(m._pos.n, -1, np.int64))
+        m._vox_key.extend(np.full(m._pos.n, -1, np.int64))
+        m._link(np.asarray(m._obs_lm.view), 0)
+        kf = np.asarray(m._obs_kf.view)
+        edges = np.flatnonzero(np.r_[True, kf[1:] != kf[:-1], True])
+        m._kf_blocks = [[] for _ in range(m.kf_ids.n)]
+        for a, b in zip(edges[:-1], edges[1:]):
+            m._kf_blocks[kf[a]].append((int(a), int(b)))
+        m._index_voxels(np.arange(m._pos.n), m._pos.view)
+        return m
+
+    def save(self, path):
+        from include.snapshot import write_arrays
+        manifest = write_arrays(path, self.snapshot())
+        with open(os.path.join(path, 'map.json'), 'w') as f:
+            json.dump({'K': np.asarray(self.K).tolist(), 'voxel_size': self.voxel_size,
+                       'arrays': manifest}, f)
+
+    @classmethod
+    def load(cls, path):
+        from include.snapshot import read_arrays
+        with open(os.path.join(path, 'map.json')) as f:
+            meta = json.load(f)
+        return cls.from_snapshot(np.array(meta['K']), read_arrays(path, meta['arrays']),
+                                 meta['voxel_size'])
+
+    def _voxel_keys(self, cells):
+        c = cells.astype(np.int64) + (1 << 20)
+        return (c[:, 0] << 42) | (c[:, 1] << 21) | c[:, 2]
+
+    def _keys(self, positions):
+        # voxel key per position, -1 for non-finite points (never indexed)
+        keys = np.full(len(positions), -1, np.int64)
+        ok = np.isfinite(positions).all(axis=1)
+        keys[ok] = self._voxel_keys(np.floor(positions[ok] / self.voxel_size))
+        return keys
+
+    def _index_voxels(self, ids, positions):
+        keys = self._keys(positions)
+        self._vox_key.data[ids] = keys
+        ok = keys >= 0
+        ids, keys = ids[ok], keys[ok]
+        if not len(ids):
+            return
+        order = np.argsort(keys, kind='stable')
+        keys, ids = keys[order], ids[order]
+        uniq, start = np.unique(keys, return_index=True)
+        for key, chunk in zip(uniq.tolist(), np.split(ids, start[1:])):
+            self._voxels.setdefault(key, []).append(chunk)
+
+    def _unindex_voxels(self, ids):
+        # drop ids from their current voxels, compacting each touched voxel
+        keys = self._vox_key.data[ids]
+        ok = keys >= 0
+        ids, keys = ids[ok], keys[ok]
+        self._vox_key.data[ids] = -1
+        if not len(ids):
+            return
+        order = np.argsort(keys, kind='stable')
+        keys, ids = keys[order], ids[order]
+        uniq, start = np.unique(keys, return_index=True)
+        for key, gone in zip(uniq.tolist(), np.split(ids, start[1:])):
+            kept = np.concatenate(self._voxels[key])
+            kept = kept[~np.isin(kept, gone)]
+            if len(kept):
+                self._voxels[key] = [kept]
+            else:
+                del self._voxels[key]
+
+    def local_landmarks(self, center, radius):
+        # ids of landmarks within `radius` of `center`, visiting only nearby voxels
+        center = np.asarray(center, dtype=np.float64).ravel()[:3]
+        lo = np.floor((center - radius) / self.voxel_size).astype(np.int64)
+        hi = np.floor((center + radius) / self.voxel_size).astype(np.int64)
+        grid = np.stack(np.meshgrid(*[np.arange(a, b + 1) for a, b in zip(lo, hi)],
+                                    indexing='ij'), axis=-1).reshape(-1, 3)
+        chunks = []
+        for key in self._voxel_keys(grid).tolist():
+            chunks.extend(self._voxels.get(key, ()))
+        if not chunks:
+            return np.empty(0, np.int64)
+        ids = np.concatenate(chunks)
+        d = np.linalg.norm(self._pos.data[ids] - center, axis=1)
+        return np.unique(ids[d <= radius])
+
+    def local_map(self, pose, radius=50.0):
+        ids = self.local_landmarks(pose[:3, 3], radius)
+        return ids, self._pos.data[ids]
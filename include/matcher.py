@@ -1,11 +1,33 @@
 import cv2
+import numpy as np
+
+
+def _descriptors(x):
+    # matchers take raw descriptor matrices or FrameFeatures
+    return getattr(x, 'des', x)
+
+
+def _strongest(feat, max_matches, query_factor):
+    # query rows to search under a max_matches cap (the query_factor * max_matches
+    # strongest by response, FrameFeatures input only), None for all
+    response = getattr(feat, 'response', None)
+    if not max_matches or response is None:
+        return None
+    n = int(query_factor * max_matches)
+    if len(response) <= n:
+        return None
+    return np.sort(np.argsort(-response, kind='stable')[:n])
+
 
 # Brute force matcher for orb descriptor.
 class Matcher:
-    def __init__(self):
+    def __init__(self, max_matches=200):
         self.bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+        self.max_matches = max_matches
 
-    def match(self, des1, des2, max_matches=200):
+    def match(self, des1, des2, max_matches=None):
+        max_matches = self.max_matches if max_matches is None else max_matches
+        des1, des2 = _descriptors(des1), _descriptors(des2)
         if des1 is None or des2 is None or len(des1) == 0 or len(des2) == 0:
             return []
         matches = self.bf.match(des1, des2)
@@ -14,7 +36,12 @@ class Matcher:
 
 
 class FlannMatcher:
-    def __init__(self):
+    # max_matches also bounds the search: with FrameFeatures input only the
+    # query_factor * max_matches strongest query keypoints (by response) are
+    # searched, the rest are never looked up
+    def __init__(self, max_matches=None, query_factor=2):
+        self.max_matches = max_matches
+        self.query_factor = query_factor
         FLANN_INDEX_LSH = 6
         index_params = dict(
             algorithm=FLANN_INDEX_LSH,
@@ -26,8 +53,12 @@ class FlannMatcher:
         self.flann = cv2.FlannBasedMatcher(index_params, search_params)
 
     def match(self, des1, des2, ratio=0.7):
+        sel = _strongest(des1, self.max_matches, self.query_factor)
+        des1, des2 = _descriptors(des1), _descriptors(des2)
         if des1 is None or des2 is None or len(des1) == 0 or len(des2) == 0:
             return []
+        if sel is not None:
+            des1 = des1[sel]
         raw_matches = self.flann.knnMatch(des1, des2, k=2)
         good = []
         for pair in raw_matches:
@@ -36,5 +67,141 @@ class FlannMatcher:
                 continue
             m, n = pair
             if m.distance < ratio * n.distance:
+                if sel is not None:
+                    m.queryIdx = int(sel[m.queryIdx])
                 good.append(m)
-        return sorted(good, key=lambda m: m.distance)
+        return sorted(good, key=lambda m: m.distance)[:self.max_matches]
+
+
+# Vectorized Hamming matching on packed binary descriptors (ORB: 32 uint8 per row).
+# Distances are computed tile by tile, either as popcount(xor) over 64-bit words or
+# (default) through the identity popcount(a ^ b) = (nbits - <sa, sb>) / 2 with
+# sa, sb the bits mapped to +-1, which turns each tile into one BLAS matrix
+# product. The ratio test / mutual check are done as array operations. Results
+# come back as index and distance arrays instead of DMatch objects.
+
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _pack_words(des):
+    des = np.ascontiguousarray(des, dtype=np.uint8)
+    pad = (-des.shape[1]) % 8
+    if pad:
+        des = np.hstack((des, np.zeros((len(des), pad), dtype=np.uint8)))
+    return des.view(np.uint64)
+
+
+def _popcount(x):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def _popcount_tile(w1, w2):
+    # one 64-bit word column at a time keeps the temporaries 2-D
+    D = np.zeros((len(w1), len(w2)), dtype=np.uint16)
+    for k in range(w1.shape[1]):
+        D += _popcount(w1[:, None, k] ^ w2[None, :, k])
+    return D
+
+
+def _signed_bits(des):
+    bits = np.unpackbits(np.ascontiguousarray(des, dtype=np.uint8), axis=1)
+    return bits.astype(np.float32) * 2 - 1
+
+
+def _gemm_tile(s1, s2):
+    return ((s1.shape[1] - s1 @ s2.T) * 0.5).astype(np.uint16)
+
+
+def hamming_distances(des1, des2, tile=256, method='gemm'):
+    if method == 'gemm':
+        x1, x2, fn = _signed_bits(des1), _signed_bits(des2), _gemm_tile
+    else:
+        x1, x2, fn = _pack_words(des1), _pack_words(des2), _popcount_tile
+    D = np.empty((len(x1), len(x2)), dtype=np.uint16)
+    for a in range(0, len(x1), tile):
+        D[a:a + tile] = fn(x1[a:a + tile], x2)
+    return D
+
+
+class MatchArrays:
+    __slots__ = ('query_idx', 'train_idx', 'distance')
+
+    def __init__(self, query_idx, train_idx, distance):
+        self.query_idx = query_idx
+        self.train_idx = train_idx
+        self.distance = distance
+
+    def __len__(self):
+        return len(self.query_idx)
+
+    def __getitem__(self, sel):
+        return MatchArrays(self.query_idx[sel], self.train_idx[sel], self.distance[sel])
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, np.int32), np.empty(0, np.int32), np.empty(0, np.float32))
+
+
+class HammingMatcher:
+    # max_matches bounds the distance computation like FlannMatcher's: only the
+    # query_factor * max_matches strongest query keypoints are matched
+    def __init__(self, ratio=0.7, cross_check=True, max_matches=None, tile=512, method='gemm',
+                 query_factor=2):
+        self.ratio = ratio
+        self.cross_check = cross_check
+        self.max_matches = max_matches
+        self.query_factor = query_factor
+        self.tile = tile
+        self.method = method
+
+    def match(self, des1, des2, ratio=None):
+        sel = _strongest(des1, self.max_matches, self.query_factor)
+        des1, des2 = _descriptors(des1), _descriptors(des2)
+        if des1 is None or des2 is None or len(des1) == 0 or len(des2) == 0:
+            return MatchArrays.empty()
+        if sel is not None:
+            des1 = des1[sel]
+        ratio = self.ratio if ratio is None else ratio
+        if self.method == 'gemm':
+            x1, x2, dist = _signed_bits(des1), _signed_bits(des2), _gemm_tile
+        else:
+            x1, x2, dist = _pack_words(des1), _pack_words(des2), _popcount_tile
+        n1, n2 = len(x1), len(x2)
+
+        best = np.empty(n1, dtype=np.int64)
+        d1 = np.empty(n1, dtype=np.uint16)
+        d2 = np.full(n1, np.iinfo(np.uint16).max, dtype=np.uint16)
+        col_best = np.zeros(n2, dtype=np.int64)
+        col_d = np.full(n2, np.iinfo(np.uint16).max, dtype=np.uint16)
+        rows = np.arange(min(self.tile, n1))
+
+        for a in range(0, n1, self.tile):
+            D = dist(x1[a:a + self.tile], x2)
+            r = rows[:len(D)]
+            j = D.argmin(axis=1)
+            best[a:a + len(D)] = j
+            d1[a:a + len(D)] = D[r, j]
+            if n2 > 1:
+                D[r, j] = np.iinfo(np.uint16).max
+                d2[a:a + len(D)] = D.min(axis=1)
+                D[r, j] = d1[a:a + len(D)]
+            if self.cross_check:
+                i = D.argmin(axis=0)
+                di = D[i, np.arange(n2)]
+                better = di < col_d
+                col_d[better] = di[better]
+                col_best[better] = i[better] + a
+
+        keep = d1 < ratio * d2.astype(np.float32) if ratio else np.ones(n1, dtype=bool)
+        if self.cross_check:
+            keep &= col_best[best] == np.arange(n1)
+
+        q = np.flatnonzero(keep)
+        order = np.argsort(d1[q], kind='stable')
+        if self.max_matches:
+            order = order[:self.max_matches]
+        q = q[order]
+        return MatchArrays((q if sel is None else sel[q]).astype(np.int32),
+                           best[q].astype(np.int32), d1[q].astype(np.float32))
@@ -0,0 +1,120 @@
+import queue
+import threading
+
+from utils.profiler import NullProfiler
+
+# Frame sources for run_slam. Both yield (idx, gray, FrameFeatures) in frame order, so
+# the downstream matching / pose code is the same whichever one is used.
+
+_DONE = object()
+
+
+def _extract(extractor, idx, gray):
+    # no extractor: decode-only source (the KLT front end detects on its own)
+    if extractor is None:
+        return None
+    # feature stores look frames up by index instead of recomputing them
+    if hasattr(extractor, 'extract_frame'):
+        return extractor.extract_frame(idx, gray)
+    return extractor.extract_features(gray)
+
+
+def sequential_frames(data, extractor, start=0, profiler=None, skip=None):
+    # skip(idx) -> True yields (idx, None, None) without decoding; it is asked
+    # only after the caller finished the previous frame
+    prof = profiler or NullProfiler()
+    for idx in range(start, len(data)):
+        if skip is not None and skip(idx):
+            yield idx, None, None
+            continue
+        with prof.stage('decode'):
+            gray = data.get_frame(idx)
+        with prof.stage('extract'):
+            feat = _extract(extractor, idx, gray)
+        yield idx, gray, feat
+
+
+class FramePipeline:
+    # decode -> extract run on their own worker threads, connected by bounded
+    # queues; the consumer (matching, pose, visualization) stays on the caller's
+    # thread. With depth=1 frame i+1 is extracted and i+2 decoded while the
+    # caller works on frame i.
+
+    def __init__(self, data, extractor, start=0, depth=1, profiler=None):
+        self.data = data
+        self.extractor = extractor
+        self.prof = profiler or NullProfiler()
+        self.start = start
+        self.decoded = queue.Queue(maxsize=depth)
+        self.extracted = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._decode_loop, daemon=True),
+            threading.Thread(target=self._extract_loop, daemon=True),
+        ]
+
+    def __iter__(self):
+        for t in self._threads:
+            t.start()
+        try:
+            while True:
+                item = self.extracted.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
+        # drain so blocked producers can observe the stop flag
+        for q in (self.decoded, self.extracted):
+            try:
+                while True:
+                    q.get_nowait()
+            except queue.Empty:
+                pass
+        for t in self._threads:
+            if t.is_alive() and t is not threading.current_thread():
+                t.join(timeout=1.0)
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode_loop(self):
+        try:
+            for idx in range(self.start, len(self.data)):
+                with self.prof.stage('decode'):
+                    gray = self.data.get_frame(idx)
+                if not self._put(self.decoded, (idx, gray)):
+                    return
+            self._put(self.decoded, _DONE)
+        except BaseException as e:
+            self._put(self.decoded, e)
+
+    def _extract_loop(self):
+        while not self._stop.is_set():
+            try:
+                item = self.decoded.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE or isinstance(item, BaseException):
+                self._put(self.extracted, item)
+                return
+            idx, gray = item
+            try:
+                with self.prof.stage('extract'):
+                    feats = _extract(self.extractor, idx, gray)
+            except BaseException as e:
+                self._put(self.extracted, e)
+                return
+            if not self._put(self.extracted, (idx, gray, feats)):
+                return
@@ -1,4 +1,5 @@
 import cv2
+import numpy as np
 
 class PoseEstimator:
 
@@ -6,7 +7,22 @@ class PoseEstimator:
         self.focal = focal
         self.pp = pp
 
-    def recover(self, E, pts1, pts2):
+    def recover(self, E, pts1, pts2, mask=None):
+        # with an inlier mask only the inliers go through the cheirality check;
+        # the returned mask is still aligned with the full pts1/pts2. Fewer than
+        # five inliers cannot determine a pose: R and t are None then.
+        if mask is not None:
+            inl = np.flatnonzero(np.asarray(mask).ravel())
+            if len(inl) < 5:
+                return None, None, mask
+            _, R, t, sub = cv2.recoverPose(
+                E, pts1[inl], pts2[inl],
+                focal=self.focal,
+                pp=self.pp
+            )
+            full = np.zeros((len(pts1), 1), dtype=np.uint8)
+            full[inl] = sub.reshape(-1, 1)
+            return R, t, full
 
         _, R, t, mask = cv2.recoverPose(
             E, pts1, pts2,
@@ -1,16 +1,316 @@
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import linalg as splinalg
+
+from include.map_manager import _Growable
+
+# SE(3) pose graph. Nodes are body-to-world poses T_i (like the trajectory
+# run_slam accumulates), edges are relative measurements Z_ij ~ T_i^-1 T_j with a
+# 6x6 information matrix; tangent vectors are [omega, v] as in bundle_adjuster.
+# Error e_ij = log(Z_ij^-1 T_i^-1 T_j); poses are perturbed in their own frame,
+# T <- T exp(d), which keeps the system well conditioned far from the origin.
+# Everything is batched over edges; the normal equations are assembled as a
+# sparse block matrix and solved with a sparse direct (SuperLU, minimum-degree
+# ordering) or block-Jacobi preconditioned CG solver.
+# optimize(incremental=True) only relinearizes and solves the region from the
+# oldest node touched since the last call to the newest node; older nodes are
+# held fixed, so odometry-only updates stay O(new nodes) on long drives.
+
+def _hat(w):
+    W = np.zeros(w.shape[:-1] + (3, 3))
+    W[..., 0, 1], W[..., 0, 2] = -w[..., 2], w[..., 1]
+    W[..., 1, 0], W[..., 1, 2] = w[..., 2], -w[..., 0]
+    W[..., 2, 0], W[..., 2, 1] = -w[..., 1], w[..., 0]
+    return W
+
+
+def se3_exp_batch(xi):
+    # (n, 6) -> (n, 4, 4)
+    w, v = xi[:, :3], xi[:, 3:]
+    th = np.linalg.norm(w, axis=1)
+    small = th < 1e-8
+    ts = np.where(small, 1.0, th)
+    a = np.where(small, 1.0, np.sin(ts) / ts)
+    b = np.where(small, 0.5, (1 - np.cos(ts)) / ts**2)
+    c = np.where(small, 1.0 / 6, (ts - np.sin(ts)) / ts**3)
+    W = _hat(w)
+    W2 = W @ W
+    I = np.eye(3)
+    T = np.tile(np.eye(4), (len(xi), 1, 1))
+    T[:, :3, :3] = I + a[:, None, None] * W + b[:, None, None] * W2
+    V = I + b[:, None, None] * W + c[:, None, None] * W2
+    T[:, :3, 3] = np.einsum('nij,nj->ni', V, v)
+    return T
+
+
+def se3_log_batch(T):
+    # (n, 4, 4) -> (n, 6)
+    R, t = T[:, :3, :3], T[:, :3, 3]
+    cos = np.clip((np.trace(R, axis1=1, axis2=2) - 1) / 2, -1.0, 1.0)
+    th = np.arccos(cos)
+    vee = np.stack((R[:, 2, 1] - R[:, 1, 2], R[:, 0, 2] - R[:, 2, 0], R[:, 1, 0] - R[:, 0, 1]), axis=1)
+    small = th < 1e-8
+    s = np.sin(th)
+    f = np.where(small, 0.5, th / (2 * np.where(small, 1.0, s)))
+    w = f[:, None] * vee
+    for k in np.flatnonzero(np.pi - th < 1e-4):
+        # near pi the antisymmetric part vanishes; take the axis from R + I
+        B = (R[k] + np.eye(3)) / 2
+        i = np.argmax(np.diag(B))
+        axis = B[:, i] / np.sqrt(max(B[i, i], 1e-12))
+        w[k] = th[k] * axis / np.linalg.norm(axis)
+    W = _hat(w)
+    ts = np.where(small, 1.0, th)
+    c = np.where(small, 1.0 / 12, (1 - ts * np.sin(ts) / (2 * (1 - np.cos(ts)))) / ts**2)
+    Vinv = np.eye(3) - 0.5 * W + c[:, None, None] * (W @ W)
+    return np.concatenate((w, np.einsum('nij,nj->ni', Vinv, t)), axis=1)
+
+
+def _inv(T):
+    out = np.tile(np.eye(4), (len(T), 1, 1))
+    Rt = np.swapaxes(T[:, :3, :3], 1, 2)
+    out[:, :3, :3] = Rt
+    out[:, :3, 3] = -np.einsum('nij,nj->ni', Rt, T[:, :3, 3])
+    return out
+
+
+def _adjoint(T):
+    # Ad_T for [omega, v]: [[R, 0], [t^ R, R]]
+    R, t = T[:, :3, :3], T[:, :3, 3]
+    A = np.zeros((len(T), 6, 6))
+    A[:, :3, :3] = R
+    A[:, 3:, 3:] = R
+    A[:, 3:, :3] = _hat(t) @ R
+    return A
+
+
+def _block_sum(idx, vals, n):
+    # sum (m, ...) blocks into n bins
+    if not len(idx):
+        return np.zeros((n,) + vals.shape[1:])
+    A = sparse.csr_matrix((np.ones(len(idx)), (idx, np.arange(len(idx)))), shape=(n, len(idx)))
+    return (A @ vals.reshape(len(vals), -1)).reshape((n,) + vals.shape[1:])
+
+
 class PoseGraphOptimizer:
 
-    def __init__(self):
-        self.constraints = []
-        self.poses = {}
+    ODOMETRY, LOOP = 0, 1
+
+    def __init__(self, solver='direct', lambda_init=0.0, odom_info=None, loop_info=None,
+                 tol=1e-3, cg_tol=1e-6, cg_maxiter=200):
+        self.solver = solver
+        self.lambda_init = lambda_init
+        self.odom_info = np.eye(6) if odom_info is None else np.asarray(odom_info, np.float64)
+        self.loop_info = np.eye(6) if loop_info is None else np.asarray(loop_info, np.float64)
+        self.tol = tol
+        self.cg_tol = cg_tol
+        self.cg_maxiter = cg_maxiter
+        self.index = {}                                    # node id -> row
+        self._ids = _Growable((), np.int64, 1024)
+        self._T = _Growable((4, 4), np.float64, 1024)
+        self._fixed = _Growable((), np.bool_, 1024)
+        self._ei = _Growable((), np.int64, 1024)
+        self._ej = _Growable((), np.int64, 1024)
+        self._Z = _Growable((4, 4), np.float64, 1024)
+        self._info = _Growable((6, 6), np.float64, 1024)
+        self._kind = _Growable((), np.int8, 1024)
+        self._dirty_from = None                            # oldest row touched since last optimize
+        self.history = []
 
-    def add_loop_constraint(self, src_id, dst_id, pose_src, pose_dst):
-        self.constraints.append((src_id, dst_id, pose_src.copy(), pose_dst.copy()))
-        self.poses[src_id] = pose_src.copy()
-        self.poses[dst_id] = pose_dst.copy()
+    # --- graph construction ---
 
-    def optimize(self, max_iter=10):
-        pass
+    @property
+    def constraints(self):
+        loops = self._kind.view == self.LOOP
+        ids = self._ids.view
+        return list(zip(ids[self._ei.view[loops]].tolist(), ids[self._ej.view[loops]].tolist(),
+                        self._Z.view[loops]))
+
+    @property
+    def poses(self):
+        return self.get_poses()
+
+    def __len__(self):
+        return self._ids.n
+
+    def add_node(self, node_id, pose, fixed=None):
+        if node_id in self.index:
+            r = self.index[node_id]
+            self._T.data[r] = pose
+        else:
+            r = self._ids.n
+            self.index[node_id] = r
+            self._ids.extend([node_id])
+            self._T.extend([pose])
+            # the first node anchors the gauge unless told otherwise
+            self._fixed.extend([r == 0 if fixed is None else fixed])
+        if fixed is not None:
+            self._fixed.data[r] = fixed
+        self._touch(r)
+        return r
+
+    def add_odometry(self, src_id, dst_id, rel=None, info=None, pose_dst=None):
+        # rel = T_src^-1 T_dst; a new dst node is placed by composing rel onto src
+        i = self.index[src_id]
+        if rel is None:
+            rel = np.linalg.inv(self._T.data[i]) @ self._T.data[self.index[dst_id]]
+        if dst_id not in self.index:
+            self.add_node(dst_id, self._T.data[i] @ rel if pose_dst is None else pose_dst)
+        self._add_edge(i, self.index[dst_id], rel, self.odom_info if info is None else info,
+                       self.ODOMETRY)
+
+    def add_loop_constraint(self, src_id, dst_id, pose_src, pose_dst, rel=None, info=None):
+        # pose_src / pose_dst are the loop-closure estimates of the two poses in a
+        # common frame (their relative transform is the measurement); nodes not yet
+        # in the graph are created from them
+        for node_id, pose in ((src_id, pose_src), (dst_id, pose_dst)):
+            if node_id not in self.index:
+                self.add_node(node_id, np.array(pose, dtype=np.float64))
+        if rel is None:
+            rel = np.linalg.inv(pose_src) @ pose_dst
+        self._add_edge(self.index[src_id], self.index[dst_id], rel,
+                       self.loop_info if info is None else info, self.LOOP)
+
+    def _add_edge(self, i, j, rel, info, kind):
+        self._ei.extend([i])
+        self._ej.extend([j])
+        self._Z.extend([np.asarray(rel, dtype=np.float64)])
+        self._info.extend([info])
+        self._kind.extend([kind])
+        self._touch(min(i, j))
+
+    def _touch(self, r):
+        self._dirty_from = r if self._dirty_from is None else min(self._dirty_from, r)
 
     def get_poses(self):
-        return self.poses
\ No newline at end of file
+        return dict(zip(self._ids.view.tolist(), self._T.view.copy()))
+
+    def pose_array(self):
+        return self._T.view.copy()
+
+    # --- optimization ---
+
+    def errors(self, T=None, edges=None):
+        T = self._T.view if T is None else T
+        ei, ej, Z = self._ei.view, self._ej.view, self._Z.view
+        if edges is not None:
+            ei, ej, Z = ei[edges], ej[edges], Z[edges]
+        return se3_log_batch(_inv(Z) @ _inv(T[ei]) @ T[ej])
+
+    def _cost(self, e, info):
+        return float(0.5 * np.einsum('ni,nij,nj->', e, info, e))
+
+    def optimize(self, max_iter=10, incremental=False):
+        n = self._ids.n
+        self.history = []
+        if not n or not self._ei.n:
+            self._dirty_from = None
+            return 0.0
+        start = self._dirty_from if incremental and self._dirty_from is not None else 0
+        if incremental and self._dirty_from is None:
+            return self._cost(self.errors(), self._info.view)
+
+        free = ~self._fixed.view.copy()
+        free[:start] = False
+        var = np.full(n, -1, np.int64)
+        var[free] = np.arange(free.sum())
+        ei, ej = self._ei.view, self._ej.view
+        edges = np.flatnonzero(free[ei] | free[ej])        # edges that touch the region
+        self._dirty_from = None
+        if not free.any() or not len(edges):
+            return self._cost(self.errors(), self._info.view)
+
+        ei, ej, info = ei[edges], ej[edges], self._info.view[edges]
+        T = self._T.view.copy()
+        e = self.errors(T, edges)
+        cost = self._cost(e, info)
+        lam = self.lambda_init
+        for it in range(max_iter):
+            if cost < 1e-15:                               # e.g. a fresh odometry-only node
+                break
+            t0 = time.perf_counter()
+            H, b, diag_blocks = self._linearize(T, e, ei, ej, info, var)
+            accepted = False
+            while not accepted and lam < 1e10:
+                dx = self._solve(H, b, diag_blocks, lam)
+                if dx is None:
+                    lam = max(lam * 10, 1e-6)
+                    continue
+                d = np.zeros((n, 6))
+                d[free] = dx.reshape(-1, 6)
+                T_new = T.copy()
+                T_new[free] = T[free] @ se3_exp_batch(d[free])
+                e_new = self.errors(T_new, edges)
+                new_cost = self._cost(e_new, info)
+                if new_cost <= cost:
+                    # long chains have very soft modes that any damping freezes, so
+                    # plain Gauss-Newton steps are tried first and LM only kicks in on failure
+                    T, e, lam = T_new, e_new, (lam / 10 if lam > 1e-8 else 0.0)
+                    accepted = True
+                    converged = cost - new_cost <= self.tol * cost
+                    cost = new_cost
+                else:
+                    lam = max(lam * 10, 1e-6)
+            self.history.append({'iter': it, 'cost': cost, 'lambda': lam, 'accepted': accepted,
+                                 'nodes': int(free.sum()), 'edges': len(edges),
+                                 'ms': (time.perf_counter() - t0) * 1e3})
+            if not accepted or converged:
+                break
+        self._T.data[:n] = T
+        return cost
+
+    def _linearize(self, T, e, ei, ej, info, var):
+        # right perturbation: de/dd_j = Jr^-1(e), de/dd_i = -Jr^-1(e) Ad(T_j^-1 T_i)
+        w, v = e[:, :3], e[:, 3:]
+        ad = np.zeros((len(e), 6, 6))
+        ad[:, :3, :3] = ad[:, 3:, 3:] = _hat(w)
+        ad[:, 3:, :3] = _hat(v)
+        Jj = np.eye(6) + 0.5 * ad
+        Ji = -Jj @ _adjoint(_inv(T[ej]) @ T[ei])
+        Oe = np.einsum('nij,nj->ni', info, e)
+        JiT, JjT = np.swapaxes(Ji, 1, 2), np.swapaxes(Jj, 1, 2)
+        blocks = {(0, 0): JiT @ info @ Ji, (1, 1): JjT @ info @ Jj, (0, 1): JiT @ info @ Jj}
+        blocks[(1, 0)] = np.swapaxes(blocks[(0, 1)], 1, 2)
+
+        m = int(var.max()) + 1
+        vv = (var[ei], var[ej])
+        rows, cols, vals = [], [], []
+        ar = np.arange(6)
+        for (a, c), blk in blocks.items():
+            va, vb = vv[a], vv[c]
+            k = (va >= 0) & (vb >= 0)
+            blk = blk[k]
+            rows.append(np.broadcast_to(va[k, None, None] * 6 + ar[None, :, None], blk.shape).ravel())
+            cols.append(np.broadcast_to(vb[k, None, None] * 6 + ar[None, None, :], blk.shape).ravel())
+            vals.append(blk.ravel())
+        H = sparse.coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                              shape=(6 * m, 6 * m)).tocsc()
+        b = np.zeros((m, 6))
+        diag_blocks = np.zeros((m, 6, 6))
+        for a, J in ((0, JiT), (1, JjT)):
+            k = vv[a] >= 0
+            b += _block_sum(vv[a][k], np.einsum('nij,nj->ni', J[k], Oe[k]), m)
+            diag_blocks += _block_sum(vv[a][k], blocks[(a, a)][k], m)
+        return H, b.ravel(), diag_blocks
+
+    def _solve(self, H, b, diag_blocks, lam):
+        D = np.einsum('nii->ni', diag_blocks).ravel()
+        A = (H + sparse.diags(lam * D + 1e-9)).tocsc()
+        if self.solver == 'cg':
+            blocks = diag_blocks + (lam * np.einsum('nii->ni', diag_blocks) + 1e-9)[:, :, None] * np.eye(6)
+            try:
+                Minv = np.linalg.inv(blocks)
+            except np.linalg.LinAlgError:
+                return None
+            M = splinalg.LinearOperator(A.shape, matvec=lambda x: np.einsum(
+                'nij,nj->ni', Minv, x.reshape(-1, 6)).ravel())
+            # truncated CG is an inexact Newton step; the LM cost test still guards it
+            dx, _ = splinalg.cg(A, -b, rtol=self.cg_tol, maxiter=self.cg_maxiter, M=M)
+            return dx if np.isfinite(dx).all() else None
+        try:
+            dx = splinalg.splu(A, permc_spec='MMD_AT_PLUS_A').solve(-b)
+        except RuntimeError:
+            return None
+        return dx if np.isfinite(dx).all() else None
@@ -0,0 +1,245 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+
+from data_module.config import Config
+from include.feature_extractor import FeatureExtractor
+from include.guided_matcher import GuidedMatcher
+from include.matcher import FlannMatcher, Matcher, HammingMatcher
+from include.essential_matrix import EssentialMatrixEstimator
+from include.pose_estimator import PoseEstimator
+from include.optimizer import PoseOptimizer
+from include.vo_step import VOStep, motion_matrix
+from utils.profiler import NullProfiler
+
+# Incremental front end for live feeds: frames are pushed one at a time and the
+# pose comes back as soon as the frame is processed (the same frame-to-frame VO
+# as run_slam's default mode, poses camera-to-world). Three ways to feed it:
+#   session.process(gray)             synchronous, on the caller's thread
+#   session.run(frames)               any iterable / generator, read on its own thread
+#   session.run_async(queue)          asyncio.Queue, processed on a worker thread
+# Frames may be bare images or (timestamp, image) pairs; None ends a queue.
+# Between producer and session sits a one-frame slot. With policy='latest' a
+# frame arriving while another one waits replaces it (the older one is dropped
+# and counted), so a slow frame never builds up a backlog. With policy='block'
+# the producer waits for the slot instead (backpressure, e.g. replaying files).
+# Latency is measured per frame from arrival in the slot to the returned pose.
+# guided=True wraps the matcher in include/guided_matcher.GuidedMatcher.
+
+MATCHERS = {'flann': FlannMatcher, 'bf': Matcher, 'hamming': HammingMatcher}
+
+
+class FrameResult:
+    __slots__ = ('idx', 'timestamp', 'pose', 'tracked', 'matches', 'inliers',
+                 'latency_ms', 'process_ms')
+
+    def __init__(self, idx, timestamp, pose, tracked, matches, inliers, latency_ms, process_ms):
+        self.idx = idx                    # count of processed frames, not of arrivals
+        self.timestamp = timestamp
+        self.pose = pose
+        self.tracked = tracked            # False: pose held from the previous frame
+        self.matches = matches
+        self.inliers = inliers
+        self.latency_ms = latency_ms      # arrival -> pose, includes waiting in the slot
+        self.process_ms = process_ms
+
+
+class FrameSlot:
+    # single-frame handoff between one producer and the session
+    def __init__(self, policy='latest'):
+        if policy not in ('latest', 'block'):
+            raise ValueError(f"unknown policy {policy!r} (use 'latest' or 'block')")
+        self.policy = policy
+        self.n_dropped = 0
+        self.error = None
+        self._item = None
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, frame):
+        # -> False once the slot is closed (the producer should stop)
+        gray, timestamp = _unpack(frame)
+        with self._cond:
+            if self.policy == 'block':
+                while self._item is not None and not self._closed:
+                    self._cond.wait()
+            elif self._item is not None:
+                self.n_dropped += 1
+            if self._closed:
+                return False
+            self._item = (gray, timestamp, time.perf_counter())
+            self._cond.notify_all()
+            return True
+
+    def get(self):
+        # -> (gray, timestamp, arrival), or None once closed and empty
+        with self._cond:
+            while self._item is None and not self._closed:
+                self._cond.wait()
+            item, self._item = self._item, None
+            self._cond.notify_all()
+            return item
+
+    def close(self, error=None):
+        with self._cond:
+            self._closed = True
+            if error is not None:
+                self.error = error
+            self._cond.notify_all()
+
+
+def _unpack(frame):
+    if isinstance(frame, tuple):
+        timestamp, gray = frame
+        return gray, timestamp
+    return frame, None
+
+
+class SlamSession:
+    def __init__(self, K, matcher_type='flann', ransac='ransac', nfeatures=1500, max_trans=1.0,
+                 policy='latest', tiles=None, guided=False, profiler=None):
+        config = Config(K)
+        self.K = K
+        self.extractor = FeatureExtractor(nfeatures=nfeatures, tiles=tiles)
+        self.matcher = MATCHERS[matcher_type]()
+        if guided:
+            self.matcher = GuidedMatcher(K, self.matcher)
+        self.ess_est = EssentialMatrixEstimator(config.focal, config.pp, method=ransac)
+        self.pose_est = PoseEstimator(config.focal, config.pp)
+        self.optimizer = PoseOptimizer(max_trans=max_trans)
+        self.policy = policy
+        self.prof = profiler or NullProfiler()
+        self.vo = VOStep(self.matcher, self.ess_est, self.pose_est, self.optimizer, self.prof)
+        self.pose = np.eye(4)
+        self.poses = []
+        self.timestamps = []
+        self.latency_ms = []
+        self.n_tracked = self.n_dropped = 0
+        self._prev = None
+        self._lock = threading.Lock()
+
+    @property
+    def n_frames(self):
+        return len(self.poses)
+
+    # --- synchronous ---
+
+    def process(self, gray, timestamp=None, arrival=None):
+        t0 = time.perf_counter()
+        with self._lock:
+            with self.prof.stage('extract'):
+                feat = self.extractor.extract_features(gray)
+            tracked, n_matches, n_inliers = self._track(feat)
+            self._prev = feat
+            pose = self.pose.copy()
+            idx = len(self.poses)
+            self.poses.append(pose)
+            self.timestamps.append(timestamp)
+            self.n_tracked += tracked
+            done = time.perf_counter()
+            latency = (done - (t0 if arrival is None else arrival)) * 1e3
+            self.latency_ms.append(latency)
+        return FrameResult(idx, timestamp, pose, tracked, n_matches, n_inliers, latency,
+                           (done - t0) * 1e3)
+
+    def _track(self, feat):
+        prev = self._prev
+        if prev is None or prev.des is None or feat.des is None:
+            return False, 0, 0
+        R, t, n_matches, n_inliers = self.vo.step(prev, feat)
+        if R is None:
+            return False, n_matches, n_inliers
+        self.pose = self.pose @ motion_matrix(R, t)
+        return True, n_matches, n_inliers
+
+    # --- generator / iterable ---
+
+    def run(self, frames, policy=None):
+        # yields a FrameResult per processed frame; with 'latest', frames that
+        # arrive while the session is busy are dropped (except the newest)
+        slot = FrameSlot(policy or self.policy)
+        reader = threading.Thread(target=self._read, args=(frames, slot),
+                                  name='session-reader', daemon=True)
+        reader.start()
+        try:
+            while True:
+                item = slot.get()
+                if item is None:
+                    break
+                yield self.process(*item)
+            if slot.error is not None:
+                raise slot.error
+        finally:
+            slot.close()
+            self.n_dropped += slot.n_dropped
+
+    @staticmethod
+    def _read(frames, slot):
+        try:
+            for frame in frames:
+                if not slot.put(frame):
+                    return
+            slot.close()
+        except BaseException as e:
+            slot.close(e)
+
+    # --- asyncio ---
+
+    async def run_async(self, queue, policy=None):
+        # async generator over an asyncio.Queue; processing runs on a worker
+        # thread so the event loop (and the producer) keep running meanwhile
+        loop = asyncio.get_running_loop()
+        slot = FrameSlot(policy or self.policy)
+
+        async def pump():
+            try:
+                while True:
+                    frame = await queue.get()
+                    if frame is None:
+                        break
+                    put = await asyncio.to_thread(slot.put, frame) \
+                        if slot.policy == 'block' else slot.put(frame)
+                    if not put:
+                        break
+                slot.close()
+            except BaseException as e:
+                slot.close(e)
+
+        pump_task = asyncio.create_task(pump())
+        try:
+            while True:
+                result = await loop.run_in_executor(None, self._next, slot)
+                if result is None:
+                    break
+                yield result
+            if slot.error is not None and not isinstance(slot.error, asyncio.CancelledError):
+                raise slot.error
+        finally:
+            slot.close()
+            pump_task.cancel()
+            self.n_dropped += slot.n_dropped
+
+    def _next(self, slot):
+        item = slot.get()
+        return None if item is None else self.process(*item)
+
+    def close(self):
+        self.extractor.close()
+
+    # --- stats ---
+
+    def summary(self):
+        lat = np.array(self.latency_ms)
+        pct = (lambda q: float(np.percentile(lat, q))) if len(lat) else (lambda q: None)
+        return {'frames': self.n_frames, 'tracked': self.n_tracked, 'dropped': self.n_dropped,
+                'latency_p50_ms': pct(50), 'latency_p95_ms': pct(95), 'latency_max_ms': pct(100)}
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"session: {s['frames']} frames processed ({s['tracked']} tracked), "
+              f"{s['dropped']} dropped")
+        if s['frames']:
+            print(f"latency ms: p50 {s['latency_p50_ms']:.1f}  p95 {s['latency_p95_ms']:.1f}  "
+                  f"max {s['latency_max_ms']:.1f}")
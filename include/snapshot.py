@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Session snapshots for run_slam (same idea as feature_store.py: raw .bin arrays
+# plus a JSON manifest, so everything loads back as np.memmap).
+# Layout of a snapshot directory:
+#   <name>.bin        append-only arrays (trajectory, observation logs, ...): each
+#                     write only appends the rows added since the previous one
+#   <name>.<gen>.bin  arrays that change in place (landmark positions, ...),
+#                     rewritten under a new generation number; also append-only
+#                     arrays that cannot be appended to (dtype/shape changed, rows
+#                     went missing), which then keep growing in that file
+#   state.<gen>.npz   small per-frame state (last features, BA window, filter, ...)
+#   meta.json         frame to resume from, file/rows/dtype/shape of every array
+# meta.json is replaced last and older generations are deleted after it, so a
+# crash mid-write leaves the previous snapshot readable (rows appended past its
+# row counts are ignored).
+# Snapshotter writes on a background thread; a snapshot that comes due while
+# the previous one is still being written is skipped instead of waiting.
+
+APPEND_ONLY = frozenset(('poses', 'pose_frames', 'map_kf_ids', 'map_obs_lm', 'map_obs_kf',
+                         'map_des'))
+
+
+def _row_bytes(a):
+    return a.dtype.itemsize * int(np.prod(a.shape[1:], dtype=np.int64))
+
+
+def _replace(path, write):
+    tmp = path + '.tmp'
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def write_arrays(path, arrays, old=None, gen=0, append_only=APPEND_ONLY):
+    # -> manifest {name: {file, rows, dtype, shape}}; `old` is the previous manifest
+    os.makedirs(path, exist_ok=True)
+    old = old or {}
+    manifest = {}
+    for name, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        prev = old.get(name)
+        rb = _row_bytes(a)
+        if name in append_only:
+            full = prev and os.path.join(path, prev['file'])
+            if (prev is not None and prev['dtype'] == a.dtype.str
+                    and prev['shape'] == list(a.shape[1:]) and prev['rows'] <= len(a)
+                    and os.path.exists(full) and os.path.getsize(full) >= prev['rows'] * rb):
+                fn, start = prev['file'], prev['rows']
+            else:
+                # never truncate a file the live meta.json may still reference
+                fn, start = (name + '.bin' if prev is None else f"{name}.{gen}.bin"), 0
+            with open(os.path.join(path, fn), 'r+b' if start else 'wb') as f:
+                f.seek(start * rb)
+                f.write(a[start:].tobytes())
+                f.truncate()
+        else:
+            fn = f"{name}.{gen}.bin"
+            with open(os.path.join(path, fn), 'wb') as f:
+                f.write(a.tobytes())
+        manifest[name] = {'file': fn, 'rows': len(a), 'dtype': a.dtype.str,
+                          'shape': list(a.shape[1:])}
+    return manifest
+
+
+def read_arrays(path, manifest, mode='c'):
+    # copy-on-write memmaps: callers may modify them without touching the files
+    out = {}
+    for name, m in manifest.items():
+        shape = (m['rows'],) + tuple(m['shape'])
+        if m['rows'] == 0:
+            out[name] = np.empty(shape, dtype=m['dtype'])
+        else:
+            out[name] = np.memmap(os.path.join(path, m['file']), dtype=m['dtype'],
+                                  mode=mode, shape=shape)
+    return out
+
+
+def read_meta(path):
+    meta_fn = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_fn):
+        return None
+    with open(meta_fn) as f:
+        return json.load(f)
+
+
+def load_snapshot(path):
+    # -> (meta, arrays, state) or None if there is no complete snapshot
+    meta = read_meta(path)
+    if meta is None:
+        return None
+    arrays = read_arrays(path, meta['arrays'])
+    with np.load(os.path.join(path, meta['state'])) as z:
+        state = {k: z[k] for k in z.files}
+    return meta, arrays, state
+
+
+class Snapshotter:
+    def __init__(self, path, every=100, resume=True):
+        # resume=False discards a snapshot already in path
+        self.path = path
+        self.every = every
+        os.makedirs(path, exist_ok=True)
+        old = read_meta(path) if resume else None
+        if not resume:
+            self._clear()
+        self._meta = old or {'arrays': {}, 'gen': 0, 'state': None}
+        self._last = old['next_frame'] if old else 0
+        self._thread = None
+        self._error = None
+        self.n_written = self.n_skipped = 0
+        self.write_ms = []
+
+    def _clear(self):
+        # meta.json first: what is left after an interruption is never loadable
+        for fn in sorted(os.listdir(self.path), key=lambda f: f != 'meta.json'):
+            if fn == 'meta.json' or fn.endswith(('.bin', '.npz', '.tmp')):
+                os.remove(os.path.join(self.path, fn))
+
+    def due(self, idx):
+        return bool(self.every) and idx - self._last >= self.every
+
+    @property
+    def busy(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def save(self, next_frame, arrays, state, scalars=None, block=False):
+        # arrays: large state (see APPEND_ONLY); append-only entries may be views
+        # that keep growing elsewhere, the rest must be copies
+        if self._error is not None:
+            raise self._error
+        if self.busy:
+            if not block:
+                self.n_skipped += 1
+                return False
+            self._thread.join()
+        self._last = next_frame
+        args = (next_frame, arrays, state, scalars or {})
+        if block:
+            self._write(*args)
+        else:
+            self._thread = threading.Thread(target=self._write, args=args,
+                                            name='snapshot', daemon=True)
+            self._thread.start()
+        return True
+
+    def _write(self, next_frame, arrays, state, scalars):
+        t0 = time.perf_counter()
+        try:
+            old = self._meta
+            gen = old['gen'] + 1
+            manifest = write_arrays(self.path, arrays, old['arrays'], gen)
+            state_fn = f"state.{gen}.npz"
+            with open(os.path.join(self.path, state_fn), 'wb') as f:
+                np.savez(f, **state)
+            meta = {'next_frame': int(next_frame), 'gen': gen, 'arrays': manifest,
+                    'state': state_fn, 'scalars': scalars, 'time': time.time()}
+
+            def write(tmp):
+                with open(tmp, 'w') as f:
+                    json.dump(meta, f, default=float)
+            _replace(os.path.join(self.path, 'meta.json'), write)
+            # the previous generation is unreferenced now
+            stale = {m['file'] for m in old['arrays'].values()} - {m['file'] for m in manifest.values()}
+            for fn in stale | ({old['state']} if old['state'] else set()):
+                try:
+                    os.remove(os.path.join(self.path, fn))
+                except OSError:
+                    pass
+            self._meta = meta
+            self.n_written += 1
+            self.write_ms.append((time.perf_counter() - t0) * 1e3)
+        except Exception as e:
+            self._error = e
+
+    def close(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,74 @@
+import numpy as np
+
+from include.frame_features import match_indices, matched_points
+from utils.profiler import NullProfiler
+
+# The frame-to-frame VO step shared by run_slam and SlamSession: match the
+# reference features against the current ones, estimate the essential matrix
+# (seeded with the last accepted motion), recover (R, t) and pass it through the
+# motion filter. run_slam calls match() and motion() separately, since the KLT
+# front end and keyframe mode sit in between; step() runs both in a row. An
+# accepted motion becomes the prior of the next estimate and, with a
+# GuidedMatcher, the motion model of the next match.
+
+class VOStep:
+    def __init__(self, matcher, ess_est, pose_est, optimizer, profiler=None):
+        self.matcher = matcher
+        self.ess_est = ess_est
+        self.pose_est = pose_est
+        self.optimizer = optimizer
+        self.prof = profiler or NullProfiler()
+        self.guided = hasattr(matcher, 'set_motion')
+        self.last_motion = None          # (R, t) of the last accepted frame
+
+    def match(self, ref, feat):
+        # -> (matches, pts1, pts2); the points are None below 8 matches
+        with self.prof.stage('match'):
+            matches = self.matcher.match(ref, feat)
+        self.prof.count('matches', len(matches))
+        if self.guided:
+            self.prof.count('guided', int(self.matcher.last_guided))
+        if len(matches) < 8:
+            return matches, None, None
+        pts1, pts2 = matched_points(ref, feat, matches)
+        return matches, pts1, pts2
+
+    def motion(self, pts1, pts2, ref=None, feat=None, matches=None):
+        # -> (R, t, mask, n_inliers); R is None unless a motion was accepted
+        with self.prof.stage('essential'):
+            E, mask = self.ess_est.compute(pts1, pts2, prior=self.last_motion)
+        if E is None:
+            return None, None, mask, 0
+        n_inliers = int(np.count_nonzero(mask))
+        self.prof.count('inliers', n_inliers)
+
+        # robust mode hands only the inliers to the cheirality check
+        with self.prof.stage('pose'):
+            R, t, mask = self.pose_est.recover(E, pts1, pts2,
+                                               mask if self.ess_est.method == 'prosac' else None)
+        with self.prof.stage('filter'):
+            accepted = R is not None and self.optimizer.filter(R, t)
+        self.prof.count('accepted', int(accepted))
+        if not accepted:
+            return None, None, mask, n_inliers
+        self.last_motion = (R, t)
+        if self.guided and matches is not None:
+            q, tq = match_indices(matches)
+            inl = np.flatnonzero(mask.ravel())
+            self.matcher.set_motion(R, t, ref, feat, q[inl], tq[inl])
+        return R, t, mask, n_inliers
+
+    def step(self, ref, feat):
+        # -> (R, t, n_matches, n_inliers), R None if the frame was not tracked
+        matches, pts1, pts2 = self.match(ref, feat)
+        if pts1 is None:
+            return None, None, len(matches), 0
+        R, t, _, n_inliers = self.motion(pts1, pts2, ref, feat, matches)
+        return R, t, len(matches), n_inliers
+
+
+def motion_matrix(R, t):
+    # x2 = R x1 + t as a 4x4; default mode composes pose @ motion_matrix(R, t)
+    T = np.eye(4)
+    T[:3, :3], T[:3, 3] = R, np.asarray(t).ravel()
+    return T
@@ -0,0 +1,163 @@
+import numpy as np
+
+from include.matcher import hamming_distances, _pack_words, _popcount
+
+# Bag-of-binary-words vocabulary for ORB descriptors (DBoW-style), NumPy only.
+# The tree is built by recursive k-majority clustering (k-means with Hamming
+# distance; a center is the per-bit majority of its members) and stored flat:
+# node centers as packed 64-bit words, an (n_nodes, k) child table and the word
+# id of every leaf. Quantization descends all descriptors of a frame level by
+# level at once. IDF weights come from the training images.
+
+class Vocabulary:
+
+    def __init__(self, k=10, levels=5):
+        self.k = k
+        self.levels = levels
+        self.centers = None          # (n_nodes, 32) uint8, node 0 is the root
+        self.children = None         # (n_nodes, k) int32, -1 = none
+        self.node_word = None        # (n_nodes,) int32, -1 for inner nodes
+        self.idf = None              # (n_words,) float32
+
+    @property
+    def n_words(self):
+        return 0 if self.idf is None else len(self.idf)
+
+    # --- training ---
+
+    def train(self, descriptor_sets, iters=10, seed=0):
+        # descriptor_sets: one (n_i, 32) uint8 array per training image
+        rng = np.random.default_rng(seed)
+        des = np.ascontiguousarray(np.concatenate(descriptor_sets), dtype=np.uint8)
+        bits = np.unpackbits(des, axis=1)
+
+        centers, children, node_word = [np.zeros(des.shape[1], np.uint8)], [], []
+        children.append(np.full(self.k, -1, np.int32))
+        node_word.append(-1)
+        queue = [(0, np.arange(len(des)), 0)]
+        n_words = 0
+        while queue:
+            node, idx, depth = queue.pop(0)
+            if depth == self.levels or len(idx) <= 1:
+                node_word[node] = n_words
+                n_words += 1
+                continue
+            if len(idx) <= self.k:
+                groups = [idx[i:i + 1] for i in range(len(idx))]
+                group_centers = des[idx]
+            else:
+                labels, group_centers = _kmajority(des[idx], bits[idx], self.k, iters, rng)
+                groups = [idx[labels == c] for c in range(len(group_centers))]
+            for c, (center, members) in enumerate(zip(group_centers, groups)):
+                if not len(members):
+                    continue
+                child = len(centers)
+                centers.append(center)
+                children.append(np.full(self.k, -1, np.int32))
+                node_word.append(-1)
+                children[node][c] = child
+                queue.append((child, members, depth + 1))
+
+        self.centers = np.array(centers, dtype=np.uint8)
+        self.children = np.array(children, dtype=np.int32)
+        self.node_word = np.array(node_word, dtype=np.int32)
+        self._words = _pack_words(self.centers)
+
+        # idf = log(N / n_i), n_i = number of training images containing word i
+        df = np.zeros(n_words, np.int64)
+        for d in descriptor_sets:
+            if len(d):
+                df[np.unique(self.quantize(d))] += 1
+        self.idf = np.log(len(descriptor_sets) / np.maximum(df, 1)).astype(np.float32)
+        return self
+
+    # --- quantization ---
+
+    def quantize(self, des):
+        # (n, 32) uint8 -> (n,) word ids
+        if des is None or not len(des):
+            return np.empty(0, np.int32)
+        q = _pack_words(des)
+        node = np.zeros(len(q), np.int64)
+        for _ in range(self.levels):
+            ch = self.children[node]                               # (n, k)
+            valid = ch >= 0
+            inner = valid.any(axis=1)
+            if not inner.any():
+                break
+            if not inner.all():
+                ch, valid, qi = ch[inner], valid[inner], q[inner]
+            else:
+                qi = q
+            x = _popcount(self._words[np.maximum(ch, 0)] ^ qi[:, None, :])   # (n, k, words) uint8
+            d = x[..., 0].astype(np.uint16)
+            for j in range(1, x.shape[2]):
+                d += x[..., j]
+            d[~valid] = np.iinfo(np.uint16).max
+            best = ch[np.arange(len(ch)), d.argmin(axis=1)]
+            if qi is q:
+                node = best
+            else:
+                node[inner] = best
+        return self.node_word[node]
+
+    def transform(self, des):
+        # L1-normalized tf-idf vector as (sorted word ids, weights)
+        words = self.quantize(des)
+        if not len(words):
+            return words, np.empty(0, np.float32)
+        uniq, counts = np.unique(words, return_counts=True)
+        w = counts / len(words) * self.idf[uniq]
+        s = w.sum()
+        return uniq, (w / s if s > 0 else w).astype(np.float32)
+
+    @staticmethod
+    def score(a, b):
+        # L1 similarity in [0, 1] between two transform() results
+        (wa, va), (wb, vb) = a, b
+        _, ia, ib = np.intersect1d(wa, wb, assume_unique=True, return_indices=True)
+        x, y = va[ia], vb[ib]
+        return float(0.5 * (np.abs(x) + np.abs(y) - np.abs(x - y)).sum())
+
+    # --- persistence ---
+
+    def save(self, path):
+        np.savez_compressed(path, k=self.k, levels=self.levels, centers=self.centers,
+                            children=self.children, node_word=self.node_word, idf=self.idf)
+
+    @classmethod
+    def load(cls, path):
+        z = np.load(path)
+        v = cls(int(z['k']), int(z['levels']))
+        v.centers, v.children = z['centers'], z['children']
+        v.node_word, v.idf = z['node_word'], z['idf']
+        v._words = _pack_words(v.centers)
+        return v
+
+
+def _kmajority(des, bits, k, iters, rng):
+    # k-means++ seeding under Hamming distance, then majority-vote centers
+    n = len(des)
+    seeds = [int(rng.integers(n))]
+    dmin = hamming_distances(des, des[seeds]).min(axis=1).astype(np.float64)
+    for _ in range(1, k):
+        p = dmin ** 2
+        if p.sum() == 0:
+            break
+        seeds.append(int(rng.choice(n, p=p / p.sum())))
+        dmin = np.minimum(dmin, hamming_distances(des, des[seeds[-1:]])[:, 0])
+    centers = des[seeds]
+    labels = None
+    for _ in range(iters):
+        new = hamming_distances(des, centers).argmin(axis=1)
+        if labels is not None and np.array_equal(new, labels):
+            break
+        labels = new
+        onehot = np.zeros((n, len(centers)), np.float32)
+        onehot[np.arange(n), labels] = 1
+        votes = onehot.T @ bits.astype(np.float32)                  # (k, nbits)
+        size = onehot.sum(axis=0)[:, None]
+        keep = size[:, 0] > 0
+        centers = np.where(keep[:, None],
+                           np.packbits((2 * votes >= size) & (size > 0), axis=1), centers)
+    return labels, centers
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import csv
+import fnmatch
+import glob
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing as mp
+
+import numpy as np
+
+# Batch runner: run_slam over many KITTI raw drives on a process pool.
+# Drives are given as names or glob patterns (relative to base_path, either
+# '<date>/<drive>' or just '<drive>'), scheduled largest first so a long drive
+# does not start last, and written to out_root/<date>/<drive>/. A drive whose
+# result.json says 'ok' is skipped when the batch is resumed. Per-drive fps and
+# evaluate_accuracy metrics are gathered into summary.csv / summary.json.
+#
+#   PYTHONPATH=. python src/fleet.py --base_path data --drives '2011_09_26/*_sync' \
+#       --out_root runs/nightly --workers 4 --matcher hamming --ransac prosac --sim3
+
+SLAM_OPTIONS = ('matcher_type', 'ransac', 'frontend', 'keyframes', 'imu', 'realtime',
+                'frame_budget_ms', 'kf_dist', 'ba_window', 'feature_store', 'prefetch', 'tiles',
+                'guided')
+
+
+def find_drives(base_path, patterns):
+    # -> sorted unique [(date, drive)] of directories with cam0 images
+    found = set()
+    for pat in patterns:
+        pat = pat.strip('/')
+        full = os.path.join(base_path, pat if '/' in pat else os.path.join('*', pat))
+        for path in glob.glob(full):
+            if os.path.isdir(os.path.join(path, 'image_00', 'data')):
+                found.add((os.path.basename(os.path.dirname(path)), os.path.basename(path)))
+    return sorted(found)
+
+
+def drive_frames(base_path, date, drive):
+    d = os.path.join(base_path, date, drive, 'image_00', 'data')
+    return sum(1 for f in os.listdir(d) if fnmatch.fnmatch(f, '*.png'))
+
+
+def drive_dir(out_root, date, drive):
+    return os.path.join(out_root, date, drive)
+
+
+def load_result(out_dir):
+    try:
+        with open(os.path.join(out_dir, 'result.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, obj):
+    # atomic, so an interrupted run never leaves a result that looks complete
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, indent=1)
+    os.replace(tmp, path)
+
+
+def run_drive(base_path, date, drive, out_dir, slam_kwargs, sim3=False, threads=None,
+              gt_cache='.gt_cache'):
+    # worker: one drive, stdout to <out_dir>/log.txt, result.json written last
+    if threads:
+        import cv2
+        cv2.setNumThreads(threads)
+    from src.main import run_slam
+    from utils.evaluate_accuracy import evaluate
+
+    os.makedirs(out_dir, exist_ok=True)
+    res = {'date': date, 'drive': drive, 'status': 'error', 'options': slam_kwargs}
+    t0 = time.perf_counter()
+    with open(os.path.join(out_dir, 'log.txt'), 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            kw = dict(slam_kwargs)
+            poses, frames = run_slam(base_path, date, drive, kw.pop('kf_dist', 0.5),
+                                     headless=True, vis_out='', log_every=0, out_dir=out_dir, **kw)
+            wall = time.perf_counter() - t0
+            n = drive_frames(base_path, date, drive)
+            np.savetxt(os.path.join(out_dir, 'est_frames.txt'), frames, fmt='%d')
+            res.update(status='ok', frames=n, poses=len(poses), wall_s=wall, fps=n / wall)
+            try:
+                m = evaluate(base_path, date, drive, os.path.join(out_dir, 'est_traj.txt'),
+                             with_scale=sim3, cache_dir=gt_cache, frames=frames)
+                seg = np.array([v[:2] for v in m['segments'].values()]) if m['segments'] else None
+                res.update(ate=m['ate'], rpe={str(k): v for k, v in m['rpe'].items()},
+                           seg_t_err=None if seg is None else float(seg[:, 0].mean()),
+                           seg_r_err=None if seg is None else float(seg[:, 1].mean()))
+            except (Exception, SystemExit) as e:
+                # no OXTS ground truth is not a failed run
+                res['eval_error'] = repr(e)
+        except (Exception, SystemExit):
+            res['error'] = traceback.format_exc()
+            res['wall_s'] = time.perf_counter() - t0
+            traceback.print_exc(file=log)
+    _write_json(os.path.join(out_dir, 'result.json'), res)
+    return res
+
+
+def summarize(out_root, drives):
+    rows = [r for r in (load_result(drive_dir(out_root, d, v)) for d, v in drives) if r]
+    cols = ('date', 'drive', 'status', 'frames', 'poses', 'wall_s', 'fps', 'ate', 'rpe_1',
+            'seg_t_err', 'seg_r_err')
+    table = [{c: (r.get('rpe') or {}).get('1') if c == 'rpe_1' else r.get(c) for c in cols}
+             for r in rows]
+    with open(os.path.join(out_root, 'summary.csv'), 'w', newline='') as f:
+        w = csv.DictWriter(f, fieldnames=cols)
+        w.writeheader()
+        w.writerows(table)
+    _write_json(os.path.join(out_root, 'summary.json'), table)
+    return table
+
+
+def print_table(table):
+    fmt = lambda v, spec: '-' if v is None else format(v, spec)
+    print(f"\n{'drive':<34}{'status':>7}{'frames':>8}{'fps':>8}{'ATE':>10}{'RPE':>10}{'t_err%':>9}")
+    for r in table:
+        print(f"{r['drive']:<34}{r['status']:>7}{fmt(r['frames'], 'd'):>8}{fmt(r['fps'], '.2f'):>8}"
+              f"{fmt(r['ate'], '.3f'):>10}{fmt(r['rpe_1'], '.4f'):>10}{fmt(r['seg_t_err'], '.2f'):>9}")
+    ok = [r for r in table if r['status'] == 'ok']
+    if ok:
+        frames = sum(r['frames'] for r in ok)
+        wall = sum(r['wall_s'] for r in ok)
+        print(f"{len(ok)}/{len(table)} drives ok, {frames} frames, "
+              f"{frames / wall:.2f} fps per worker")
+
+
+def run_fleet(base_path, patterns, out_root, workers=None, slam_kwargs=None, sim3=False,
+              resume=True, threads=1):
+    drives = find_drives(base_path, patterns)
+    if not drives:
+        raise IOError(f"no drives matching {patterns} under {base_path}")
+    os.makedirs(out_root, exist_ok=True)
+    todo = []
+    for date, drive in drives:
+        prev = load_result(drive_dir(out_root, date, drive)) if resume else None
+        if prev is not None and prev.get('status') == 'ok':
+            print(f"skip {drive} (done)")
+            continue
+        todo.append((drive_frames(base_path, date, drive), date, drive))
+    todo.sort(reverse=True)                               # largest first
+    print(f"{len(drives)} drives, {len(todo)} to run, {workers or os.cpu_count()} workers")
+
+    if todo:
+        # one BLAS/OpenMP thread per worker unless the caller chose otherwise
+        if threads:
+            for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+                os.environ.setdefault(var, str(threads))
+        ctx = mp.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            futs = {pool.submit(run_drive, base_path, date, drive,
+                                drive_dir(out_root, date, drive), dict(slam_kwargs or {}),
+                                sim3, threads, os.path.join(out_root, '.gt_cache')): drive
+                    for _, date, drive in todo}
+            for fut in as_completed(futs):
+                try:
+                    r = fut.result()
+                    msg = (f"{r['fps']:.2f} fps" if r['status'] == 'ok' else 'FAILED')
+                except Exception as e:                    # worker process died
+                    msg = f"FAILED ({e!r})"
+                print(f"done {futs[fut]}: {msg}")
+
+    table = summarize(out_root, drives)
+    print_table(table)
+    return table
+
+
+def main():
+    from src.main import parse_tiles
+    p = argparse.ArgumentParser()
+    p.add_argument('--base_path', required=True, help='KITTI raw data folder')
+    p.add_argument('--drives', nargs='+', default=['*/*_sync'],
+                   help="drive names or globs, e.g. '2011_09_26/*_sync' or '*_drive_0001_sync'")
+    p.add_argument('--out_root', default='fleet_runs')
+    p.add_argument('--workers', type=int, default=None, help='processes (default: all cores)')
+    p.add_argument('--threads', type=int, default=1, help='OpenCV/BLAS threads per worker')
+    p.add_argument('--no_resume', action='store_true', help='re-run drives that already finished')
+    p.add_argument('--sim3', action='store_true', help='evaluate with scale alignment (monocular)')
+    p.add_argument('--matcher', dest='matcher_type', choices=('flann', 'bf', 'hamming'), default=None)
+    p.add_argument('--ransac', choices=('ransac', 'prosac'), default=None)
+    p.add_argument('--frontend', choices=('orb', 'klt'), default=None)
+    p.add_argument('--keyframes', action='store_true', default=None)
+    p.add_argument('--imu', action='store_true', default=None)
+    p.add_argument('--realtime', action='store_true', default=None)
+    p.add_argument('--frame_budget_ms', type=float, default=None)
+    p.add_argument('--kf_dist', type=float, default=None)
+    p.add_argument('--ba_window', type=int, default=None)
+    p.add_argument('--feature_store', default=None)
+    p.add_argument('--prefetch', type=int, default=None)
+    p.add_argument('--tiles', type=parse_tiles, default=None, help='tiled ORB grid, e.g. 2x4')
+    p.add_argument('--guided', action='store_true', default=None)
+    a = p.parse_args()
+
+    slam_kwargs = {k: getattr(a, k) for k in SLAM_OPTIONS if getattr(a, k) is not None}
+    run_fleet(a.base_path, a.drives, a.out_root, a.workers, slam_kwargs, a.sim3,
+              resume=not a.no_resume, threads=a.threads)
+
+
+if __name__ == '__main__':
+    main()
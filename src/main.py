@@ -3,120 +3,459 @@ import os
 import argparse
 import cv2
 import numpy as np
-import imageio
 
 from data_module.frame_data      import FrameData
 from data_module.config          import Config
 from include.feature_extractor   import FeatureExtractor
-from include.matcher             import FlannMatcher
+from include.matcher             import FlannMatcher, Matcher, HammingMatcher
+from include.frame_features      import FrameFeatures, match_indices
 from include.essential_matrix    import EssentialMatrixEstimator
 from include.pose_estimator      import PoseEstimator
 from include.optimizer           import PoseOptimizer
-from utils.trajectory_visualizer import TrajectoryVisualizer
-from utils.video_visualizer    import VideoVisualizer
+from include.vo_step             import VOStep, motion_matrix
+from include.pipeline            import FramePipeline, sequential_frames
+from utils.video_visualizer    import VideoVisualizer, FrameStreamWriter
+from utils.profiler            import StageProfiler, NullProfiler
 
-def run_slam(base_path, date, drive, kf_dist, ba_window=5):
-    # --- OUTPUT FILES (always overwrite) ---
-    for fn in ('trajectory.png', 'slam_live.gif', 'est_traj.txt'):
-        if os.path.exists(fn):
+# Optional stages (keyframe mapping, IMU fusion, snapshots, feature store, ...)
+# and the plotting backend are imported where they are used: matplotlib, scipy
+# and friends dominate start-up time and most runs never touch them.
+
+def run_slam(base_path, date, drive, kf_dist, ba_window=5,
+             prefetch=0, lru_size=0, frame_cache=None,
+             pipelined=False, pipeline_depth=1, feature_store=None,
+             matcher_type='flann', frontend='orb', klt_min_tracked=400,
+             ransac='ransac', headless=False, vis_every=1, vis_out='slam_live.gif',
+             data=None, profile=False, trace_out=None, log_every=1, frame_budget_ms=None,
+             imu=False, keyframes=False, min_parallax=1.0, max_skip=5, loop_vocab=None,
+             realtime=False, out_dir='.', snapshot_dir=None, snapshot_every=100, resume=False,
+             tiles=None, extract_workers=None, monitor=False, reference_poses=None,
+             drift_ate=None, drift_err=None, drift_rpe=None, guided=False):
+    # --- OUTPUT FILES (always overwrite, all under out_dir) ---
+    os.makedirs(out_dir, exist_ok=True)
+    plot_out = os.path.join(out_dir, 'trajectory.png')
+    traj_out = os.path.join(out_dir, 'est_traj.txt')
+    vis_out  = os.path.join(out_dir, vis_out) if vis_out else vis_out
+    for fn in (plot_out, vis_out, traj_out):
+        if fn and os.path.exists(fn):
             os.remove(fn)
             print(f"Removed old {fn}")
 
     print(f"▶ Starting SLAM on {date} / {drive}")
 
     # 1) Load data & intrinsics
-    data = FrameData(base_path, date, drive)
+    #    (any object with len/get_frame/K/close works, e.g. SyntheticFrameData)
+    if data is None:
+        data = FrameData(base_path, date, drive,
+                         prefetch=prefetch, lru_size=lru_size, cache_dir=frame_cache)
     print(f"Loaded {len(data)} frames")
     config = Config(data.K)
     N = len(data)
 
-    # 2) Modules (no mapping/keyframe logic)
-    extractor = FeatureExtractor(nfeatures=1500)
-    matcher   = FlannMatcher()
-    ess_est   = EssentialMatrixEstimator(config.focal, config.pp)
+    #    session snapshots: pick up where the last one left off, keep writing new ones
+    resumed, snap = None, None
+    if resume and not snapshot_dir:
+        raise ValueError("resume needs a snapshot_dir")
+    if snapshot_dir:
+        from include.snapshot import Snapshotter, load_snapshot
+        resumed = load_snapshot(snapshot_dir) if resume else None
+        snap = Snapshotter(snapshot_dir, every=snapshot_every, resume=resume)
+        if resumed is not None:
+            print(f"Resuming from {snapshot_dir} at frame {resumed[0]['next_frame']}")
+
+    # 2) Modules
+    if realtime and feature_store:
+        # the budget controller retunes the extractor mid-run, a store holds one config
+        raise ValueError("--realtime cannot be combined with --feature_store")
+    if realtime and pipelined:
+        # the pipeline decodes and extracts ahead of the budget's drop decision,
+        # so a dropped frame would still cost its two most expensive stages
+        raise ValueError("--realtime cannot be combined with --pipelined")
+    extractor = FeatureExtractor(nfeatures=1500, tiles=tiles, workers=extract_workers)
+    store = None
+    if feature_store:
+        if frontend == 'klt':
+            raise ValueError("--feature_store holds ORB descriptors, the KLT front end does not use it")
+        from include.feature_store import FeatureStore
+        # keyed by the normalized drive name ('0001' and its directory name share a store)
+        store = FeatureStore(feature_store, date, getattr(data, 'drive', drive), extractor, N)
+        if store.recording and resumed is not None and resumed[0]['next_frame'] > 0:
+            # a store is only kept once every frame of the drive is in it
+            raise ValueError(f"feature store {store.path} is not recorded yet; "
+                             "record it with a run from frame 0 before using --resume")
+    if matcher_type == 'hamming':
+        matcher = HammingMatcher()
+    elif matcher_type == 'bf':
+        matcher = Matcher()
+    else:
+        matcher = FlannMatcher()
+    #    guided matching: search only around motion-model predictions, with the
+    #    matcher above as the global fallback
+    if guided:
+        if frontend == 'klt' or keyframes:
+            raise ValueError("guided matching is frame-to-frame ORB matching "
+                             "(frontend='orb', no keyframes)")
+        from include.guided_matcher import GuidedMatcher
+        matcher = GuidedMatcher(data.K, matcher)
+    ess_est   = EssentialMatrixEstimator(config.focal, config.pp, method=ransac)
     pose_est  = PoseEstimator(config.focal, config.pp)
     optimizer = PoseOptimizer(max_trans=1.0)
+    tracker   = None
+    if frontend == 'klt':
+        from include.klt_tracker import KLTTracker
+        tracker = KLTTracker(extractor, min_tracked=klt_min_tracked)
+
+    #    keyframe mode: track against the last keyframe, skip low-parallax frames,
+    #    triangulate / run local BA (background thread) / detect loops per keyframe
+    kf_tracker = None
+    if keyframes:
+        if tracker is not None:
+            raise ValueError("keyframe mode needs descriptor features (frontend='orb')")
+        from include.map_manager import MapManager
+        from include.local_mapper import LocalMapper
+        from include.keyframe_tracker import KeyframeTracker
+        from include.loop_closer import LoopCloser
+        # a snapshot taken without keyframes has no map: start a fresh one
+        map_mgr = MapManager(data.K) if resumed is None or 'map_kf_ids' not in resumed[1] else \
+            MapManager.from_snapshot(data.K, resumed[1])
+        local_mapper = LocalMapper(data.K, window_size=ba_window, map_manager=map_mgr).start()
+        kf_tracker = KeyframeTracker(data.K, map_mgr, local_mapper, kf_dist=kf_dist,
+                                     loop_closer=LoopCloser(loop_vocab) if loop_vocab else None,
+                                     min_parallax=min_parallax, max_skip=max_skip)
+        if resumed is not None:
+            local_mapper.restore(resumed[2])
+            kf_tracker.restore(resumed[2])
 
     # 3) Visualization
-    vis     = VideoVisualizer(window_name='SLAM Live')
-    gif_buf = []
+    #    frames are rendered incrementally and streamed straight to disk
+    vis    = VideoVisualizer(window_name='SLAM Live', headless=headless, every=vis_every)
+    stream = None
+    if vis_out:
+        fmt = {'duration': 0.05} if vis_out.lower().endswith('.gif') else {'fps': 20}
+        stream = FrameStreamWriter(vis_out, **fmt)
+    #    headless without an output file (e.g. fleet runs): nothing to render
+    live_view = not headless or stream is not None
 
     # 4) SLAM state
     curr_pose  = np.eye(4)
     trajectory = [curr_pose[:3,3].copy()]
     poses      = [curr_pose.copy()]
+    pose_frames = [0]
+    last_motion = None   # (R, t) of the last accepted frame, seeds robust estimation
+    start      = 0
+    if resumed is not None:
+        meta, arrays, state = resumed
+        start = meta['next_frame']
+        poses = [np.vstack((P, [0, 0, 0, 1])) for P in arrays['poses']]
+        pose_frames = arrays['pose_frames'].tolist()
+        trajectory = [T[:3,3].copy() for T in poses]
+        curr_pose = state['curr_pose'].copy()
+        if 'last_R' in state:
+            last_motion = (state['last_R'], state['last_t'])
+        prev_feat = FrameFeatures.from_array(state['prev_kp'], state['prev_des']) \
+            if 'prev_kp' in state else FrameFeatures.empty()
 
-    # 5) First frame init
-    prev_gray    = data.get_frame(0)
-    prev_kp, prev_des = extractor.extract(prev_gray)
-    frame0_vis = vis.update(prev_gray, trajectory)
-    if frame0_vis is not None and frame0_vis.size:
-        gif_buf.append(cv2.cvtColor(frame0_vis, cv2.COLOR_BGR2RGB))
-
-    # 6) Main loop (no keyframe/map building)
-    for idx in range(1, N):
-        print(f"Frame {idx}/{N}")
-        gray = data.get_frame(idx)
-        kp, des = extractor.extract(gray)
-        if prev_des is None or des is None:
-            prev_kp, prev_des = kp, des
-            continue
+    #    KITTI-style trajectory, one pose per line, streamed as poses are accepted
+    traj_file = open(traj_out, 'w', buffering=1)
+    def write_pose(T):
+        traj_file.write(" ".join(f"{x:.6f}" for x in T[:3,:4].ravel()) + "\n")
+    for T in poses:
+        write_pose(T)
 
-        matches = matcher.match(prev_des, des)
-        if len(matches) < 8:
-            prev_kp, prev_des = kp, des
-            continue
+    #    optional VO/IMU fusion: the IMU block of each camera interval is
+    #    preintegrated at once, VO supplies rotation and direction, the IMU metric scale
+    fusion = None
+    if imu:
+        from include.imu_filter import IMUKalmanFilter
+        fusion = IMUKalmanFilter(dt=0.01, vo_noise=0.04, rot_noise=1e-4, gravity=data.imu.gravity)
+        fusion.set_state(vel=data.imu.initial_velocity)
+        last_imu_idx = 0
+        if resumed is not None:
+            fusion.x[:], fusion.P = state['imu_x'], state['imu_P'].copy()
+            last_imu_idx = int(meta['scalars']['last_imu_idx'])
 
-        pts1 = np.float32([prev_kp[m.queryIdx].pt for m in matches])
-        pts2 = np.float32([kp[m.trainIdx].pt      for m in matches])
+    #    live drift monitor: ATE/RPE against reference poses (ground truth or
+    #    GNSS), updated per frame from running alignment statistics
+    drift = None
+    if monitor:
+        from include.drift_monitor import DriftMonitor
+        if reference_poses is None:
+            reference_poses = getattr(data, 'poses', None)
+        if reference_poses is None:
+            from utils.evaluate_accuracy import load_gt
+            reference_poses = load_gt(base_path, date, data.drive)
+        def alert(idx, metric, value, thresh):
+            print(f"Drift alert at frame {idx}: {metric} {value:.3f} > {thresh}")
+        drift = DriftMonitor(with_scale=not imu, ate_thresh=drift_ate, err_thresh=drift_err,
+                             rpe_thresh=drift_rpe, on_alert=alert)
+        if resumed is not None:
+            drift.restore(state)
+        else:
+            drift.add_reference(0, reference_poses[0])
+            drift.add_estimate(0, curr_pose)
 
-        E, mask = ess_est.compute(pts1, pts2)
-        if E is None:
-            prev_kp, prev_des = kp, des
+    #    real-time mode: hold frame_budget_ms (default: the 10 Hz camera period)
+    #    by trading features/resolution/matches/RANSAC iterations, drop late frames
+    budget = None
+    if realtime:
+        from include.budget_controller import BudgetController
+        budget = BudgetController(frame_budget_ms or 100.0, extractor, matcher, ess_est)
+
+    #    per-stage timers/counters; NullProfiler makes them no-ops
+    prof = StageProfiler(trace=bool(trace_out), budget_ms=frame_budget_ms) \
+        if (profile or trace_out) else NullProfiler()
+
+    #    match -> essential matrix -> pose -> motion filter, as in SlamSession
+    vo = VOStep(matcher, ess_est, pose_est, optimizer, profiler=prof)
+    vo.last_motion = last_motion
+
+    # 5) Frame source: decode + extract, either inline or on worker threads.
+    #    A feature store replays stored features (or records them on first use).
+    source = extractor
+    if tracker is not None:
+        source = None
+    elif store is not None:
+        source = store
+        print(f"Feature store {store.path} ({'recording' if store.recording else 'reading'})")
+    #    Low-parallax (keyframe mode) and late (real-time mode) frames are skipped
+    #    before they are even decoded by the sequential source; while a feature
+    #    store is being recorded, skipped frames are still extracted into it (the
+    #    pipeline extracts every frame anyway).
+    def skip_frame(idx):
+        if kf_tracker is not None and kf_tracker.should_skip(idx):
+            prof.count('skipped', 1)
+        elif budget is not None and not budget.admit(idx):
+            prof.count('dropped', 1)
+        else:
+            return False
+        if store is not None and store.recording and not pipelined:
+            with prof.stage('extract'):
+                store.extract_frame(idx, data.get_frame(idx))
+        return True
+
+    if pipelined:
+        frames = iter(FramePipeline(data, source, start=start, depth=pipeline_depth,
+                                    profiler=prof))
+    else:
+        frames = sequential_frames(data, source, start=start, profiler=prof, skip=skip_frame)
+
+    #    everything needed to continue from frame next_frame; the map/window/keyframe
+    #    state is taken under the local mapper lock so BA cannot interleave
+    def take_snapshot(next_frame, block=False):
+        arrays = {'poses': np.array([T[:3] for T in poses]).reshape(-1, 3, 4),
+                  'pose_frames': np.array(pose_frames, np.int64)}
+        state, scalars = {'curr_pose': curr_pose.copy()}, {}
+        if vo.last_motion is not None:
+            state['last_R'], state['last_t'] = vo.last_motion
+        if prev_feat is not None and prev_feat.des is not None:
+            state['prev_kp'], state['prev_des'] = prev_feat.to_array(), prev_feat.des
+        if fusion is not None:
+            state['imu_x'], state['imu_P'] = fusion.x.copy(), fusion.P.copy()
+            scalars['last_imu_idx'] = last_imu_idx
+        if tracker is not None:
+            state.update(tracker.snapshot())
+            scalars['klt_frame'] = klt_frame
+        if kf_tracker is not None:
+            with local_mapper.lock:
+                arrays.update(map_mgr.snapshot())
+                state.update(local_mapper.snapshot())
+                state.update(kf_tracker.snapshot())
+        if drift is not None:
+            state.update(drift.snapshot())
+        return snap.save(next_frame, arrays, state, scalars, block=block)
+
+    if resumed is None:
+        # first frame init
+        idx0, prev_gray, prev_feat = next(frames)
+        if tracker is not None:
+            tracker.reset(prev_gray)
+            klt_frame = idx0
+        if kf_tracker is not None:
+            kf_tracker.reset(idx0, prev_feat, np.eye(4))
+        if live_view:
+            frame0_vis = vis.update(prev_gray, trajectory)
+            if stream is not None:
+                stream.append(frame0_vis)
+    else:
+        # state of a front end the snapshot was not taken with starts at the
+        # last processed frame
+        if tracker is not None and 'klt_frame' in meta['scalars']:
+            klt_frame = int(meta['scalars']['klt_frame'])
+            tracker.restore(state, data.get_frame(klt_frame))
+        elif tracker is not None:
+            klt_frame = start - 1
+            tracker.reset(data.get_frame(klt_frame))
+        if kf_tracker is not None and kf_tracker.kf_id is None:
+            if prev_feat.des is None:
+                prev_feat = extractor.extract_features(data.get_frame(start - 1))
+            kf_tracker.reset(start - 1, prev_feat, np.linalg.inv(curr_pose))
+
+    # 6) Main loop
+    for idx, gray, feat in frames:
+        prof.tick('frame')
+        if snap is not None and snap.due(idx):
+            with prof.stage('snapshot'):
+                take_snapshot(idx)
+        if log_every and idx % log_every == 0:
+            print(f"Frame {idx}/{N}")
+        if gray is None or (pipelined and skip_frame(idx)):
             continue
+        if budget is not None:
+            prof.count('quality_level', budget.level)
+        # VO reference: the last keyframe, otherwise the previous frame
+        if kf_tracker is not None:
+            ref_feat, T_ref = kf_tracker.kf_feat, np.linalg.inv(kf_tracker.kf_pose)
+        else:
+            ref_feat = prev_feat
+            if fusion is not None:
+                T_ref = fusion.pose()
+        if fusion is not None:
+            with prof.stage('imu'):
+                dt, accel, gyro = data.imu.imu_between(last_imu_idx, idx)
+                fusion.propagate(accel, gyro, dt)
+            last_imu_idx = idx
+        if tracker is not None:
+            with prof.stage('track'):
+                pts1, pts2 = tracker.track(gray)
+            klt_frame = idx
+            prof.count('tracked', len(pts1))
+            if len(pts1) < 8:
+                continue
+        else:
+            if ref_feat.des is None or feat.des is None:
+                prev_feat = feat
+                continue
+
+            matches, pts1, pts2 = vo.match(ref_feat, feat)
+            if pts1 is None:
+                if kf_tracker is not None:   # lost the keyframe: re-anchor here
+                    kf_tracker.reset(idx, feat, np.linalg.inv(curr_pose), insert=False)
+                prev_feat = feat
+                continue
 
-        R, t, mask = pose_est.recover(E, pts1, pts2)
-        if not optimizer.filter(R, t):
-            prev_kp, prev_des = kp, des
+            if kf_tracker is not None and \
+                    kf_tracker.parallax(idx, pts1, pts2) < kf_tracker.min_parallax:
+                prof.count('low_parallax', 1)
+                continue
+
+        R, t, mask, _ = vo.motion(pts1, pts2, ref_feat, feat,
+                                  matches if tracker is None else None)
+        if R is None:
+            if kf_tracker is not None:
+                kf_tracker.reset(idx, feat, np.linalg.inv(curr_pose), insert=False)
+            prev_feat = feat
             continue
 
         # update pose
-        T = np.eye(4)
-        T[:3,:3], T[:3,3] = R, t.flatten()
-        curr_pose = curr_pose @ T
+        T = motion_matrix(R, t)
+        if fusion is None and kf_tracker is None:
+            curr_pose = curr_pose @ T
+        else:
+            # VO gives x2 = R x1 + t up to scale: the metric step comes from the
+            # IMU, otherwise from the landmarks the keyframe already observes
+            if kf_tracker is not None:
+                inl = np.flatnonzero(mask.ravel())
+                q, tq = match_indices(matches)
+                q, tq = q[inl], tq[inl]
+            if fusion is not None:
+                s = np.linalg.norm(fusion.x[0:3] - T_ref[:3,3])
+            else:
+                with prof.stage('scale'):
+                    s = kf_tracker.scale(q, pts1[inl], pts2[inl], R, t)
+                s = 1.0 if s is None else s
+            T_rel = np.eye(4)
+            T_rel[:3,:3], T_rel[:3,3] = R.T, -R.T @ (s * t.flatten())
+            curr_pose = T_ref @ T_rel
+            if fusion is not None:
+                with prof.stage('imu'):
+                    fusion.update_vo(curr_pose[:3,3], curr_pose[:3,:3])
+                    curr_pose = fusion.pose()
+            if kf_tracker is not None and kf_tracker.need_keyframe(np.linalg.inv(curr_pose), len(inl)):
+                with prof.stage('keyframe'):
+                    kf_tracker.add_keyframe(idx, feat, np.linalg.inv(curr_pose), q, tq)
+                prof.count('keyframes', 1)
         trajectory.append(curr_pose[:3,3].copy())
         poses.append(curr_pose.copy())
+        pose_frames.append(idx)
+        write_pose(curr_pose)
+        if drift is not None and idx < len(reference_poses):
+            with prof.stage('monitor'):
+                drift.add_reference(idx, reference_poses[idx])
+                drift.add_estimate(idx, curr_pose)
 
         # live view
-        vis_frame = vis.update(gray, trajectory)
-        if vis_frame is not None and vis_frame.size:
-            gif_buf.append(cv2.cvtColor(vis_frame, cv2.COLOR_BGR2RGB))
+        if live_view:
+            with prof.stage('visualize'):
+                vis_frame = vis.update(gray, trajectory)
+                if stream is not None:
+                    stream.append(vis_frame)
 
-        prev_kp, prev_des = kp, des
+        prev_feat = feat
+    prof.tick('frame')
+    if budget is not None:
+        budget.close()
+    traj_file.close()
+    if snap is not None:
+        take_snapshot(N, block=True)
+        snap.close()
+        ms = f", {np.mean(snap.write_ms):.1f} ms each" if snap.write_ms else ""
+        print(f"Snapshots: {snap.n_written} written to {snapshot_dir}{ms}, "
+              f"{snap.n_skipped} skipped while busy")
 
     # 7) Finish
     print("Finished processing all frames.")
     vis.close()
-    cv2.destroyAllWindows()
+    data.close()
+    if store is not None:
+        store.close()
+    extractor.close()
+    if tracker is not None:
+        print(f"KLT: {tracker.n_detections} detections over {N} frames")
+    if guided:
+        print(f"Guided matching on {matcher.n_guided} frames, global on {matcher.n_global}")
+    if kf_tracker is not None:
+        local_mapper.stop()
+        print(f"Keyframes: {kf_tracker.n_keyframes} over {N} frames, "
+              f"{map_mgr.next_lm_id} landmarks, {len(local_mapper.stats)} local BA runs")
+        if kf_tracker.loop_closer is not None:
+            print(f"Loop candidates at {len(kf_tracker.loops)} keyframes")
+    if not headless:
+        cv2.destroyAllWindows()
+
+    print(f"Saved estimated trajectory to {traj_out}")
 
     # Static trajectory plot
-    TrajectoryVisualizer.plot(trajectory, save_path='trajectory.png')
-    print("Saved trajectory plot to trajectory.png")
+    from utils.trajectory_visualizer import TrajectoryVisualizer
+    TrajectoryVisualizer.plot(trajectory, save_path=plot_out, show=not headless)
+    print(f"Saved trajectory plot to {plot_out}")
+
+    # Animated GIF / MP4 (already streamed frame by frame)
+    if stream is not None:
+        stream.close()
+        if stream.written:
+            print(f"Saved {stream.written} frames to {vis_out}")
+        else:
+            print(f"No frames to save for {vis_out}")
+
+    if budget is not None:
+        budget.print_summary()
+    if drift is not None:
+        drift.print_summary()
+    if prof.enabled:
+        prof.print_summary()
+        if trace_out:
+            prof.export_chrome_trace(trace_out)
+            print(f"Saved Chrome trace to {trace_out}")
+    return np.array(poses), np.array(pose_frames)
 
-    # Animated GIF
-    if gif_buf:
-        imageio.mimsave('slam_live.gif', gif_buf, duration=0.05)
-        print("Saved animated GIF to slam_live.gif")
-    else:
-        print("No frames to save for slam_live.gif")
 
-    # KITTI‐style trajectory dump
-    with open('est_traj.txt', 'w') as f:
-        for T in poses:
-            for row in T[:3,:4]:
-                f.write(" ".join(f"{x:.6f}" for x in row) + " ")
-            f.write("")
-    print("Saved estimated trajectory to est_traj.txt")
+def parse_tiles(s):
+    # 'RxC' -> (rows, cols)
+    try:
+        rows, cols = (int(v) for v in s.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected ROWSxCOLS, got {s!r}")
+    return rows, cols
 
 
 if __name__ == '__main__':
@@ -124,12 +463,117 @@ if __name__ == '__main__':
     p.add_argument('--base_path', required=True, help='KITTI raw data folder')
     p.add_argument('--date',      default='2011_09_26')
     p.add_argument('--drive',     default='2011_09_26_drive_0002_sync')
-    p.add_argument('--kf_dist',   type=float, default=0.5)
-    p.add_argument('--ba_window', type=int,   default=5)
+    p.add_argument('--kf_dist',   type=float, default=0.5,
+                   help='keyframe translation threshold (with --keyframes)')
+    p.add_argument('--ba_window', type=int,   default=5,
+                   help='keyframes in the local BA window (with --keyframes)')
+    p.add_argument('--prefetch',  type=int,   default=0,
+                   help='frames to decode ahead on a background pool (0 = off)')
+    p.add_argument('--lru_size',  type=int,   default=0,
+                   help='decoded frames kept in memory (0 = off)')
+    p.add_argument('--frame_cache', default=None,
+                   help='directory for cached decoded .npy frames')
+    p.add_argument('--pipelined', action='store_true',
+                   help='overlap decode/extraction with matching and pose recovery')
+    p.add_argument('--pipeline_depth', type=int, default=1,
+                   help='bounded queue size between pipeline stages')
+    p.add_argument('--feature_store', default=None,
+                   help='directory of stored features, keyed by extractor config')
+    p.add_argument('--matcher', choices=('flann', 'bf', 'hamming'), default='flann',
+                   help='descriptor matcher (hamming = vectorized array matcher)')
+    p.add_argument('--frontend', choices=('orb', 'klt'), default='orb',
+                   help='orb = detect+match every frame, klt = optical-flow tracking')
+    p.add_argument('--klt_min_tracked', type=int, default=400,
+                   help='re-detect features when fewer tracks survive')
+    p.add_argument('--ransac', choices=('ransac', 'prosac'), default='ransac',
+                   help='prosac = quality-ordered, adaptive, motion-seeded estimation')
+    p.add_argument('--headless', action='store_true',
+                   help='never open a window (rendering still feeds --vis_out)')
+    p.add_argument('--vis_every', type=int, default=1,
+                   help='render only every k-th frame')
+    p.add_argument('--out_dir', default='.',
+                   help='directory for trajectory.png, est_traj.txt and --vis_out')
+    p.add_argument('--vis_out', default='slam_live.gif',
+                   help='streamed GIF/MP4 output ("" disables)')
+    p.add_argument('--profile', action='store_true',
+                   help='time every stage and print a latency summary')
+    p.add_argument('--trace_out', default=None,
+                   help='write a Chrome-trace JSON timeline (implies --profile)')
+    p.add_argument('--log_every', type=int, default=1,
+                   help='print progress every k frames (0 = never)')
+    p.add_argument('--frame_budget_ms', type=float, default=None,
+                   help='report frames slower than this budget')
+    p.add_argument('--imu', action='store_true',
+                   help='fuse OXTS accelerometer/gyro data with the visual odometry')
+    p.add_argument('--keyframes', action='store_true',
+                   help='track against keyframes, map and bundle-adjust only on keyframes')
+    p.add_argument('--min_parallax', type=float, default=1.0,
+                   help='median pixel flow below which frames are skipped')
+    p.add_argument('--max_skip', type=int, default=5,
+                   help='frames skipped in a row before parallax is measured again')
+    p.add_argument('--realtime', action='store_true',
+                   help='adapt features/resolution/matching/RANSAC to hold --frame_budget_ms '
+                        '(default 100) and drop frames that would arrive late')
+    p.add_argument('--loop_vocab', default=None,
+                   help='vocabulary .npz for loop detection on keyframes')
+    p.add_argument('--snapshot_dir', default=None,
+                   help='periodically save the session state (poses, map, filter) here')
+    p.add_argument('--snapshot_every', type=int, default=100,
+                   help='frames between snapshots')
+    p.add_argument('--resume', action='store_true',
+                   help='continue from the snapshot in --snapshot_dir')
+    p.add_argument('--tiles', type=parse_tiles, default=None,
+                   help='extract ORB features on a ROWSxCOLS grid in parallel, e.g. 2x4')
+    p.add_argument('--guided', action='store_true',
+                   help='match within motion-model predicted windows (falls back to --matcher)')
+    p.add_argument('--monitor', action='store_true',
+                   help='track ATE/RPE live against ground truth (OXTS) poses')
+    p.add_argument('--drift_ate', type=float, default=None,
+                   help='alert when the running ATE exceeds this (with --monitor)')
+    p.add_argument('--drift_err', type=float, default=None,
+                   help='alert when the current aligned position error exceeds this')
+    p.add_argument('--drift_rpe', type=float, default=None,
+                   help='alert when the running RPE exceeds this')
+    p.add_argument('--extract_workers', type=int, default=None,
+                   help='threads for tiled extraction (default: one per cell, up to all cores)')
     args = p.parse_args()
 
     run_slam(args.base_path,
              args.date,
              args.drive,
              args.kf_dist,
-             args.ba_window)
+             args.ba_window,
+             prefetch=args.prefetch,
+             lru_size=args.lru_size,
+             frame_cache=args.frame_cache,
+             pipelined=args.pipelined,
+             pipeline_depth=args.pipeline_depth,
+             feature_store=args.feature_store,
+             matcher_type=args.matcher,
+             frontend=args.frontend,
+             klt_min_tracked=args.klt_min_tracked,
+             ransac=args.ransac,
+             headless=args.headless,
+             vis_every=args.vis_every,
+             vis_out=args.vis_out,
+             out_dir=args.out_dir,
+             profile=args.profile,
+             trace_out=args.trace_out,
+             log_every=args.log_every,
+             frame_budget_ms=args.frame_budget_ms,
+             imu=args.imu,
+             keyframes=args.keyframes,
+             min_parallax=args.min_parallax,
+             max_skip=args.max_skip,
+             loop_vocab=args.loop_vocab,
+             realtime=args.realtime,
+             snapshot_dir=args.snapshot_dir,
+             snapshot_every=args.snapshot_every,
+             resume=args.resume,
+             tiles=args.tiles,
+             extract_workers=args.extract_workers,
+             monitor=args.monitor,
+             drift_ate=args.drift_ate,
+             drift_err=args.drift_err,
+             drift_rpe=args.drift_rpe,
+             guided=args.guided)
@@ -0,0 +1,55 @@
+import argparse
+import time
+
+import numpy as np
+
+from data_module.frame_data import FrameData
+from include.feature_extractor import FeatureExtractor
+from include.vocabulary import Vocabulary
+
+# Offline vocabulary training for LoopCloser: ORB descriptors from every `step`-th
+# cam0 frame of one or more KITTI drives, k^levels words, saved as a compressed .npz.
+#
+#   PYTHONPATH=. python utils/build_vocabulary.py --base_path data --date 2011_09_26 \
+#       --drives 2011_09_26_drive_0001_sync 2011_09_26_drive_0002_sync --out orb_vocab.npz
+
+def collect_descriptors(base_path, date, drives, step=5, nfeatures=1000):
+    extractor = FeatureExtractor(nfeatures=nfeatures)
+    sets = []
+    for drive in drives:
+        data = FrameData(base_path, date, drive)
+        try:
+            for i in range(0, len(data), step):
+                des = extractor.extract_features(data.get_frame(i)).des
+                if des is not None and len(des):
+                    sets.append(des)
+        finally:
+            data.close()
+    return sets
+
+def main():
+    p=argparse.ArgumentParser()
+    p.add_argument('--base_path',required=True)
+    p.add_argument('--date',required=True)
+    p.add_argument('--drives',nargs='+',required=True)
+    p.add_argument('--step',type=int,default=5,help='use every n-th frame')
+    p.add_argument('--nfeatures',type=int,default=1000)
+    p.add_argument('--k',type=int,default=10,help='branching factor')
+    p.add_argument('--levels',type=int,default=5,help='tree depth (up to k^levels words)')
+    p.add_argument('--iters',type=int,default=10,help='k-majority iterations per node')
+    p.add_argument('--seed',type=int,default=0)
+    p.add_argument('--out',default='orb_vocab.npz')
+    a=p.parse_args()
+
+    t0=time.perf_counter()
+    sets=collect_descriptors(a.base_path,a.date,a.drives,a.step,a.nfeatures)
+    n=sum(len(s) for s in sets)
+    print(f"{n} descriptors from {len(sets)} frames ({time.perf_counter()-t0:.1f}s)")
+    t0=time.perf_counter()
+    vocab=Vocabulary(a.k,a.levels).train(sets,iters=a.iters,seed=a.seed)
+    print(f"{vocab.n_words} words, {len(vocab.centers)} nodes ({time.perf_counter()-t0:.1f}s)")
+    vocab.save(a.out)
+    print("saved",a.out)
+
+if __name__=='__main__':
+    main()
@@ -1,55 +1,137 @@
 #!/usr/bin/env python3
 import argparse, os, sys, numpy as np
-from pykitti import raw
 
-def load_gt(p, d, r):
-    ds = raw(p, d, r)
-    Rs, ts = [], []
-    for o in ds.oxts:
-        T = o.T_w_imu
-        Rs.append(T[:3,:3]); ts.append(T[:3,3])
-    if not ts: sys.exit("no ground truth")
-    return Rs, ts
+# All poses are handled as stacked (N,4,4) arrays. Ground truth is parsed from the
+# OXTS text files once per drive and cached as an .npz.
+
+ER = 6378137.  # earth radius (approx.) in meters
+SEG_LENGTHS = (100, 200, 300, 400, 500, 600, 700, 800)
+
+def _rot_xyz(rx, ry, rz):
+    # batched Rz @ Ry @ Rx, as in the OXTS convention
+    cx, sx, cy, sy, cz, sz = np.cos(rx), np.sin(rx), np.cos(ry), np.sin(ry), np.cos(rz), np.sin(rz)
+    R = np.empty(rx.shape + (3, 3))
+    R[..., 0, 0] = cz*cy; R[..., 0, 1] = cz*sy*sx - sz*cx; R[..., 0, 2] = cz*sy*cx + sz*sx
+    R[..., 1, 0] = sz*cy; R[..., 1, 1] = sz*sy*sx + cz*cx; R[..., 1, 2] = sz*sy*cx - cz*sx
+    R[..., 2, 0] = -sy;   R[..., 2, 1] = cy*sx;            R[..., 2, 2] = cy*cx
+    return R
+
+def inv_se3(T):
+    Ti = np.zeros_like(T)
+    Rt = np.swapaxes(T[..., :3, :3], -1, -2)
+    Ti[..., :3, :3] = Rt
+    Ti[..., :3, 3] = -(Rt @ T[..., :3, 3:])[..., 0]
+    Ti[..., 3, 3] = 1.
+    return Ti
+
+def oxts_to_poses(packets):
+    # packets: (N, >=6) lat, lon, alt, roll, pitch, yaw -> T_w_imu relative to frame 0
+    lat, lon, alt, roll, pitch, yaw = packets[:, :6].T
+    scale = np.cos(lat[0]*np.pi/180.)
+    T = np.zeros((len(packets), 4, 4))
+    T[:, 0, 3] = scale*lon*np.pi*ER/180.
+    T[:, 1, 3] = scale*ER*np.log(np.tan((90.+lat)*np.pi/360.))
+    T[:, 2, 3] = alt
+    T[:, :3, :3] = _rot_xyz(roll, pitch, yaw)
+    T[:, 3, 3] = 1.
+    return inv_se3(T[0]) @ T
+
+def load_gt(p, d, r, cache_dir='.gt_cache', cam_frame=True):
+    from data_module.oxts import packet_files, read_packets
+    oxts = packet_files(os.path.join(p, d, r))
+    if not oxts: sys.exit("no ground truth")
+    cache = os.path.join(cache_dir, d, r + '.npz') if cache_dir else None
+    if cache and os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(oxts[-1]):
+        z = np.load(cache)
+        if len(z['T_w_imu']) == len(oxts):
+            T_w_imu, T_ci = z['T_w_imu'], z['T_cam0_imu']
+            return T_w_imu @ inv_se3(T_ci) if cam_frame else T_w_imu
+    T_w_imu = oxts_to_poses(read_packets(oxts))
+    try:
+        from data_module.kitti_calib import load_T_cam0_imu
+        T_ci = load_T_cam0_imu(p, d)
+    except (ImportError, OSError, KeyError):
+        T_ci = np.eye(4)
+    if cache:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        np.savez(cache, T_w_imu=T_w_imu, T_cam0_imu=T_ci)
+    return T_w_imu @ inv_se3(T_ci) if cam_frame else T_w_imu
 
 def load_est(f):
     if not os.path.isfile(f): sys.exit("no est file")
     v = np.fromfile(f, sep=' ')
     n = len(v)//12
     if n==0: sys.exit("no data in est file")
-    b = v[:n*12].reshape(n,12)
-    Rs = [x[:9].reshape(3,3) for x in b]
-    ts = [np.array([x[3],x[7],x[11]]) for x in b]
-    return Rs, ts
+    T = np.zeros((n,4,4)); T[:,3,3] = 1.
+    T[:,:3,:4] = v[:n*12].reshape(n,3,4)
+    return T
 
-def align(A, B):
+def align(A, B, with_scale=False):
+    # Umeyama/Horn: B ~ s*R@A + t
     cA, cB = A.mean(0), B.mean(0)
     H = (A-cA).T@(B-cB)
-    U,_,Vt = np.linalg.svd(H)
-    R = Vt.T@U.T
-    if np.linalg.det(R)<0: Vt[2]*=-1; R=Vt.T@U.T
-    return R, cB-R@cA
+    U,S,Vt = np.linalg.svd(H)
+    D = np.eye(3)
+    if np.linalg.det(Vt.T@U.T)<0: D[2,2] = -1
+    R = Vt.T@D@U.T
+    s = (S*np.diag(D)).sum()/((A-cA)**2).sum() if with_scale else 1.
+    return (R, cB-s*R@cA, s) if with_scale else (R, cB-R@cA)
 
-def ate(Rg, tg, Re, te):
-    A = np.stack(te)
-    B = np.stack(tg)
-    R,t = align(A,B)
-    Ae = (R@A.T).T + t
-    e = np.linalg.norm(Ae-B,axis=1)
+def ate(Tg, Te, with_scale=False):
+    A, B = Te[:,:3,3], Tg[:,:3,3]
+    R,t,s = align(A,B,True) if with_scale else align(A,B)+(1.,)
+    e = np.linalg.norm(s*A@R.T + t - B, axis=1)
     return np.sqrt((e**2).mean())
 
-def rpe(Rg, tg, Re, te, d):
-    T = lambda x: (align(np.vstack(te),np.vstack(tg)) and None)
-    A = np.stack(te)
-    B = np.stack(tg)
-    R,t = align(A,B)
-    P = [R@x+t for x in te]
-    errs=[]
-    for i in range(len(tg)-d):
-        dtg = np.linalg.norm((np.linalg.inv(Rg[i])@Rg[i+d])[:3,3])
-        dte = abs(np.linalg.norm(P[i+d]-P[i]) - dtg)
-        errs.append(dte)
-    e=np.array(errs)
-    return np.sqrt((e**2).mean())
+def rpe(Tg, Te, deltas=(1,), with_scale=False):
+    # translational drift: |‖P[i+d]-P[i]‖ - ‖G[i+d]-G[i]‖| for every i and delta
+    A, B = Te[:,:3,3], Tg[:,:3,3]
+    R,t,s = align(A,B,True) if with_scale else align(A,B)+(1.,)
+    P = s*A@R.T + t
+    out = {}
+    for d in deltas:
+        if d < 1 or d >= len(B): continue
+        e = np.linalg.norm(P[d:]-P[:-d],axis=1) - np.linalg.norm(B[d:]-B[:-d],axis=1)
+        out[d] = np.sqrt((e**2).mean())
+    return out
+
+def segment_errors(Tg, Te, lengths=SEG_LENGTHS, step=10, scale=1.):
+    # KITTI odometry metric: relative pose error over path segments of fixed length,
+    # translational in % and rotational in deg/m, all segments of a length at once
+    Te = Te.copy(); Te[:,:3,3] *= scale
+    dist = np.concatenate(([0.], np.cumsum(np.linalg.norm(np.diff(Tg[:,:3,3],axis=0),axis=1))))
+    first = np.arange(0, len(Tg), step)
+    out = {}
+    for L in lengths:
+        last = np.searchsorted(dist, dist[first]+L)
+        ok = last < len(Tg)
+        if not ok.any(): continue
+        f, l = first[ok], last[ok]
+        dG = inv_se3(Tg[f]) @ Tg[l]
+        dE = inv_se3(Te[f]) @ Te[l]
+        err = inv_se3(dG) @ dE
+        t_err = np.linalg.norm(err[:,:3,3],axis=1)/L
+        r_err = np.arccos(np.clip((np.trace(err[:,:3,:3],axis1=1,axis2=2)-1)/2,-1.,1.))/L
+        out[L] = (100.*t_err.mean(), np.degrees(r_err.mean()), int(ok.sum()))
+    return out
+
+def evaluate(base_path, date, drive, est_file, deltas=(1,), with_scale=False, cache_dir='.gt_cache',
+             frames=None):
+    # frames: frame index of every estimated pose (run_slam skips frames);
+    # without it poses are paired with ground truth in order
+    Tg = load_gt(base_path, date, drive, cache_dir)
+    Te = load_est(est_file)
+    if frames is not None:
+        frames = np.asarray(frames, dtype=np.int64)[:len(Te)]
+        Tg, Te = Tg[frames], Te[:len(frames)]
+    n = min(len(Tg), len(Te))
+    Tg, Te = Tg[:n], Te[:n]
+    s = align(Te[:,:3,3], Tg[:,:3,3], True)[2] if with_scale else 1.
+    return {
+        'ate': ate(Tg, Te, with_scale),
+        'rpe': rpe(Tg, Te, deltas, with_scale),
+        'segments': segment_errors(Tg, Te, scale=s),
+    }
 
 def main():
     p=argparse.ArgumentParser()
@@ -57,13 +139,22 @@ def main():
     p.add_argument('--date',required=True)
     p.add_argument('--drive',required=True)
     p.add_argument('--est_file',required=True)
-    p.add_argument('--delta',type=int,default=1)
+    p.add_argument('--delta',type=int,nargs='+',default=[1])
+    p.add_argument('--sim3',action='store_true',help='also estimate scale (monocular runs)')
+    p.add_argument('--gt_cache',default='.gt_cache',help='directory for cached ground truth ("" disables)')
     a=p.parse_args()
-    Rg,tg=load_gt(a.base_path,a.date,a.drive)
-    Re,te=load_est(a.est_file)
-    n=min(len(tg),len(te))
-    print("ATE RMSE:",ate(Rg[:n],tg[:n],Re[:n],te[:n]))
-    print("RPE RMSE:",rpe(Rg[:n],tg[:n],Re[:n],te[:n],a.delta))
+    if min(a.delta) < 1:
+        p.error('--delta values must be >= 1')
+    r=evaluate(a.base_path,a.date,a.drive,a.est_file,a.delta,a.sim3,a.gt_cache)
+    print("ATE RMSE:",r['ate'])
+    for d,e in r['rpe'].items():
+        print(f"RPE RMSE (delta={d}):",e)
+    if r['segments']:
+        print(f"{'length':>8} {'t_err[%]':>10} {'r_err[deg/m]':>13} {'n':>6}")
+        for L,(te,re,k) in r['segments'].items():
+            print(f"{L:>8} {te:>10.4f} {re:>13.6f} {k:>6}")
+        v=np.array([x[:2] for x in r['segments'].values()])
+        print(f"{'mean':>8} {v[:,0].mean():>10.4f} {v[:,1].mean():>13.6f}")
 
 if __name__=='__main__':
     main()
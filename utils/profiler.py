@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+from array import array
+from collections import defaultdict
+
+import numpy as np
+
+# Hot-path instrumentation for run_slam. StageProfiler records one duration sample
+# per stage call (plus a Chrome-trace event when trace=True) and named counters;
+# aggregation into percentiles/histograms only happens at the end.
+# NullProfiler has the same interface and does nothing, so instrumented code
+# costs one method call and a shared no-op context manager when profiling is off.
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullProfiler:
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_SPAN
+
+    def count(self, name, value=1):
+        pass
+
+    def tick(self, name):
+        pass
+
+    def summary(self):
+        return {}
+
+    def print_summary(self):
+        pass
+
+    def export_chrome_trace(self, path):
+        pass
+
+
+class _Span:
+    __slots__ = ('prof', 'name', 't0')
+
+    def __init__(self, prof, name):
+        self.prof = prof
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter_ns()
+        self.prof._record(self.name, self.t0, t1)
+        return False
+
+
+class StageProfiler:
+    enabled = True
+
+    # log2 buckets in microseconds: <16us, 16-32us, ..., >=~0.5s
+    HIST_EDGES_US = 2.0 ** np.arange(4, 20)
+
+    def __init__(self, trace=True, budget_ms=None):
+        self.trace = trace
+        self.budget_ms = budget_ms
+        self.samples = defaultdict(lambda: array('d'))
+        self.counters = defaultdict(lambda: array('d'))
+        self.events = []
+        self._ticks = {}
+        self._origin = time.perf_counter_ns()
+
+    def stage(self, name):
+        return _Span(self, name)
+
+    def count(self, name, value=1):
+        self.counters[name].append(value)
+
+    def tick(self, name):
+        # records the interval since the previous tick of the same name,
+        # e.g. one full loop iteration per frame
+        now = time.perf_counter_ns()
+        last = self._ticks.get(name)
+        self._ticks[name] = now
+        if last is not None:
+            self._record(name, last, now)
+
+    def _record(self, name, t0, t1):
+        self.samples[name].append((t1 - t0) * 1e-6)
+        if self.trace:
+            self.events.append((name, t0, t1, threading.get_ident()))
+
+    def summary(self):
+        out = {}
+        for name, s in self.samples.items():
+            ms = np.frombuffer(s, dtype=np.float64)
+            p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+            hist, _ = np.histogram(ms * 1e3, bins=np.concatenate(([0.], self.HIST_EDGES_US, [np.inf])))
+            row = {'n': len(ms), 'total_ms': float(ms.sum()), 'mean_ms': float(ms.mean()),
+                   'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+                   'max_ms': float(ms.max()), 'hist_log2_us': hist.tolist()}
+            if self.budget_ms is not None and name == 'frame':
+                row['over_budget'] = int((ms > self.budget_ms).sum())
+            out[name] = row
+        for name, c in self.counters.items():
+            v = np.frombuffer(c, dtype=np.float64)
+            out[name] = {'n': len(v), 'sum': float(v.sum()), 'mean': float(v.mean()),
+                         'min': float(v.min()), 'max': float(v.max())}
+        return out
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"{'stage':<16}{'n':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}{'total':>11}")
+        for name, r in s.items():
+            if 'mean_ms' in r:
+                print(f"{name:<16}{r['n']:>7}{r['mean_ms']:>10.3f}{r['p50_ms']:>10.3f}"
+                      f"{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['max_ms']:>10.3f}{r['total_ms']:>11.1f}")
+        for name, r in s.items():
+            if 'sum' in r:
+                print(f"{name:<16}{r['n']:>7}  mean {r['mean']:.1f}  min {r['min']:.0f}  "
+                      f"max {r['max']:.0f}  sum {r['sum']:.0f}")
+        if 'frame' in s and 'over_budget' in s['frame']:
+            print(f"frames over {self.budget_ms:.1f} ms budget: "
+                  f"{s['frame']['over_budget']}/{s['frame']['n']}")
+
+    def export_chrome_trace(self, path):
+        # complete ("X") events, loadable in chrome://tracing or Perfetto
+        tids = {}
+        events = []
+        for name, t0, t1, tid in self.events:
+            events.append({'name': name, 'ph': 'X', 'pid': 0,
+                           'tid': tids.setdefault(tid, len(tids)),
+                           'ts': (t0 - self._origin) / 1e3, 'dur': (t1 - t0) / 1e3})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'summary': self.summary()}}, f)
@@ -1,10 +1,15 @@
-from mpl_toolkits.mplot3d import Axes3D
 import numpy as np
-import matplotlib.pyplot as plt
 
 class TrajectoryVisualizer:
     @staticmethod
-    def plot(trajectory, save_path=None):
+    def plot(trajectory, save_path=None, show=True):
+        # matplotlib is only imported once a plot is actually drawn; without a
+        # window the non-interactive backend avoids initializing a GUI toolkit
+        import matplotlib
+        if not show:
+            matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.mplot3d import Axes3D  # noqa: F401 (registers '3d')
         traj = np.array(trajectory) 
         fig = plt.figure(figsize=(8, 8))
         ax = fig.add_subplot(111, projection='3d')
@@ -33,4 +38,7 @@ class TrajectoryVisualizer:
 
         if save_path:
             fig.savefig(save_path)
-        plt.show()
+        if show:
+            plt.show()
+        else:
+            plt.close(fig)
@@ -2,43 +2,125 @@ import cv2
 import numpy as np
 
 class VideoVisualizer:
-    def __init__(self, window_name='SLAM View'):
+    # Incremental renderer: the trajectory canvas persists between frames and only
+    # the segments added since the last update are drawn. The whole path is only
+    # re-projected when it leaves the current bounds, which grow with slack so
+    # that happens rarely. headless=True never opens a window; every=k renders
+    # only every k-th update (skipped updates return None).
+
+    def __init__(self, window_name='SLAM View', headless=False, every=1, margin=0.25):
         self.window_name = window_name
-        cv2.namedWindow(self.window_name, cv2.WINDOW_NORMAL)
+        self.headless = headless
+        self.every = max(1, every)
+        self.margin = margin
+        self._calls = 0
+        self._xz = np.empty((256, 2), dtype=np.float64)
+        self._n = 0
+        self._n_drawn = 0
+        self._bounds = None
+        self._canvas = None
+        if not headless:
+            cv2.namedWindow(self.window_name, cv2.WINDOW_NORMAL)
 
     def update(self, frame_gray: np.ndarray, trajectory: list):
+        self._append(trajectory)
+        self._calls += 1
+        if (self._calls - 1) % self.every:
+            return None
+
         frame_bgr = cv2.cvtColor(frame_gray, cv2.COLOR_GRAY2BGR)
         h, w = frame_gray.shape
+        if self._canvas is None or self._canvas.shape[0] != h:
+            self._canvas = np.zeros((h, h, 3), dtype=np.uint8)
+            self._n_drawn = 0
 
-        canvas = np.zeros((h, h, 3), dtype=np.uint8)
-        if len(trajectory) >= 2:
-            xs = [p[0] for p in trajectory]
-            zs = [p[2] for p in trajectory]
-            min_x, max_x = min(xs), max(xs)
-            min_z, max_z = min(zs), max(zs)
-            dx = (max_x - min_x)*0.1 or 1.0
-            dz = (max_z - min_z)*0.1 or 1.0
-            min_x, max_x = min_x-dx, max_x+dx
-            min_z, max_z = min_z-dz, max_z+dz
-            sx = (h-20)/(max_x-min_x)
-            sz = (h-20)/(max_z-min_z)
-
-            pts = []
-            for x, _, z in trajectory:
-                px = int((x-min_x)*sx) + 10
-                pz = int((z-min_z)*sz) + 10
-                pz = h - pz
-                pts.append((px, pz))
-
-            for i in range(1, len(pts)):
-                cv2.line(canvas, pts[i-1], pts[i], (0,255,0), 2)
-
-        canvas_resized = cv2.resize(canvas, (w, h))
+        if self._n >= 2 and self._n > self._n_drawn:
+            xz = self._xz[:self._n]
+            if self._bounds is None or not self._inside(xz[self._n_drawn:]):
+                self._set_bounds(xz)
+                self._canvas[:] = 0
+                self._n_drawn = 0
+            self._draw(max(0, self._n_drawn - 1), self._n)
+            self._n_drawn = self._n
+
+        canvas_resized = cv2.resize(self._canvas, (w, h))
         combined = np.hstack((frame_bgr, canvas_resized))
 
-        cv2.imshow(self.window_name, combined)
-        cv2.waitKey(1)
+        if not self.headless:
+            cv2.imshow(self.window_name, combined)
+            cv2.waitKey(1)
         return combined
 
     def close(self):
-        cv2.destroyWindow(self.window_name)
+        if not self.headless:
+            cv2.destroyWindow(self.window_name)
+
+    def _append(self, trajectory):
+        # the caller's trajectory only ever grows; copy just the new points
+        new = trajectory[self._n:]
+        if not len(new):
+            return
+        if self._n + len(new) > len(self._xz):
+            grown = np.empty((max(2 * len(self._xz), self._n + len(new)), 2))
+            grown[:self._n] = self._xz[:self._n]
+            self._xz = grown
+        pts = np.asarray(new, dtype=np.float64).reshape(-1, 3)
+        self._xz[self._n:self._n + len(pts)] = pts[:, [0, 2]]
+        self._n += len(pts)
+
+    def _inside(self, xz):
+        min_x, max_x, min_z, max_z = self._bounds
+        return (xz[:, 0].min() >= min_x and xz[:, 0].max() <= max_x and
+                xz[:, 1].min() >= min_z and xz[:, 1].max() <= max_z)
+
+    def _set_bounds(self, xz):
+        min_x, min_z = xz.min(axis=0)
+        max_x, max_z = xz.max(axis=0)
+        dx = (max_x - min_x)*self.margin or 1.0
+        dz = (max_z - min_z)*self.margin or 1.0
+        self._bounds = (min_x-dx, max_x+dx, min_z-dz, max_z+dz)
+
+    def _draw(self, a, b):
+        h = self._canvas.shape[0]
+        min_x, max_x, min_z, max_z = self._bounds
+        sx = (h-20)/(max_x-min_x)
+        sz = (h-20)/(max_z-min_z)
+        xz = self._xz[a:b]
+        px = ((xz[:, 0]-min_x)*sx).astype(np.int32) + 10
+        pz = h - (((xz[:, 1]-min_z)*sz).astype(np.int32) + 10)
+        pts = np.stack((px, pz), axis=1).reshape(-1, 1, 2)
+        cv2.polylines(self._canvas, [pts], False, (0,255,0), 2)
+
+
+class FrameStreamWriter:
+    # Streams visualization frames to a GIF/MP4 as they are produced, instead of
+    # buffering the whole run in memory. every=k keeps every k-th frame.
+
+    def __init__(self, path, every=1, **writer_kwargs):
+        import imageio
+        self.path = path
+        self.every = max(1, every)
+        self.count = 0
+        self.written = 0
+        try:
+            self._writer = imageio.get_writer(path, mode='I', **writer_kwargs)
+        except ValueError as e:
+            # imageio only bundles the GIF writer; video needs a plugin
+            if path.lower().endswith('.gif'):
+                raise
+            raise RuntimeError(f"cannot write {path}: video output needs the "
+                               "imageio-ffmpeg package (pip install imageio-ffmpeg)") from e
+
+    def append(self, frame_bgr):
+        if frame_bgr is None or not frame_bgr.size:
+            return
+        self.count += 1
+        if (self.count - 1) % self.every:
+            return
+        self._writer.append_data(cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB))
+        self.written += 1
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None